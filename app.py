@@ -1,22 +1,48 @@
 from flask import (
     Flask,
+    Response,
     request,
     jsonify,
     redirect,
-    render_template
+    render_template,
+    send_file
 )
 from werkzeug.utils import secure_filename
 import os
+import json
+import time
+import uuid
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from database import (
     create_job,
+    create_jobs,
+    list_batch_jobs,
     cancel_job,
+    get_job,
     get_download_url,
+    get_download_file,
     upload_file
 )
-from database import supabase
 from worker import run_worker
+from dispatch import get_dispatcher
+from events import get_events
+from cache import spool_and_hash, get_result_cache, get_download_cache
+from gs_pool import stats as gs_stats
+from images import estimate_mb
+from converter import MahaConvert
+from config import (
+    BATCH_MAX_FILES,
+    WORKER_CPU_PROCESSES,
+    UPLOAD_CONCURRENCY,
+    SSE_HEARTBEAT_SECONDS,
+    SSE_MAX_SECONDS,
+    SSE_MAX_STREAMS,
+    DOWNLOAD_MODE,
+    DOWNLOAD_MAX_AGE
+)
+import detect
 
 
 # =========================
@@ -29,6 +55,9 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 ALLOWED_ACTIONS = {"compress", "convert"}
 
+# A job in one of these won't change anymore
+END_STATUSES = ("done", "error", "cancelled")
+
 app = Flask(__name__)
 
 # Start worker in background thread
@@ -52,57 +81,156 @@ def index():
 # =========================
 @app.get("/job/<job_id>")
 def job_status(job_id):
-    job = (
-        supabase.table("jobs")
-        .select("status, progress")
-        .eq("id", job_id)
-        .single()
-        .execute()
-    )
-    return jsonify(job.data)
+    # Cached: the DB is read at most once per STATUS_CACHE_TTL per job
+    _, job = get_events().snapshot(job_id, load_status)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
 
-@app.post("/upload")
-def upload():
-    # --- file validation ---
-    if "file" not in request.files:
-        return jsonify({"error": "No file provided"}), 400
+# Open event streams in this process (each holds a server thread)
+_streams = threading.BoundedSemaphore(SSE_MAX_STREAMS)
 
-    f = request.files["file"]
-    if not f or f.filename == "":
-        return jsonify({"error": "Empty filename"}), 400
+@app.get("/job/<job_id>/events")
+def job_events(job_id):
+    """
+    Server-sent events: one `data: {status, progress}` message per change,
+    for up to SSE_MAX_SECONDS; the browser then reconnects. 503 when
+    SSE_MAX_STREAMS are already open (the client polls instead).
+    """
+    events = get_events()
+    _, job = events.snapshot(job_id, load_status)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not _streams.acquire(blocking=False):
+        return jsonify({"error": "Too many open streams"}), 503
+
+    def stream():
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        wrote_at = time.monotonic()
+        sent = None
+        # Reconnect quickly once this window closes
+        yield "retry: 1000\n\n"
+        while time.monotonic() < deadline:
+            try:
+                version, job = events.snapshot(job_id, load_status)
+            except Exception as e:
+                # Client reconnects (or falls back to polling)
+                print(f"[WARN] Event stream for job {job_id} stopped: {e}")
+                return
+            if job is None:
+                return
+            if job != sent:
+                sent = job
+                wrote_at = time.monotonic()
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in END_STATUSES:
+                return
+
+            # Woken by the worker's next update; the timeout re-reads
+            # jobs running in another process (through the cache)
+            if not events.wait(job_id, version, events.ttl):
+                if time.monotonic() - wrote_at >= SSE_HEARTBEAT_SECONDS:
+                    wrote_at = time.monotonic()
+                    yield ": ping\n\n"
+
+    response = Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+    # Runs even if the client leaves before the first byte
+    response.call_on_close(_streams.release)
+    return response
+
+def load_status(job_id):
+    return get_job(job_id, "status, progress")
 
+def job_options(form):
+    """
+    (options, error) from an /upload or /upload/batch form:
+    action, target (0-90), mode and to_format, as create_job kwargs
+    """
     # --- action validation ---
-    action = request.form.get("action")
+    action = form.get("action")
     if action not in ALLOWED_ACTIONS:
-        return jsonify({"error": "Invalid action"}), 400
+        return None, "Invalid action"
 
     # --- target validation ---
     try:
-        target = int(request.form.get("target", 70))
+        target = int(form.get("target", 70))
     except ValueError:
         target = 70
 
     target = max(0, min(target, 90))
 
+    # --- mode: "quality" (default mapping) or "size" (hit target% smaller) ---
+    mode = form.get("mode", "quality")
+    if mode not in ("quality", "size"):
+        mode = "quality"
+
+    # --- to_format (optional) ---
+    return {
+        "action": action,
+        "target": target,
+        "mode": mode,
+        "to_format": form.get("to_format")
+    }, None
+
+@app.post("/upload")
+def upload():
+    # --- file validation ---
+    if "file" not in request.files:
+        return jsonify({"error": "No file provided"}), 400
+
+    f = request.files["file"]
+    if not f or f.filename == "":
+        return jsonify({"error": "Empty filename"}), 400
+
+    # --- action / target / mode / to_format ---
+    options, error = job_options(request.form)
+    if error:
+        return jsonify({"error": error}), 400
+
     # --- save upload ---
     filename = secure_filename(f.filename)
+    # Own key per upload: two users' "image.jpg" never share an object
+    key = f"{uuid.uuid4().hex[:12]}_{filename}"
+
+    # Spool to disk in chunks, then stream from disk to storage:
+    # request memory stays flat no matter how big the file is
+    spool_path = os.path.join(UPLOAD_DIR, f".spool-{uuid.uuid4().hex}")
 
     # UPLOAD TO SUPABASE
     # UPLOAD & CREATE JOB
     try:
-        # --- to_format (optional) ---
-        to_format = request.form.get("to_format")
+        input_hash = spool_and_hash(f.stream, spool_path)
+        upload_file(spool_path, key)
+
+        # Content type and decoded image size: the worker schedules by them
+        input_kind, input_ext = detect.sniff(spool_path, hint=detect.name_ext(filename))
+        memory_mb = None
+        if input_kind == "image":
+            memory_mb = estimate_mb(spool_path) or None
 
-        upload_file(f, filename)
-        
         job = create_job(
             filename=filename,
-            action=action,
-            target=target,
-            input_path=filename, # Key in bucket
-            to_format=to_format
+            input_path=key, # Key in bucket
+            input_hash=input_hash,
+            memory_mb=memory_mb,
+            input_kind=input_kind,
+            input_ext=input_ext,
+            **options
         )
-        
+
+        # Wake the worker now instead of waiting for its next poll
+        try:
+            get_dispatcher().notify(job)
+        except Exception as e:
+            print(f"[WARN] Dispatch failed for job {job['id']}: {e}")
+
         return jsonify({
             "job_id": job["id"],
             "status": job["status"],
@@ -114,6 +242,195 @@ def upload():
         traceback.print_exc() # Print to server logs
         return jsonify({"error": f"Processing failed: {str(e)}"}), 500
 
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+
+
+def upload_all(spooled):
+    """
+    Upload (spool_path, storage key) pairs to storage, a few at a time
+    """
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as pool:
+        list(pool.map(lambda item: upload_file(*item), spooled))
+
+
+def notify_jobs(jobs):
+    dispatcher = get_dispatcher()
+    for job in jobs:
+        try:
+            dispatcher.notify(job)
+        except Exception as e:
+            print(f"[WARN] Dispatch failed for job {job['id']}: {e}")
+
+
+# =========================
+# API: MULTI-FILE UPLOAD (ONE JOB PER FILE)
+# =========================
+@app.post("/upload/batch")
+def upload_batch():
+    """
+    Same form as /upload with many `files`: concurrent storage uploads,
+    one bulk insert, one batch id to poll at /batch/<id>
+    """
+    files = [f for f in request.files.getlist("files") if f and f.filename]
+    if not files:
+        return jsonify({"error": "No files provided"}), 400
+    if len(files) > BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many files (max {BATCH_MAX_FILES})"}), 400
+
+    options, error = job_options(request.form)
+    if error:
+        return jsonify({"error": error}), 400
+
+    batch_id = uuid.uuid4().hex
+    spooled = []  # (spool_path, storage key)
+
+    try:
+        rows = []
+        for i, f in enumerate(files):
+            filename = secure_filename(f.filename)
+            # Own key per file: same-named files in a batch don't overwrite each other
+            key = f"{batch_id[:12]}_{i:03d}_{filename}"
+            spool_path = os.path.join(UPLOAD_DIR, f".spool-{uuid.uuid4().hex}")
+            spooled.append((spool_path, key))
+
+            input_hash = spool_and_hash(f.stream, spool_path)
+            input_kind, input_ext = detect.sniff(spool_path, hint=detect.name_ext(filename))
+            memory_mb = None
+            if input_kind == "image":
+                memory_mb = estimate_mb(spool_path) or None
+
+            rows.append({
+                **options,
+                "filename": filename,
+                "input_path": key,
+                "input_hash": input_hash,
+                "memory_mb": memory_mb,
+                "input_kind": input_kind,
+                "input_ext": input_ext
+            })
+
+        upload_all(spooled)
+        jobs = create_jobs(rows, batch_id)
+        notify_jobs(jobs)
+
+        return jsonify({
+            "batch_id": batch_id,
+            "jobs": [
+                {"job_id": job["id"], "filename": job["filename"], "status": job["status"]}
+                for job in jobs
+            ]
+        }), 201
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+    finally:
+        for spool_path, _ in spooled:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+
+
+@app.get("/batch/<batch_id>")
+def batch_status(batch_id):
+    """
+    Aggregate progress of a /upload/batch batch, plus each job's status
+    """
+    jobs = list_batch_jobs(batch_id, "id, filename, status, progress")
+    if not jobs:
+        return jsonify({"error": "Batch not found"}), 404
+
+    done = sum(1 for j in jobs if j["status"] == "done")
+    failed = sum(1 for j in jobs if j["status"] in ("error", "cancelled"))
+    # Finished jobs count as 100%, whatever progress they stopped at
+    progress = sum(
+        100 if j["status"] in ("done", "error", "cancelled") else (j["progress"] or 0)
+        for j in jobs
+    ) // len(jobs)
+
+    return jsonify({
+        "batch_id": batch_id,
+        "total": len(jobs),
+        "done": done,
+        "failed": failed,
+        "progress": progress,
+        "status": "done" if done + failed == len(jobs) else "processing",
+        "jobs": jobs
+    })
+
+
+# =========================
+# API: BATCH IMAGES -> PDF / ZIP
+# =========================
+@app.post("/upload/images")
+def upload_images():
+    """
+    Many images, one job: a combined PDF (to_format=pdf, default)
+    or a zip of images converted to to_format
+    """
+    files = [f for f in request.files.getlist("files") if f and f.filename]
+    if not files:
+        return jsonify({"error": "No files provided"}), 400
+    if len(files) > BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many files (max {BATCH_MAX_FILES})"}), 400
+
+    to_format = (request.form.get("to_format") or "pdf").lower()
+    if to_format != "pdf" and to_format not in MahaConvert.IMAGE_FORMATS:
+        return jsonify({"error": "Unsupported image format"}), 400
+
+    batch = uuid.uuid4().hex[:12]
+    spooled = []  # (spool_path, storage key)
+
+    try:
+        # Spool + check everything first, so a bad file uploads nothing
+        memory_mb = 0
+        for i, f in enumerate(files):
+            key = f"{batch}_{i:03d}_{secure_filename(f.filename)}"
+            spool_path = os.path.join(UPLOAD_DIR, f".spool-{uuid.uuid4().hex}")
+            spooled.append((spool_path, key))
+            f.save(spool_path)
+
+            # Raster only: the batch encoder opens every input with Pillow
+            kind, ext = detect.sniff(spool_path, hint=detect.name_ext(f.filename))
+            if kind != "image" or ext == "svg":
+                return jsonify({"error": f"Not a raster image: {f.filename}"}), 400
+            memory_mb = max(memory_mb, estimate_mb(spool_path))
+
+        upload_all(spooled)
+
+        keys = [key for _, key in spooled]
+        job = create_job(
+            filename=f"{len(keys)} images",
+            action="batch",
+            target=0,
+            input_path=keys[0],
+            to_format=to_format,
+            # Encodes run side by side in the CPU pool
+            memory_mb=memory_mb * min(len(keys), WORKER_CPU_PROCESSES) or None,
+            inputs=keys
+        )
+
+        notify_jobs([job])
+
+        return jsonify({
+            "job_id": job["id"],
+            "status": job["status"],
+            "progress": job["progress"]
+        }), 201
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+    finally:
+        for spool_path, _ in spooled:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+
 
 # =========================
 # API: CANCEL JOB
@@ -121,6 +438,11 @@ def upload():
 @app.post("/cancel/<job_id>")
 def cancel(job_id):
     cancel_job(job_id)
+    # Running jobs: the worker kills the subprocess and frees the slot
+    try:
+        get_dispatcher().cancel(job_id)
+    except Exception as e:
+        print(f"[WARN] Cancel dispatch failed for job {job_id}: {e}")
     return jsonify({"status": "cancelled"}), 200
 
 
@@ -128,10 +450,15 @@ def cancel(job_id):
 # API: DOWNLOAD RESULT
 # =========================
 import requests
-from flask import Response
+
+# Headers a ranged / conditional proxy response passes through
+PROXY_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified")
 
 @app.get("/download/<job_id>")
 def download(job_id):
+    if DOWNLOAD_MODE == "local":
+        return download_local(job_id)
+
     try:
         url_data, filename = get_download_url(job_id)
     except Exception:
@@ -140,19 +467,51 @@ def download(job_id):
     if not url_data or "signedURL" not in url_data:
         return jsonify({"error": "File not ready"}), 404
 
-    r = requests.get(url_data["signedURL"], stream=True)
+    if DOWNLOAD_MODE == "redirect":
+        # The signed URL carries download=<name>: storage sets Content-Disposition
+        # and serves Range / ETag itself, nothing flows through this worker
+        return redirect(url_data["signedURL"], code=302)
+
+    headers = {}
+    if request.headers.get("Range"):
+        headers["Range"] = request.headers["Range"]
+    r = requests.get(url_data["signedURL"], headers=headers, stream=True)
 
-    if r.status_code != 200:
+    if r.status_code not in (200, 206):
+        r.close()
         return jsonify({"error": "Failed to fetch file"}), 500
 
     return Response(
-        r.iter_content(chunk_size=8192),
+        r.iter_content(chunk_size=256 * 1024),
+        status=r.status_code,
         headers={
-            "Content-Disposition": f'attachment; filename="{filename}"',
-            "Content-Type": r.headers.get("Content-Type", "application/octet-stream")
+            **{h: r.headers[h] for h in PROXY_HEADERS if h in r.headers},
+            "Content-Disposition": f'attachment; filename="{filename}"'
         }
     )
 
+def download_local(job_id):
+    """
+    Straight from disk: the WSGI server sends it with sendfile(), and
+    Range / If-None-Match / If-Modified-Since are answered here
+    (206 / 304), so resumes and CDN revalidation work
+    """
+    try:
+        path, filename = get_download_file(job_id)
+    except Exception:
+        return jsonify({"error": "Job not found or file not ready"}), 404
+
+    if not os.path.isfile(path):
+        return jsonify({"error": "File not ready"}), 404
+
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=filename,
+        conditional=True,
+        etag=True,
+        max_age=DOWNLOAD_MAX_AGE
+    )
 
 
 # =========================
@@ -160,7 +519,12 @@ def download(job_id):
 # =========================
 @app.get("/health")
 def health():
-    return jsonify({"status": "ok"}), 200
+    return jsonify({
+        "status": "ok",
+        "result_cache": get_result_cache().stats(),
+        "download_cache": get_download_cache().stats(),
+        "pdf_compress": gs_stats()
+    }), 200
 
 
 # ========================= 
@@ -0,0 +1,283 @@
+import os
+import hashlib
+import subprocess
+import time
+import threading
+from collections import OrderedDict
+from local_db import utc_iso
+from config import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_MB,
+    RESULT_CACHE_SYNC_SECONDS,
+    DOWNLOAD_CACHE_SECONDS,
+    DOWNLOAD_CACHE_MAX_ENTRIES
+)
+
+# Bump when conversion code changes output for the same input
+CACHE_VERSION = "1"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Result cache entries read per eviction query
+EVICT_PAGE_SIZE = 200
+
+
+# ==================================================
+# HASHING
+# ==================================================
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def spool_and_hash(fileobj, path):
+    """
+    Copy an upload stream to disk in chunks and return its sha256,
+    in the same single pass
+    """
+    h = hashlib.sha256()
+    with open(path, "wb") as out:
+        for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+            out.write(chunk)
+    return h.hexdigest()
+
+
+_tool_version = None
+
+
+def tool_version():
+    """
+    Short fingerprint of the encoders in use (ffmpeg, gs, Pillow),
+    so upgrading a tool doesn't serve outputs made by the old one
+    """
+    global _tool_version
+    if _tool_version is None:
+        parts = [CACHE_VERSION]
+        for cmd in (["ffmpeg", "-version"], ["gs", "--version"]):
+            try:
+                out = subprocess.run(cmd, capture_output=True, text=True, timeout=10).stdout
+                parts.append(out.splitlines()[0] if out else "")
+            except (OSError, subprocess.SubprocessError):
+                parts.append("")
+        try:
+            import PIL
+            parts.append(PIL.__version__)
+        except ImportError:
+            parts.append("")
+        _tool_version = hashlib.sha256("|".join(parts).encode()).hexdigest()[:12]
+    return _tool_version
+
+
+def cache_key(input_hash, action, target, to_format, target_size=False):
+    raw = "|".join([
+        input_hash,
+        action,
+        str(target),
+        (to_format or "").lower(),
+        "size" if target_size else "quality",
+        tool_version()
+    ])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# ==================================================
+# CACHE
+# ==================================================
+class ResultCache:
+    """
+    Maps cache_key -> an output object already in storage.
+    Index lives in the `result_cache` table (shared by all workers),
+    evicted least-recently-used once total size passes max_bytes.
+
+    The total is kept as a running sum (adds made here), re-read from
+    the table every sync_seconds to count other workers' adds; eviction
+    reads the oldest entries a page at a time, never the whole index.
+    """
+
+    def __init__(self, store, max_bytes, remove_objects, enabled=True,
+                 sync_seconds=RESULT_CACHE_SYNC_SECONDS, page_size=EVICT_PAGE_SIZE):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.remove_objects = remove_objects
+        self.enabled = enabled
+        self.sync_seconds = sync_seconds
+        self.page_size = page_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._total = None
+        self._synced_at = 0
+
+    def lookup(self, key):
+        """
+        Output object path for key, or None
+        """
+        entry = self.store.cache_get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self.store.cache_touch(key, (entry.get("hits") or 0) + 1, utc_iso())
+        return entry["output_path"]
+
+    def object_name(self, key, local_output):
+        ext = os.path.splitext(local_output)[1]
+        return f"cache/{key}{ext}"
+
+    def add(self, key, object_name, size):
+        self.store.cache_put(key, object_name, size, utc_iso())
+        with self._lock:
+            if self._total is None or time.monotonic() - self._synced_at > self.sync_seconds:
+                # Includes the entry just written
+                self._total = self.store.cache_size()
+                self._synced_at = time.monotonic()
+            else:
+                self._total += size
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """
+        Drop least recently used entries until under max_bytes
+        """
+        # One thread evicts at a time, the others' adds are counted in
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            while True:
+                with self._lock:
+                    total = self._total
+                if total <= self.max_bytes:
+                    return
+
+                page = self.store.cache_entries(self.page_size)
+                victims = []
+                for e in page:
+                    if total <= self.max_bytes:
+                        break
+                    victims.append(e)
+                    total -= e["size"] or 0
+                if not victims:
+                    # Index is empty: the running total was off
+                    with self._lock:
+                        self._total = 0
+                    return
+
+                self.store.cache_delete([e["key"] for e in victims])
+                self.remove_objects([e["output_path"] for e in victims])
+                with self._lock:
+                    self._total -= sum(e["size"] or 0 for e in victims)
+        finally:
+            self._evict_lock.release()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+# ==================================================
+# DOWNLOAD LINKS
+# ==================================================
+class DownloadCache:
+    """
+    In-process TTL cache for /download: job row + signed URL per job, so
+    repeated clicks on a shared link skip the select and the signing call.
+
+    - only finished jobs are stored (nothing else is downloadable)
+    - entries live `ttl` seconds, well inside the signature's lifetime,
+      so a cached URL always has plenty of validity left
+    - dropped on any status / output change (database.update_job) and
+      when the output object is removed
+    """
+
+    def __init__(self, ttl=DOWNLOAD_CACHE_SECONDS, max_entries=DOWNLOAD_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # job_id -> (expires_at, job, url)
+        self._lock = threading.Lock()
+
+    def get(self, job_id, need_url=True):
+        """
+        (job, url) if cached and fresh, else None.
+        url may be None for entries made without one (local downloads).
+        """
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry and entry[0] > time.monotonic() and (entry[2] or not need_url):
+                self._entries.move_to_end(job_id)
+                self.hits += 1
+                return entry[1], entry[2]
+            if entry and entry[0] <= time.monotonic():
+                del self._entries[job_id]
+            self.misses += 1
+            return None
+
+    def put(self, job_id, job, url=None):
+        if job.get("status") != "done" or not job.get("output_path"):
+            return
+        with self._lock:
+            self._entries[job_id] = (time.monotonic() + self.ttl, job, url)
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, job_id):
+        with self._lock:
+            self._entries.pop(job_id, None)
+
+    def invalidate_paths(self, paths):
+        """
+        Drop entries pointing at removed objects (result cache eviction)
+        """
+        paths = set(paths)
+        with self._lock:
+            stale = [j for j, e in self._entries.items() if e[1].get("output_path") in paths]
+            for job_id in stale:
+                del self._entries[job_id]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+_downloads = DownloadCache()
+
+
+def get_download_cache():
+    return _downloads
+
+
+_cache = None
+
+
+def get_result_cache():
+    global _cache
+    if _cache is None:
+        from database import jobs_store, remove_outputs
+        _cache = ResultCache(
+            jobs_store,
+            max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+            remove_objects=remove_outputs,
+            enabled=RESULT_CACHE_ENABLED
+        )
+    return _cache
@@ -0,0 +1,93 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import TimeoutError as FutureTimeout
+
+# How often blocking waits look at the token
+POLL_SECONDS = 0.2
+
+# Token of the job running in this thread (set by the worker)
+_current = contextvars.ContextVar("cancel_token", default=None)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class CancelToken:
+    """
+    Per-job stop signal + hard deadline.
+    Whatever runs the job (subprocess loops, pool waits, page batches)
+    polls it and bails out.
+    """
+
+    def __init__(self, timeout=None):
+        self._event = threading.Event()
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled("Job cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise JobTimeout(f"Job timed out after {self.timeout}s")
+
+
+@contextmanager
+def scope(token):
+    """
+    Make `token` the current one in this thread
+    (pool threads of a job enter it themselves)
+    """
+    handle = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(handle)
+
+
+def current():
+    return _current.get()
+
+
+def check():
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+
+def wait(future):
+    """
+    future.result(), but gives up as soon as the job is cancelled / over time,
+    and cancels the future (procs.ProcessPool kills a running task's process)
+    """
+    token = _current.get()
+    if token is None:
+        return future.result()
+
+    while True:
+        try:
+            return future.result(timeout=POLL_SECONDS)
+        except FutureTimeout:
+            try:
+                token.check()
+            except (JobCancelled, JobTimeout):
+                future.cancel()
+                raise
@@ -1,9 +1,14 @@
+import io
 import os
-import mimetypes
-import subprocess
+import time
+import shutil
 import ffmpeg
-from PIL import Image
+from images import open_image
 from converter import MahaConvert
+import detect
+from media import probe, video_policy, encode_h264, already_below, run_ffmpeg, AUDIO_CODECS
+import progress
+from gs_pool import compress_pdf, has_large_images
 
 
 class MahaCompressor:
@@ -11,10 +16,21 @@ class MahaCompressor:
     PRODUCTION-OPTIMIZED COMPRESSOR
     - Image: binary search quality
     - Audio: bitrate mapping (1x encode)
-    - Video: CRF mapping (1x encode)
+    - Video: CRF mapping + adaptive preset (1x encode)
     - PDF: DPI mapping (Ghostscript)
+
+    target_size=True: aim for output = (100 - target_percent)% of input
+    - Image: bounded binary search on quality (in-memory encodes)
+    - Audio: bitrate from duration
+    - Video: 2-pass bitrate from duration
+    - PDF: DPI ladder
     """
 
+    # Target-size search budget (per job)
+    SEARCH_MAX_STEPS = 7
+    SEARCH_MAX_SECONDS = 10
+    PDF_DPI_LADDER = (200, 150, 110, 72, 50)
+
     def __init__(self, output_dir="output"):
         self.output_dir = output_dir
         self.mc = MahaConvert(output_dir=output_dir)
@@ -22,10 +38,22 @@ class MahaCompressor:
     # ==================================================
     # PUBLIC
     # ==================================================
-    def compress(self, input_path: str, target_percent: int = 70) -> str:
+    def compress(self, input_path: str, target_percent: int = 70, queue_depth: int = 0,
+                 target_size: bool = False) -> str:
         ftype = self._detect_type(input_path)
         ext = os.path.splitext(input_path)[1].lower().replace(".", "")
 
+        if target_size and ftype in ("image", "audio", "video", "pdf"):
+            target_bytes = os.path.getsize(input_path) * (100 - target_percent) // 100
+
+            if ftype == "image":
+                return self._image_to_size(input_path, target_bytes)
+            if ftype == "audio":
+                return self._audio_to_size(input_path, target_bytes, target_percent)
+            if ftype == "video":
+                return self._video_to_size(input_path, target_bytes, target_percent, queue_depth)
+            return self._pdf_to_size(input_path, target_bytes)
+
         if ftype == "image":
             return self._compress_image(input_path, target_percent)
 
@@ -33,7 +61,7 @@ class MahaCompressor:
             return self._compress_audio(input_path, target_percent)
 
         if ftype == "video":
-            return self._compress_video(input_path, target_percent)
+            return self._compress_video(input_path, target_percent, queue_depth)
 
         if ftype == "pdf":
             return self._compress_pdf(input_path, target_percent)
@@ -48,7 +76,6 @@ class MahaCompressor:
 
     def _copy_archive(self, input_path):
         """Archives are already compressed, just copy to output directory"""
-        import shutil
         name = os.path.basename(input_path)
         output = os.path.join(self.output_dir, name)
         shutil.copy2(input_path, output)
@@ -64,6 +91,19 @@ class MahaCompressor:
         target_percent 90 = max compression (quality 5)
         PRESERVES ORIGINAL FORMAT
         """
+        img, output, pil_format = self._open_image(input_path)
+
+        # Map 0-90% to quality 95-5
+        quality = max(5, int(95 - target_percent))
+
+        img.save(output, format=pil_format, quality=quality, optimize=True)
+        return output
+
+    def _open_image(self, input_path):
+        """
+        Open image in a mode the output format accepts.
+        Returns (img, output_path, pil_format)
+        """
         name, ext = os.path.splitext(os.path.basename(input_path))
         ext = ext.lower().replace(".", "")
         
@@ -75,21 +115,17 @@ class MahaCompressor:
             
         output = os.path.join(self.output_dir, f"{name}.{out_ext}")
 
-        Image.MAX_IMAGE_PIXELS = None
-        img = Image.open(input_path)
-        print(f"[DEBUG] Opened image {input_path} with mode {img.mode} and size {img.size}")
-
-        
-        # Convert RGBA/P/F/I to RGB for JPEG
+        # Modes the encoder takes as-is; anything else is converted once
         if out_ext in ("jpg", "jpeg"):
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-        # Ensure compatible modes for other formats
-        elif out_ext == "png" and img.mode not in ("RGB", "RGBA", "L", "P", "1"):
-             img = img.convert("RGBA")
+            modes = ("RGB", "L", "CMYK")
+        elif out_ext == "png":
+            modes = ("RGBA", "RGB", "L", "P", "1", "LA", "I;16")
+        else:
+            modes = None
 
-        # Map 0-90% to quality 95-5
-        quality = max(5, int(95 - target_percent))
+        # Within the per-job memory budget (bigger images are refused)
+        img = open_image(input_path, modes)
+        print(f"[DEBUG] Opened image {input_path} with mode {img.mode} and size {img.size}")
 
         # Determine PIL format string
         if out_ext in ("jpg", "jpeg"):
@@ -101,8 +137,7 @@ class MahaCompressor:
         else:
             pil_format = "JPEG"
 
-        img.save(output, format=pil_format, quality=quality, optimize=True)
-        return output
+        return img, output, pil_format
 
     # ==================================================
     # AUDIO — BITRATE MAPPING (OPTIMIZED)
@@ -132,19 +167,23 @@ class MahaCompressor:
         else:
             bitrate = "64k"
 
-        (
+        # Source is already at/below that bitrate: re-encoding only loses quality
+        if out_ext == ext and already_below(probe(input_path), AUDIO_CODECS[ext][1], bitrate):
+            shutil.copyfile(input_path, output)
+            return output
+
+        run_ffmpeg(
             ffmpeg
             .input(input_path)
             .output(output, audio_bitrate=bitrate)
             .overwrite_output()
-            .run(quiet=True)
         )
         return output
 
     # ==================================================
     # VIDEO — CRF MAPPING (OPTIMIZED)
     # ==================================================
-    def _compress_video(self, input_path, target_percent):
+    def _compress_video(self, input_path, target_percent, queue_depth=0):
         name, ext = os.path.splitext(os.path.basename(input_path))
         ext = ext.lower().replace(".", "")
         
@@ -162,21 +201,12 @@ class MahaCompressor:
         crf = int(18 + (target_percent * 0.3))
         crf = min(45, max(18, crf))
 
-        (
-            ffmpeg
-            .input(input_path)
-            .output(
-                output,
-                vcodec="libx264",
-                crf=crf,
-                preset="ultrafast",  # FASTEST preset
-                acodec="aac",
-                audio_bitrate="96k"  # Lower for faster processing
-            )
-            .overwrite_output()
-            .run(quiet=True)
-        )
-        return output
+        # Preset / threads from input size + queue depth (1 ffprobe)
+        info = probe(input_path)
+        policy = video_policy(info, crf, queue_depth)
+
+        # Lower audio bitrate for faster processing
+        return encode_h264(input_path, output, policy, audio_bitrate="96k", info=info)
 
     # ==================================================
     # PDF — DPI MAPPING (1x PASS)
@@ -194,62 +224,171 @@ class MahaCompressor:
         else:
             dpi = 72
 
-        cmd = [
-            "gs",
-            "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            "-dPDFSETTINGS=/screen",
-            f"-dColorImageResolution={dpi}",
-            f"-dGrayImageResolution={dpi}",
-            f"-dMonoImageResolution={dpi}",
-            "-dNOPAUSE",
-            "-dQUIET",
-            "-dBATCH",
-            f"-sOutputFile={output}",
-            input_path
-        ]
-
-        subprocess.run(cmd, check=True)
-        return output
+        return self._gs_compress(input_path, output, dpi)
+
+    def _gs_compress(self, input_path, output, dpi, skip_check=True):
+        # Bounded gs pool; skips / keeps original when gs can't help
+        return compress_pdf(input_path, output, dpi, skip_check=skip_check)
 
     # ==================================================
-    # DETECTOR
+    # TARGET SIZE MODE (BOUNDED SEARCH)
     # ==================================================
+    def _image_to_size(self, input_path, target_bytes):
+        """
+        Binary search the highest quality whose encode fits target_bytes.
+        Every try is encoded into memory; only the winner hits disk.
+        """
+        img, output, pil_format = self._open_image(input_path)
+
+        # PNG quality is ignored (lossless), one optimized encode is all we can do
+        if pil_format == "PNG":
+            img.save(output, format=pil_format, optimize=True)
+            return output
+
+        lo, hi = 5, 95
+        best = None       # largest encode that fits
+        smallest = None   # fallback if nothing fits
+        deadline = time.monotonic() + self.SEARCH_MAX_SECONDS
+
+        for _ in range(self.SEARCH_MAX_STEPS):
+            if lo > hi or time.monotonic() > deadline:
+                break
+            quality = (lo + hi) // 2
+            buf = io.BytesIO()
+            img.save(buf, format=pil_format, quality=quality)
+            data = buf.getvalue()
+
+            if len(data) <= target_bytes:
+                best = data
+                lo = quality + 1
+            else:
+                if smallest is None or len(data) < len(smallest):
+                    smallest = data
+                hi = quality - 1
+
+        with open(output, "wb") as f:
+            f.write(best if best is not None else smallest)
+        return output
+
+    def _audio_to_size(self, input_path, target_bytes, target_percent):
+        """
+        Constant bitrate = target size / duration
+        """
+        info = probe(input_path)
+        if not info or not info.get("duration"):
+            return self._compress_audio(input_path, target_percent)
+
+        kbps = int(target_bytes * 8 / info["duration"] / 1000)
+        kbps = min(320, max(32, kbps))
+
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        ext = ext.lower().replace(".", "")
+        out_ext = ext if ext in ("mp3", "opus", "aac", "ogg") else "mp3"
+        output = os.path.join(self.output_dir, f"{name}.{out_ext}")
+
+        run_ffmpeg(
+            ffmpeg
+            .input(input_path)
+            .output(output, audio_bitrate=f"{kbps}k")
+            .overwrite_output()
+        )
+        return output
+
+    def _video_to_size(self, input_path, target_bytes, target_percent, queue_depth=0):
+        """
+        Two-pass x264 at the bitrate that lands on target_bytes
+        """
+        info = probe(input_path)
+        if not info or not info.get("duration"):
+            return self._compress_video(input_path, target_percent, queue_depth)
+
+        audio_kbps = 96
+        total_kbps = target_bytes * 8 / info["duration"] / 1000
+        video_kbps = max(50, int(total_kbps - audio_kbps))
+
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        ext = ext.lower().replace(".", "")
+        out_ext = ext if ext in ("mp4", "mkv", "mov") else "mp4"
+        output = os.path.join(self.output_dir, f"{name}.{out_ext}")
+        passlog = os.path.join(self.output_dir, f"{name}.2pass")
+
+        policy = video_policy(info, 0, queue_depth)
+        common = {
+            "vcodec": "libx264",
+            "video_bitrate": f"{video_kbps}k",
+            "preset": policy["preset"],
+            "threads": policy["threads"],
+            "passlogfile": passlog
+        }
+
+        try:
+            # Pass 1: analysis only, no audio, output discarded
+            with progress.span(0, 0.5):
+                run_ffmpeg(
+                    ffmpeg
+                    .input(input_path)
+                    .output(os.devnull, format="null", an=None, **common, **{"pass": 1})
+                    .overwrite_output()
+                )
+            # Pass 2: real encode
+            with progress.span(0.5, 1):
+                run_ffmpeg(
+                    ffmpeg
+                    .input(input_path)
+                    .output(
+                        output,
+                        acodec="aac",
+                        audio_bitrate=f"{audio_kbps}k",
+                        **common,
+                        **{"pass": 2}
+                    )
+                    .overwrite_output()
+                )
+        finally:
+            for f in os.listdir(self.output_dir):
+                if f.startswith(os.path.basename(passlog)):
+                    os.remove(os.path.join(self.output_dir, f))
+        return output
+
+    def _pdf_to_size(self, input_path, target_bytes):
+        """
+        Walk down PDF_DPI_LADDER until the output fits (or budget runs out),
+        keeping the best attempt
+        """
+        name = os.path.splitext(os.path.basename(input_path))[0]
+        output = os.path.join(self.output_dir, f"{name}.pdf")
+        attempt = os.path.join(self.output_dir, f"{name}.try.pdf")
+        deadline = time.monotonic() + self.SEARCH_MAX_SECONDS * 6
+
+        # No large images: no DPI will change anything
+        if not has_large_images(input_path):
+            return self._gs_compress(input_path, output, self.PDF_DPI_LADDER[0])
+
+        best_size = None
+        for dpi in self.PDF_DPI_LADDER:
+            self._gs_compress(input_path, attempt, dpi, skip_check=False)
+            size = os.path.getsize(attempt)
+            if best_size is None or size < best_size:
+                os.replace(attempt, output)
+                best_size = size
+            if best_size <= target_bytes or time.monotonic() > deadline:
+                break
+
+        if os.path.exists(attempt):
+            os.remove(attempt)
+        return output
+
     # ==================================================
     # DETECTOR
     # ==================================================
     def _detect_type(self, path: str) -> str:
-        # 1. Force extension check first for robustness
-        ext = os.path.splitext(path)[1].lower().replace(".", "")
-        
-        # Images
-        if ext in ("jpg", "jpeg", "png", "webp", "avif", "bmp", "heic", "heif", "tiff", "tif", "ico", "jxl"):
-            return "image"
-            
-        # Audio
-        if ext in ("mp3", "wav", "opus", "aac", "ogg", "flac", "m4a", "aiff", "aif", "wma", "mid", "midi"):
-            return "audio"
-            
-        # Video
-        if ext in ("mp4", "webm", "mkv", "avi", "mov", "flv", "gif", "3gp", "3g2", "mpeg", "mpg", "ogv", "wmv"):
+        kind, ext = detect.sniff(path)
+        # Animated GIFs compress far better as video; SVG is just XML
+        if ext == "gif":
             return "video"
-            
-        # PDF
-        if ext == "pdf":
-            return "pdf"
-            
-        # Archives
-        if ext in ("zip", "7z", "rar", "gz", "tar", "bz2", "xz"):
-            return "archive"
-
-        # 2. Fallback to mimetype
-        mime, _ = mimetypes.guess_type(path)
-        if mime:
-            main, sub = mime.split("/")
-            if main == "image": return "image"
-            if main == "audio": return "audio"
-            if main == "video": return "video"
-            if mime == "application/pdf": return "pdf"
-            if main == "text": return "text"
-
-        return "binary"
+        if ext == "svg":
+            return "text"
+        # Office files: generic byte compression, like any binary
+        if kind == "document":
+            return "binary"
+        return kind
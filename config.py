@@ -5,4 +5,183 @@ load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-    
\ No newline at end of file
+
+
+def _parse_limits(value):
+    """
+    Parse "video=2,pdf=2" into {"video": 2, "pdf": 2}
+    """
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        key, num = item.split("=", 1)
+        try:
+            limits[key.strip()] = max(1, int(num))
+        except ValueError:
+            continue
+    return limits
+
+
+# =========================
+# WORKER
+# =========================
+CPU_COUNT = os.cpu_count() or 2
+
+# Total jobs running at once in one worker process
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", CPU_COUNT))
+
+# Processes for CPU-bound Python work (Pillow, pandas, reportlab)
+WORKER_CPU_PROCESSES = int(os.getenv("WORKER_CPU_PROCESSES", max(1, CPU_COUNT // 2)))
+
+# Per job-type limit, so one type (video) can't take every slot
+WORKER_TYPE_LIMITS = _parse_limits(
+    os.getenv("WORKER_TYPE_LIMITS", "video=2,audio=2,pdf=2,office=2,batch=1")
+)
+
+# =========================
+# JOB STORE
+# =========================
+# "supabase" (default) or "sqlite" (local stand-in, no Supabase needed)
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", ":memory:")
+
+# A claimed job belongs to one worker until its lease expires;
+# running jobs renew the lease every JOB_LEASE_SECONDS / 3
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 60))
+
+# =========================
+# DISPATCH
+# =========================
+# Set to push new jobs to workers in other processes / hosts
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Pushed jobs start immediately; the queue is only polled this often
+# as a fallback (missed messages, jobs requeued by lease expiry).
+# Without Redis, pushes only reach the worker thread inside the app
+# process: a standalone `python worker.py` finds new jobs by polling
+# alone, so the default stays short there
+DISPATCH_POLL_SECONDS = float(os.getenv("DISPATCH_POLL_SECONDS", 30 if REDIS_URL else 3))
+
+# =========================
+# STORAGE TRANSFERS
+# =========================
+# "supabase" (buckets) or "local" (single host: objects under STORAGE_DIR/<bucket>/)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+STORAGE_DIR = os.getenv("STORAGE_DIR", "storage")
+
+# /download/<id>: "redirect" (302 to a signed URL), "proxy" (stream through
+# this app) or "local" (sendfile from STORAGE_DIR, Range + ETag)
+DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "local" if STORAGE_BACKEND == "local" else "redirect")
+# Cache-Control max-age for local downloads (outputs never change)
+DOWNLOAD_MAX_AGE = int(os.getenv("DOWNLOAD_MAX_AGE", 3600))
+# Signed download URLs are valid this long; the app reuses one for at most
+# DOWNLOAD_CACHE_SECONDS, so every URL it hands out has most of it left
+SIGNED_URL_SECONDS = int(os.getenv("SIGNED_URL_SECONDS", 3600))
+DOWNLOAD_CACHE_SECONDS = int(os.getenv("DOWNLOAD_CACHE_SECONDS", min(600, SIGNED_URL_SECONDS // 6)))
+DOWNLOAD_CACHE_MAX_ENTRIES = int(os.getenv("DOWNLOAD_CACHE_MAX_ENTRIES", 10000))
+
+# Objects at least this big are fetched with parallel range requests
+DOWNLOAD_PARALLEL_MIN_MB = int(os.getenv("DOWNLOAD_PARALLEL_MIN_MB", 64))
+DOWNLOAD_PARALLEL_PARTS = int(os.getenv("DOWNLOAD_PARALLEL_PARTS", 4))
+
+# =========================
+# RESULT CACHE
+# =========================
+# Same input bytes + same options -> reuse the stored output
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", 5120))
+# Each worker keeps a running total of the cache size and re-reads the
+# real one this often (adds made by other workers)
+RESULT_CACHE_SYNC_SECONDS = int(os.getenv("RESULT_CACHE_SYNC_SECONDS", 300))
+
+# =========================
+# VIDEO
+# =========================
+# Long videos are split at keyframes and encoded as parallel segments
+VIDEO_SEGMENTED = os.getenv("VIDEO_SEGMENTED", "1") == "1"
+VIDEO_SEGMENT_SECONDS = int(os.getenv("VIDEO_SEGMENT_SECONDS", 60))
+# Shorter clips are encoded in one ffmpeg (split/concat overhead not worth it)
+VIDEO_SEGMENT_MIN_SECONDS = int(os.getenv("VIDEO_SEGMENT_MIN_SECONDS", 180))
+
+# =========================
+# PDF
+# =========================
+# pdftoppm threads per rasterization, pages rendered per batch
+PDF_RENDER_THREADS = int(os.getenv("PDF_RENDER_THREADS", min(4, CPU_COUNT)))
+PDF_PAGE_BATCH = int(os.getenv("PDF_PAGE_BATCH", 8))
+
+# Ghostscript: concurrent gs processes, per-job timeout. pdfwrite runs on one
+# thread, so GS_MAX_PROCS is the only source of parallelism
+GS_MAX_PROCS = int(os.getenv("GS_MAX_PROCS", WORKER_TYPE_LIMITS.get("pdf", 2)))
+GS_TIMEOUT = int(os.getenv("GS_TIMEOUT", 180))
+# PDFs without an image this big are returned as-is (nothing to downsample)
+GS_MIN_IMAGE_PIXELS = int(os.getenv("GS_MIN_IMAGE_PIXELS", 300 * 300))
+
+# =========================
+# OFFICE (LIBREOFFICE)
+# =========================
+# Long-lived headless soffice instances, one document at a time each.
+# Driven over UNO: in the app's Python if it has the bridge, otherwise
+# through office_uno.py under OFFICE_PYTHON (default: LibreOffice's own
+# python, then python3 with python3-uno, as installed by the Aptfile).
+# With no UNO at all, each document runs a one-off soffice.
+OFFICE_PYTHON = os.getenv("OFFICE_PYTHON", "")
+OFFICE_POOL_SIZE = int(os.getenv("OFFICE_POOL_SIZE", WORKER_TYPE_LIMITS.get("office", 2)))
+# Restart an instance after this many documents (memory growth)
+OFFICE_MAX_CONVERSIONS = int(os.getenv("OFFICE_MAX_CONVERSIONS", 50))
+OFFICE_TIMEOUT = int(os.getenv("OFFICE_TIMEOUT", 120))
+
+# =========================
+# DATA COMPRESSION (ZSTD / BROTLI)
+# =========================
+# Inputs this big get multi-threaded zstd + long-distance matching
+ZSTD_LARGE_MB = int(os.getenv("ZSTD_LARGE_MB", 64))
+ZSTD_THREADS = int(os.getenv("ZSTD_THREADS", min(4, CPU_COUNT)))
+
+# Opt-in: small inputs compressed with a per-type trained dictionary.
+# Those .zst files only decode with that dictionary (zstd -d -D <dict>):
+# it is stored as dicts/<id>.dict in the output bucket and its id is on the
+# job (zstd_dict_id), but users don't get it with the download
+ZSTD_DICT_ENABLED = os.getenv("ZSTD_DICT_ENABLED", "0") == "1"
+ZSTD_DICT_DIR = os.getenv("ZSTD_DICT_DIR", "zstd_dicts")
+ZSTD_DICT_INPUT_MAX_KB = int(os.getenv("ZSTD_DICT_INPUT_MAX_KB", 256))
+ZSTD_DICT_SIZE = int(os.getenv("ZSTD_DICT_SIZE", 110 * 1024))
+ZSTD_DICT_MIN_SAMPLES = int(os.getenv("ZSTD_DICT_MIN_SAMPLES", 100))
+ZSTD_DICT_MAX_SAMPLES = int(os.getenv("ZSTD_DICT_MAX_SAMPLES", 2000))
+ZSTD_DICT_RETRAIN_EVERY = int(os.getenv("ZSTD_DICT_RETRAIN_EVERY", 500))
+
+# Image jobs: peak decoded-pixel memory per job; bigger images are refused.
+# The default fits a 20000x20000 RGB JPEG (~1.1 GB decoded)
+IMAGE_MEMORY_BUDGET_MB = int(os.getenv("IMAGE_MEMORY_BUDGET_MB", 2048))
+# Memory the scheduler hands out across running jobs that declare memory_mb
+WORKER_MEMORY_MB = int(os.getenv("WORKER_MEMORY_MB", 4096))
+
+# Multi-file requests (/upload/images, /upload/batch)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 300))
+# Parallel storage uploads per multi-file request
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+
+# Job progress while converting: written at most every N seconds,
+# or sooner when it moves by PROGRESS_MIN_STEP points
+PROGRESS_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", 2))
+PROGRESS_MIN_STEP = int(os.getenv("PROGRESS_MIN_STEP", 10))
+
+# Hard wall-clock limit per job kind, seconds (subprocesses are killed)
+JOB_TIMEOUTS = _parse_limits(
+    os.getenv("JOB_TIMEOUTS", "video=3600,audio=900,pdf=900,office=600,image=300,data=300,batch=1800")
+)
+# How often the worker re-reads the status of its running jobs (cancel fallback)
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", 1))
+
+# /job/<id> and /job/<id>/events: a cached job status older than
+# STATUS_CACHE_TTL seconds is re-read from the database (updates made in
+# this process refresh it)
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", 2))
+STATUS_CACHE_KEEP_SECONDS = int(os.getenv("STATUS_CACHE_KEEP_SECONDS", 600))
+# Event streams hold a server thread each (Procfile: 32 per process), so they
+# are short windows the browser reconnects after, and only SSE_MAX_STREAMS
+# run at once; past that clients poll /job/<id> (cached) instead
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+SSE_MAX_SECONDS = int(os.getenv("SSE_MAX_SECONDS", 25))
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", 8))
@@ -1,14 +1,45 @@
 import os
-import mimetypes
-import subprocess
+import shutil
+import tempfile
 import ffmpeg
 import brotli
 import zstandard as zstd
 from PIL import Image
-from pydub import AudioSegment
 from pypdf import PdfReader, PdfWriter
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+import io
 import zipfile
+from collections import deque
+from media import (
+    probe,
+    video_policy,
+    encode_h264,
+    encode_audio,
+    can_remux,
+    remux,
+    run_ffmpeg,
+    AUDIO_CODECS
+)
+import progress
+import cancel
+from config import (
+    PDF_RENDER_THREADS,
+    PDF_PAGE_BATCH,
+    ZSTD_LARGE_MB,
+    ZSTD_THREADS,
+    ZSTD_DICT_ENABLED,
+    ZSTD_DICT_INPUT_MAX_KB,
+    WORKER_CPU_PROCESSES
+)
+import zstd_dicts
+import detect
+from images import open_image, open_header
+from pdf_writer import JpegPdfWriter
+from office_pool import convert_to_pdf as office_convert_to_pdf
+from gs_pool import compress_pdf
+
+# Read size for streaming compressors
+STREAM_CHUNK_SIZE = 1024 * 1024
 
 # HEIC Support (iPhone photos)
 try:
@@ -34,13 +65,57 @@ except ImportError:
     PDF2DOCX_SUPPORTED = False
 
 
+# EXIF orientation -> transpose that makes the image upright
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+# ==================================================
+# BATCH IMAGE ENCODE (ONE IMAGE, RUNS IN THE CPU POOL)
+# ==================================================
+def encode_batch_image(input_path, output, to_format, quality=85):
+    """
+    One image of a batch -> `output`.
+    to_format "pdf" means "a JPEG for a PDF page"; an upright RGB/gray
+    JPEG is then copied as-is (no decode).
+    Returns (output, width, height, components)
+    """
+    with open_header(input_path) as head:
+        orientation = head.getexif().get(0x0112, 1)
+        if (to_format == "pdf" and head.format == "JPEG"
+                and head.mode in ("RGB", "L") and orientation not in EXIF_TRANSPOSE):
+            shutil.copyfile(input_path, output)
+            return output, head.size[0], head.size[1], len(head.getbands())
+
+    fmt = "jpg" if to_format == "pdf" else to_format
+    if fmt in ("jpg", "jpeg"):
+        modes = ("RGB", "L")
+    elif fmt == "png":
+        modes = ("RGBA", "RGB", "L", "P", "1", "LA", "I;16")
+    else:
+        modes = None
+
+    img = open_image(input_path, modes)
+    if orientation in EXIF_TRANSPOSE:
+        # Phone photos: pixels are stored sideways, EXIF says how to turn them
+        img = img.transpose(EXIF_TRANSPOSE[orientation])
+
+    pil_format = "JPEG" if fmt in ("jpg", "jpeg") else fmt.upper()
+    img.save(output, format=pil_format, quality=quality, optimize=True)
+    return output, img.size[0], img.size[1], len(img.getbands())
+
+
 class MahaConvert:
     # Extended format sets for bidirectional support
     IMAGE_FORMATS = {"jpg", "jpeg", "png", "webp", "avif", "bmp", "heic", "heif", "tiff", "tif", "ico", "jxl"}
     AUDIO_FORMATS = {"mp3", "wav", "opus", "aac", "ogg", "flac", "m4a", "aiff", "aif", "wma", "mid", "midi", "weba"}
-    VIDEO_FORMATS = {"mp4", "webm", "mkv", "avi", "mov", "flv", "gif", "3gp", "3g2", "mpeg", "mpg", "ogv", "wmv"}
-    DOC_FORMATS = {"pdf", "docx", "pptx", "xlsx", "doc", "ppt", "xls", "csv", "rtf", "txt", "md", "json", "xml", "epub"}
-    ARCHIVE_FORMATS = {"zip", "7z", "rar"}
 
     def __init__(self, output_dir="output"):
         self.output_dir = output_dir
@@ -52,25 +127,9 @@ class MahaConvert:
     def _out(self, name, ext):
         return os.path.join(self.output_dir, f"{name}.{ext}")
 
-    def detect_mime(self, path):
-        mime, _ = mimetypes.guess_type(path)
-        return mime or "application/octet-stream"
-
     def detect_type(self, path):
-        mime = self.detect_mime(path)
-
-        if mime.startswith("image/"):
-            return "image"
-        if mime.startswith("audio/"):
-            return "audio"
-        if mime.startswith("video/"):
-            return "video"
-        if mime == "application/pdf":
-            return "pdf"
-        if mime.startswith("text/"):
-            return "text"
-
-        return "binary"
+        # Content first (magic bytes), extension only as a fallback
+        return detect.detect_type(path)
 
     def detect_ext(self, path):
         return os.path.splitext(path)[1].lower().replace(".", "")
@@ -78,14 +137,15 @@ class MahaConvert:
     # ==================================================
     # AUTO CONVERT (DEFAULT SAFE)
     # ==================================================
-    def detect_and_convert(self, input_path, request_format=None):
+    def detect_and_convert(self, input_path, request_format=None, queue_depth=0):
         """
         Auto convert ke format AMAN & UMUM
         (dipakai worker kalau user tidak specify format)
         Atau ke format request user
+        queue_depth: jobs waiting, lets video encodes pick faster presets
         """
-        ftype = self.detect_type(input_path)
-        input_ext = self.detect_ext(input_path)
+        # Sniffed ext: a mislabeled file is routed by what it really is
+        ftype, input_ext = detect.sniff(input_path)
         request_format = request_format.lower() if request_format else None
 
         # ========== IMAGE ==========
@@ -122,30 +182,29 @@ class MahaConvert:
             elif request_format in ("mp3", "aac", "wav", "ogg", "flac", "opus"):
                 return self.video_to_audio(input_path, to_format=request_format)
             elif request_format in ("mp4", "mkv", "avi", "mov"):
-                return self.video_convert(input_path, to_format=request_format)
+                return self.video_convert(input_path, to_format=request_format, queue_depth=queue_depth)
             else:
                 # Default: compress to MP4
-                return self.video_compress(input_path, crf=28)
+                return self.video_compress(input_path, crf=28, queue_depth=queue_depth)
 
         # ========== PDF ==========
         if ftype == "pdf":
             if request_format == "docx":
                 return self.pdf_to_docx(input_path)
             elif request_format in ("png", "jpg", "jpeg", "webp"):
-                images = self.pdf_to_images(
-                    input_path,
-                    to_format=request_format,
-                    dpi=200
-                )
                 # Return first page or all pages if multiple
-                if len(images) == 1:
-                    return images[0]
+                # (one pdfinfo call: the count is passed down)
+                pages = self._pdf_page_count(input_path)
+                if pages == 1:
+                    return self.pdf_to_images(input_path, to_format=request_format, dpi=200,
+                                              last_page=1)[0]
                 else:
-                    # Zip multiple pages
-                    return self._zip_files(images, input_path)
+                    # Pages are encoded straight into the zip
+                    return self.pdf_to_zip(input_path, to_format=request_format, dpi=200,
+                                           last_page=pages)
             else:
-                # Default: first page as PNG
-                images = self.pdf_to_images(input_path, to_format="png", dpi=200)
+                # Default: first page as PNG (only page 1 is rendered)
+                images = self.pdf_to_images(input_path, to_format="png", dpi=200, last_page=1)
                 return images[0]
 
         # ========== CSV ==========
@@ -189,19 +248,6 @@ class MahaConvert:
 
         raise ValueError(f"Unsupported file type: {ftype}")
 
-    def _zip_files(self, files, original_path):
-        """Zip multiple output files"""
-        name = os.path.splitext(os.path.basename(original_path))[0]
-        output = self._out(name, "zip")
-        
-        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for f in files:
-                zf.write(f, os.path.basename(f))
-                # Clean up individual files
-                os.remove(f)
-        
-        return output
-
     # ==================================================
     # IMAGE ⇄ IMAGE (ANY TO ANY)
     # ==================================================
@@ -210,24 +256,16 @@ class MahaConvert:
         if to_format not in self.IMAGE_FORMATS:
             raise ValueError("Unsupported image format")
 
-        img = Image.open(input_path)
-
-        # Convert RGBA/P/F/I to RGB if target is JPEG
+        # Convert only when the target can't take the mode (JPEG: RGB/L/CMYK)
         if to_format in ("jpg", "jpeg"):
-            if img.mode != "RGB":
-                try:
-                    img = img.convert("RGB")
-                    print(f"[DEBUG] Converted {img.mode} to RGB")
-                except:
-                    # Fallback for complex modes like F
-                    if img.mode == 'F':
-                         img = img.convert('L').convert('RGB')
-                    else:
-                        img = img.convert("RGB")
-        
-        # Ensure compatible mode for PNG
-        elif to_format == "png" and img.mode not in ("RGB", "RGBA", "L", "P", "1"):
-            img = img.convert("RGBA")
+            modes = ("RGB", "L", "CMYK")
+        elif to_format == "png":
+            modes = ("RGBA", "RGB", "L", "P", "1", "LA", "I;16")
+        else:
+            modes = None
+
+        # Within the per-job memory budget (bigger images are refused)
+        img = open_image(input_path, modes)
 
         name = os.path.splitext(os.path.basename(input_path))[0]
         output = self._out(name, to_format)
@@ -245,27 +283,79 @@ class MahaConvert:
     # ==================================================
     # PDF → IMAGE (PNG / JPG / WEBP / AVIF)
     # ==================================================
-    def pdf_to_images(self, input_path, to_format="png", dpi=200):
-        to_format = to_format.lower()
-        pages = convert_from_path(input_path, dpi=dpi)
+    def _pdf_page_count(self, input_path):
+        return int(pdfinfo_from_path(input_path)["Pages"])
 
+    def _iter_pdf_pages(self, input_path, dpi, first_page=1, last_page=None):
+        """
+        Yield (page_no, image) rendering PDF_PAGE_BATCH pages at a time
+        with PDF_RENDER_THREADS poppler threads. Only one batch is ever
+        held in memory; callers close each page after encoding it.
+        """
+        if last_page is None:
+            last_page = self._pdf_page_count(input_path)
+        total = last_page - first_page + 1
+
+        for start in range(first_page, last_page + 1, PDF_PAGE_BATCH):
+            # pdftoppm can't be polled: stop between batches
+            cancel.check()
+            end = min(start + PDF_PAGE_BATCH - 1, last_page)
+            pages = convert_from_path(
+                input_path,
+                dpi=dpi,
+                first_page=start,
+                last_page=end,
+                thread_count=PDF_RENDER_THREADS
+            )
+            for i, page in enumerate(pages, start=start):
+                yield i, page
+                # Caller has encoded the page by the time we resume
+                progress.report((i - first_page + 1) / total)
+            del pages
+
+    def _encode_page(self, page, to_format, fp):
+        if page.mode == "RGBA" and to_format in ("jpg", "jpeg"):
+            page = page.convert("RGB")
+
+        pil_format = "JPEG" if to_format in ("jpg", "jpeg") else to_format.upper()
+        page.save(fp, format=pil_format, quality=90)
+
+    def pdf_to_images(self, input_path, to_format="png", dpi=200, first_page=1, last_page=None):
+        to_format = to_format.lower()
         base = os.path.splitext(os.path.basename(input_path))[0]
         outputs = []
 
-        for i, page in enumerate(pages, start=1):
-            if page.mode == "RGBA" and to_format in ("jpg", "jpeg"):
-                page = page.convert("RGB")
-
+        for i, page in self._iter_pdf_pages(input_path, dpi, first_page, last_page):
             filename = f"{base}_page{i}.{to_format}"
             out = os.path.join(self.output_dir, filename)
 
-            pil_format = "JPEG" if to_format in ("jpg", "jpeg") else to_format.upper()
-            page.save(out, format=pil_format, quality=90)
+            self._encode_page(page, to_format, out)
+            page.close()
 
             outputs.append(out)
 
         return outputs
 
+    def pdf_to_zip(self, input_path, to_format="png", dpi=200, last_page=None):
+        """
+        All pages into one zip, each page encoded in memory and written
+        straight into the archive (no per-page files on disk).
+        last_page: page count if the caller already has it (else pdfinfo)
+        """
+        to_format = to_format.lower()
+        base = os.path.splitext(os.path.basename(input_path))[0]
+        output = self._out(base, "zip")
+
+        # Page images are already compressed: store, don't deflate again
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as zf:
+            for i, page in self._iter_pdf_pages(input_path, dpi, last_page=last_page):
+                buf = io.BytesIO()
+                self._encode_page(page, to_format, buf)
+                page.close()
+                zf.writestr(f"{base}_page{i}.{to_format}", buf.getvalue())
+
+        return output
+
     # ==================================================
     # AUDIO ⇄ AUDIO
     # ==================================================
@@ -274,35 +364,24 @@ class MahaConvert:
         if to_format not in self.AUDIO_FORMATS:
             raise ValueError("Unsupported audio format")
 
-        audio = AudioSegment.from_file(input_path)
         name = os.path.splitext(os.path.basename(input_path))[0]
         output = self._out(name, to_format)
 
-        audio.export(output, format=to_format, bitrate=bitrate)
-        return output
+        # Streams through ffmpeg; copies the stream if the codec already matches
+        return encode_audio(input_path, output, to_format, bitrate)
 
     # ==================================================
     # VIDEO → VIDEO (COMPRESS) - OPTIMIZED
     # ==================================================
-    def video_compress(self, input_path, crf=28):
+    def video_compress(self, input_path, crf=28, queue_depth=0):
         name = os.path.splitext(os.path.basename(input_path))[0]
         output = self._out(name, "mp4")
 
-        (
-            ffmpeg
-            .input(input_path)
-            .output(
-                output,
-                vcodec="libx264",
-                crf=crf,
-                preset="veryfast",  # OPTIMIZED: was "slow"
-                acodec="aac",
-                audio_bitrate="128k"
-            )
-            .overwrite_output()
-            .run(quiet=True)
-        )
-        return output
+        info = probe(input_path)
+        policy = video_policy(info, crf, queue_depth)
+
+        # Long inputs are split and encoded as parallel segments
+        return encode_h264(input_path, output, policy, audio_bitrate="128k", info=info)
 
     # ==================================================
     # VIDEO → IMAGE FRAMES
@@ -312,12 +391,11 @@ class MahaConvert:
         base = os.path.splitext(os.path.basename(input_path))[0]
         pattern = os.path.join(self.output_dir, f"{base}_%03d.{to_format}")
 
-        (
+        run_ffmpeg(
             ffmpeg
             .input(input_path)
             .output(pattern, vf=f"fps={fps}")
             .overwrite_output()
-            .run(quiet=True)
         )
 
         return pattern  # wildcard path
@@ -328,43 +406,59 @@ class MahaConvert:
     def pdf_compress(self, input_path, dpi=150):
         name = os.path.splitext(os.path.basename(input_path))[0]
         output = self._out(name, "pdf")
-
-        cmd = [
-            "gs",
-            "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            "-dPDFSETTINGS=/screen",
-            f"-dColorImageResolution={dpi}",
-            "-dNOPAUSE",
-            "-dQUIET",
-            "-dBATCH",
-            f"-sOutputFile={output}",
-            input_path
-        ]
-        subprocess.run(cmd, check=True)
-        return output
+        return compress_pdf(input_path, output, dpi)
 
     # ==================================================
     # GENERIC DATA
     # ==================================================
     def zstd(self, input_path, level=10):
+        """
+        Streaming zstd: memory stays at a few buffers + the window,
+        whatever the input size. Big inputs use worker threads and
+        long-distance matching (repeats far apart in logs/dumps).
+        """
         name = os.path.basename(input_path)
         output = self._out(name, "zst")
+        size = os.path.getsize(input_path)
+
+        # Small files: one-shot with a trained per-type dictionary (opt-in,
+        # the output then needs that dictionary to decode)
+        if ZSTD_DICT_ENABLED and size <= ZSTD_DICT_INPUT_MAX_KB * 1024:
+            ext = self.detect_ext(input_path) or "bin"
+            with open(input_path, "rb") as fin:
+                data = fin.read()
+            cctx = zstd_dicts.compressor(ext, level)
+            with open(output, "wb") as fout:
+                fout.write(cctx.compress(data))
+            zstd_dicts.add_sample(ext, data)
+            return output
+
+        if size >= ZSTD_LARGE_MB * 1024 * 1024:
+            params = zstd.ZstdCompressionParameters.from_level(
+                level,
+                source_size=size,
+                threads=ZSTD_THREADS,
+                enable_ldm=True,
+                window_log=27  # 128 MB, still decodable with default limits
+            )
+        else:
+            params = zstd.ZstdCompressionParameters.from_level(level, source_size=size)
 
-        cctx = zstd.ZstdCompressor(level=level)
+        cctx = zstd.ZstdCompressor(compression_params=params)
         with open(input_path, "rb") as fin, open(output, "wb") as fout:
-            fout.write(cctx.compress(fin.read()))
+            cctx.copy_stream(fin, fout, size=size, read_size=STREAM_CHUNK_SIZE)
         return output
 
     def brotli(self, input_path, quality=9):
+        """Streaming brotli, one chunk in memory at a time"""
         name = os.path.basename(input_path)
         output = self._out(name, "br")
 
-        with open(input_path, "rb") as f:
-            data = f.read()
-
-        with open(output, "wb") as f:
-            f.write(brotli.compress(data, quality=quality))
+        compressor = brotli.Compressor(quality=quality)
+        with open(input_path, "rb") as fin, open(output, "wb") as fout:
+            for chunk in iter(lambda: fin.read(STREAM_CHUNK_SIZE), b""):
+                fout.write(compressor.process(chunk))
+            fout.write(compressor.finish())
         return output
 
     # ==================================================
@@ -375,7 +469,11 @@ class MahaConvert:
         name = os.path.splitext(os.path.basename(input_path))[0]
         output = self._out(name, "webm")
 
-        (
+        info = probe(input_path)
+        if can_remux(info, "webm"):
+            return remux(input_path, output, info)
+
+        run_ffmpeg(
             ffmpeg
             .input(input_path)
             .output(
@@ -387,7 +485,6 @@ class MahaConvert:
                 audio_bitrate="128k"
             )
             .overwrite_output()
-            .run(quiet=True)
         )
         return output
 
@@ -400,30 +497,12 @@ class MahaConvert:
         name = os.path.splitext(os.path.basename(input_path))[0]
         output = self._out(name, to_format)
 
-        # Map format to codec
-        codec_map = {
-            "mp3": "libmp3lame",
-            "aac": "aac",
-            "opus": "libopus",
-            "wav": "pcm_s16le",
-            "ogg": "libvorbis",
-            "flac": "flac"
-        }
-        acodec = codec_map.get(to_format, "libmp3lame")
-
-        (
-            ffmpeg
-            .input(input_path)
-            .output(
-                output,
-                vn=None,  # No video
-                acodec=acodec,
-                audio_bitrate=bitrate
-            )
-            .overwrite_output()
-            .run(quiet=True)
-        )
-        return output
+        if to_format not in AUDIO_CODECS:
+            to_format = "mp3"
+            output = self._out(name, to_format)
+
+        # Same codec as the source audio track: extracted with stream copy
+        return encode_audio(input_path, output, to_format, bitrate)
 
     # ==================================================
     # VIDEO → GIF (ANIMATED)
@@ -435,29 +514,29 @@ class MahaConvert:
         palette = self._out(name, "palette.png")
 
         # Step 1: Generate palette
-        (
-            ffmpeg
-            .input(input_path)
-            .output(
-                palette,
-                vf=f"fps={fps},scale={scale}:-1:flags=lanczos,palettegen"
+        with progress.span(0, 0.3):
+            run_ffmpeg(
+                ffmpeg
+                .input(input_path)
+                .output(
+                    palette,
+                    vf=f"fps={fps},scale={scale}:-1:flags=lanczos,palettegen"
+                )
+                .overwrite_output()
             )
-            .overwrite_output()
-            .run(quiet=True)
-        )
 
         # Step 2: Create GIF with palette
-        (
-            ffmpeg
-            .input(input_path)
-            .input(palette)
-            .output(
-                output,
-                filter_complex=f"fps={fps},scale={scale}:-1:flags=lanczos[x];[x][1:v]paletteuse"
+        with progress.span(0.3, 1):
+            run_ffmpeg(
+                ffmpeg
+                .input(input_path)
+                .input(palette)
+                .output(
+                    output,
+                    filter_complex=f"fps={fps},scale={scale}:-1:flags=lanczos[x];[x][1:v]paletteuse"
+                )
+                .overwrite_output()
             )
-            .overwrite_output()
-            .run(quiet=True)
-        )
 
         # Cleanup palette
         if os.path.exists(palette):
@@ -468,7 +547,7 @@ class MahaConvert:
     # ==================================================
     # VIDEO → ANY FORMAT (GENERAL)
     # ==================================================
-    def video_convert(self, input_path, to_format="mp4", crf=28):
+    def video_convert(self, input_path, to_format="mp4", crf=28, queue_depth=0):
         """General video format conversion"""
         to_format = to_format.lower()
         name = os.path.splitext(os.path.basename(input_path))[0]
@@ -482,24 +561,12 @@ class MahaConvert:
             return self.video_to_audio(input_path, to_format=to_format)
         else:
             # Default: H.264 MP4/MKV/MOV/AVI
-            vcodec = "libx264"
-            acodec = "aac"
-            
-            (
-                ffmpeg
-                .input(input_path)
-                .output(
-                    output,
-                    vcodec=vcodec,
-                    crf=crf,
-                    preset="veryfast",
-                    acodec=acodec,
-                    audio_bitrate="128k"
-                )
-                .overwrite_output()
-                .run(quiet=True)
-            )
-            return output
+            info = probe(input_path)
+            if can_remux(info, to_format):
+                # Codecs already fit the container: copy streams, no encode
+                return remux(input_path, output, info)
+            policy = video_policy(info, crf, queue_depth)
+            return encode_h264(input_path, output, policy, audio_bitrate="128k", info=info)
 
     # ==================================================
     # SVG → PNG (VECTOR TO RASTER)
@@ -532,11 +599,9 @@ class MahaConvert:
         name = os.path.splitext(os.path.basename(input_path))[0]
         output = self._out(name, "pdf")
 
-        img = Image.open(input_path)
-        
-        # Convert to RGB if needed (PDF doesn't support RGBA)
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
+        # Within the per-job memory budget;
+        # anything PDF can't hold (RGBA, P, ...) comes back as RGB
+        img = open_image(input_path, ("RGB", "L", "CMYK", "1"))
 
         img.save(output, "PDF", resolution=100.0)
         return output
@@ -546,26 +611,85 @@ class MahaConvert:
         if not input_paths:
             raise ValueError("No images provided")
 
-        # Use first image name for output
+        # Pages are written one at a time, never all images in memory
+        return self.images_batch(input_paths, to_format="pdf")
+
+    def images_batch(self, input_paths, to_format="pdf", quality=85, executor=None,
+                     window=WORKER_CPU_PROCESSES):
+        """
+        Many images -> one combined PDF (to_format "pdf") or a zip of
+        `to_format` images.
+        executor: process pool to fan the encodes across; results are
+        consumed in input order, one file at a time. At most `window`
+        encodes are queued at once, so jobs submitted to the pool after
+        this batch don't wait behind all of it.
+        """
+        if not input_paths:
+            raise ValueError("No images provided")
+
+        to_format = to_format.lower()
+        if to_format != "pdf" and to_format not in self.IMAGE_FORMATS:
+            raise ValueError("Unsupported image format")
+
         name = os.path.splitext(os.path.basename(input_paths[0]))[0]
-        output = self._out(name + "_combined", "pdf")
+        ext = "jpg" if to_format == "pdf" else to_format
+        workdir = tempfile.mkdtemp(prefix="batch-", dir=self.output_dir)
+        targets = [
+            (path, os.path.join(workdir, f"{i:04d}.{ext}"))
+            for i, path in enumerate(input_paths)
+        ]
 
-        images = []
-        for path in input_paths:
-            img = Image.open(path)
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            images.append(img)
+        futures = deque()
+        if executor is not None:
+            pending = iter(targets)
+
+            def submit(count):
+                for path, out in pending:
+                    futures.append(executor.submit(encode_batch_image, path, out, to_format, quality))
+                    count -= 1
+                    if count == 0:
+                        return
+
+            def encode_windowed():
+                submit(max(1, window))
+                while futures:
+                    result = cancel.wait(futures[0])
+                    futures.popleft()
+                    submit(1)
+                    yield result
+
+            results = encode_windowed()
+        else:
+            def encode_all():
+                for path, out in targets:
+                    cancel.check()
+                    yield encode_batch_image(path, out, to_format, quality)
 
-        # Save first image with append_images
-        images[0].save(
-            output,
-            "PDF",
-            resolution=100.0,
-            save_all=True,
-            append_images=images[1:] if len(images) > 1 else []
-        )
-        return output
+            results = encode_all()
+
+        try:
+            if to_format == "pdf":
+                output = self._out(name + "_combined", "pdf")
+                with JpegPdfWriter(output, dpi=100.0) as pdf:
+                    for i, (page, width, height, components) in enumerate(results, start=1):
+                        pdf.add_jpeg(page, width, height, components)
+                        os.remove(page)
+                        progress.report(i / len(targets))
+            else:
+                output = self._out(name + "_images", "zip")
+                # Already-compressed images: store, don't deflate
+                with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as zf:
+                    for i, (src, _) in enumerate(targets):
+                        encoded = next(results)[0]
+                        base = os.path.splitext(os.path.basename(src))[0]
+                        zf.write(encoded, f"{i + 1:03d}_{base}.{ext}")
+                        os.remove(encoded)
+                        progress.report((i + 1) / len(targets))
+            return output
+        finally:
+            for f in futures:
+                f.cancel()
+            shutil.rmtree(workdir, ignore_errors=True)
 
     # ==================================================
     # PDF → DOCX (WORD)
@@ -599,25 +723,10 @@ class MahaConvert:
     def office_to_pdf(self, input_path):
         """Convert Office documents (DOCX, PPTX, XLSX) to PDF using LibreOffice"""
         name = os.path.splitext(os.path.basename(input_path))[0]
-        
-        # LibreOffice outputs to the same directory by default
-        cmd = [
-            "libreoffice",
-            "--headless",
-            "--convert-to", "pdf",
-            "--outdir", self.output_dir,
-            input_path
-        ]
-        
-        try:
-            subprocess.run(cmd, check=True, capture_output=True, timeout=120)
-        except FileNotFoundError:
-            raise ValueError("LibreOffice not installed. Required for Office to PDF conversion.")
-        except subprocess.TimeoutExpired:
-            raise ValueError("Conversion timed out")
-
         output = self._out(name, "pdf")
-        return output
+
+        # Long-lived soffice pool (no startup per document)
+        return office_convert_to_pdf(input_path, output)
 
     # ==================================================
     # CSV → XLSX (EXCEL)
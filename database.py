@@ -1,76 +1,400 @@
-from supabase import create_client
-from config import SUPABASE_URL, SUPABASE_KEY
+import json
+from urllib.parse import quote
+from datetime import datetime, timedelta, timezone
+from config import (
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    JOBS_BACKEND,
+    SQLITE_PATH,
+    STORAGE_BACKEND,
+    SIGNED_URL_SECONDS
+)
+from local_db import SQLiteJobs, UNLEASED_STATUSES, utc_iso
+from storage import (
+    upload_stream,
+    upload_path,
+    download_stream,
+    read_head,
+    object_file,
+    copy_local,
+    remove_local
+)
+from events import get_events
+from cache import get_download_cache
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = None
+if SUPABASE_URL:
+    from supabase import create_client
+    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def create_job(filename, action, target, input_path, to_format=None):
-    res = supabase.table("jobs").insert({
+
+class SupabaseJobs:
+    """
+    `jobs` table on Supabase (same surface as local_db.SQLiteJobs)
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def _table(self):
+        return self.client.table("jobs")
+
+    def insert(self, row):
+        return self._table().insert(row).execute().data[0]
+
+    def insert_many(self, rows):
+        # One request, one statement
+        return self._table().insert(rows).execute().data if rows else []
+
+    def update(self, job_id, fields, unless_status=None, worker_id=None):
+        q = self._table().update(fields).eq("id", job_id)
+        if unless_status:
+            q = q.neq("status", unless_status)
+        if worker_id:
+            q = q.eq("worker_id", worker_id)
+        return bool(q.execute().data)
+
+    def get(self, job_id, columns="*"):
+        # None for an unknown id (.single() would raise instead)
+        res = self._table().select(columns).eq("id", job_id).limit(1).execute()
+        return res.data[0] if res.data else None
+
+    def list_by_status(self, status, limit=None, columns="*"):
+        q = self._table().select(columns).eq("status", status).order("created_at")
+        if limit:
+            q = q.limit(limit)
+        return q.execute().data
+
+    def list_by_ids(self, job_ids, columns="*"):
+        if not job_ids:
+            return []
+        return self._table().select(columns).in_("id", list(job_ids)).execute().data
+
+    def list_by_batch(self, batch_id, columns="*"):
+        return self._table().select(columns).eq("batch_id", batch_id).order("created_at").execute().data
+
+    def claim(self, job_id, worker_id, lease_expires_at, fields):
+        # Single UPDATE ... WHERE status = 'queued': only one worker
+        # gets the row back, everyone else gets an empty result
+        res = (
+            self._table()
+            .update({**fields, "worker_id": worker_id, "lease_expires_at": lease_expires_at})
+            .eq("id", job_id)
+            .eq("status", "queued")
+            .execute()
+        )
+        return res.data[0] if res.data else None
+
+    def renew(self, job_id, worker_id, lease_expires_at):
+        res = (
+            self._table()
+            .update({"lease_expires_at": lease_expires_at})
+            .eq("id", job_id)
+            .eq("worker_id", worker_id)
+            .execute()
+        )
+        return res.data[0] if res.data else None
+
+    def reclaim_expired(self, now):
+        res = (
+            self._table()
+            .update({
+                "status": "queued",
+                "progress": 0,
+                "worker_id": None,
+                "lease_expires_at": None
+            })
+            .lt("lease_expires_at", now)
+            .not_.in_("status", list(UNLEASED_STATUSES))
+            .execute()
+        )
+        return [r["id"] for r in res.data]
+
+    # Result cache index (`result_cache` table)
+    def cache_get(self, key):
+        res = self.client.table("result_cache").select("*").eq("key", key).execute()
+        return res.data[0] if res.data else None
+
+    def cache_put(self, key, output_path, size, now):
+        self.client.table("result_cache").upsert({
+            "key": key,
+            "output_path": output_path,
+            "size": size,
+            "hits": 0,
+            "last_used_at": now
+        }).execute()
+
+    def cache_touch(self, key, hits, now):
+        self.client.table("result_cache").update(
+            {"hits": hits, "last_used_at": now}
+        ).eq("key", key).execute()
+
+    def cache_entries(self, limit):
+        res = (
+            self.client.table("result_cache")
+            .select("key, output_path, size")
+            .order("last_used_at")
+            .limit(limit)
+            .execute()
+        )
+        return res.data
+
+    def cache_size(self):
+        # No SUM over PostgREST: add up the sizes a page at a time
+        # (responses are capped at 1000 rows). Only runs every
+        # RESULT_CACHE_SYNC_SECONDS per worker.
+        total, start, page = 0, 0, 1000
+        while True:
+            rows = (
+                self.client.table("result_cache")
+                .select("size")
+                .order("key")
+                .range(start, start + page - 1)
+                .execute()
+                .data
+            )
+            total += sum(r["size"] or 0 for r in rows)
+            if len(rows) < page:
+                return total
+            start += page
+
+    def cache_delete(self, keys):
+        self.client.table("result_cache").delete().in_("key", list(keys)).execute()
+
+
+if JOBS_BACKEND == "sqlite":
+    jobs_store = SQLiteJobs(SQLITE_PATH)
+else:
+    jobs_store = SupabaseJobs(supabase)
+
+
+# =========================
+# JOBS
+# =========================
+def _job_row(filename, action, target, input_path, to_format=None, input_hash=None,
+             mode="quality", memory_mb=None, inputs=None, batch_id=None,
+             input_kind=None, input_ext=None):
+    return {
         "filename": filename,
         "action": action,
         "target": target,
         "status": "queued",
         "progress": 0,
         "input_path": input_path,
-        "to_format": to_format
-    }).execute()
-    return res.data[0]
+        "to_format": to_format,
+        "input_hash": input_hash,
+        # detect.sniff of the upload: the worker schedules by it
+        "input_kind": input_kind,
+        "input_ext": input_ext,
+        "mode": mode,
+        "memory_mb": memory_mb,
+        # Batch jobs: every input's storage key (input_path is the first)
+        "inputs": json.dumps(inputs) if inputs else None,
+        "batch_id": batch_id
+    }
+
+def create_job(*args, **kwargs):
+    job = jobs_store.insert(_job_row(*args, **kwargs))
+    get_events().publish(job["id"], job)
+    return job
+
+def create_jobs(jobs, batch_id):
+    """
+    Bulk insert: `jobs` is a list of create_job kwargs, all tagged batch_id
+    """
+    rows = jobs_store.insert_many([_job_row(batch_id=batch_id, **job) for job in jobs])
+    events = get_events()
+    for row in rows:
+        events.publish(row["id"], row)
+    return rows
+
+def job_statuses(job_ids):
+    """
+    {job_id: status} for many jobs in one query
+    """
+    return {r["id"]: r["status"] for r in jobs_store.list_by_ids(job_ids, "id, status")}
+
+def list_batch_jobs(batch_id, columns="*"):
+    return jobs_store.list_by_batch(batch_id, columns)
 
 def update_job(job_id, **fields):
-    supabase.table("jobs").update(fields).eq("id", job_id).execute()
+    jobs_store.update(job_id, fields)
+    _updated(job_id, fields)
 
-def get_job(job_id):
-    res = supabase.table("jobs").select("*").eq("id", job_id).single().execute()
-    return res.data
+def update_running_job(job_id, worker_id, **fields):
+    """
+    update_job for a job `worker_id` is working on: never overwrites
+    "cancelled", and writes nothing once the lease went to someone else
+    (reclaimed / requeued). False if nothing was written.
+    """
+    if not jobs_store.update(job_id, fields, unless_status="cancelled", worker_id=worker_id):
+        return False
+    _updated(job_id, fields)
+    return True
+
+def _updated(job_id, fields):
+    # Status / progress go straight to /job/<id> readers in this process
+    get_events().publish(job_id, fields)
+    if "status" in fields or "output_path" in fields:
+        get_download_cache().invalidate(job_id)
+
+def get_job(job_id, columns="*"):
+    return jobs_store.get(job_id, columns)
 
 def cancel_job(job_id):
     update_job(job_id, status="cancelled")
 
-def upload_output(job_id, filepath):
+def list_queued_jobs(limit=None, columns="*"):
+    return jobs_store.list_by_status("queued", limit, columns)
+
+
+# =========================
+# CLAIM / LEASE
+# =========================
+def _lease_deadline(lease_seconds):
+    return utc_iso(datetime.now(timezone.utc) + timedelta(seconds=lease_seconds))
+
+def claim_job(job_id, worker_id, lease_seconds):
+    """
+    Atomically move a queued job to "Starting" for this worker.
+    Returns the claimed row, or None if it was already taken/cancelled.
+    """
+    fields = {"status": "Starting", "progress": 5}
+    claimed = jobs_store.claim(job_id, worker_id, _lease_deadline(lease_seconds), fields)
+    if claimed:
+        get_events().publish(job_id, fields)
+    return claimed
+
+def renew_lease(job_id, worker_id, lease_seconds):
+    """
+    Extend the lease. Returns {"id", "status"} or None if the lease
+    was lost (reclaimed by another worker).
+    """
+    return jobs_store.renew(job_id, worker_id, _lease_deadline(lease_seconds))
+
+def reclaim_expired_leases():
+    """
+    Requeue running jobs whose worker stopped renewing (crashed / killed)
+    """
+    reclaimed = jobs_store.reclaim_expired(utc_iso())
+    events = get_events()
+    for job_id in reclaimed:
+        events.publish(job_id, {"status": "queued", "progress": 0})
+    return reclaimed
+
+
+# =========================
+# STORAGE
+# =========================
+def upload_output(job_id, filepath, filename=None):
     import os
     ext = os.path.splitext(filepath)[1]
-    filename = f"{job_id}{ext}"
-    
-    with open(filepath, "rb") as f:
-        file_content = f.read()
-        supabase.storage.from_("mahaconvert-output").upload(
-            filename, file_content
-        )
-    update_job(job_id, output_path=filename)
+    filename = filename or f"{job_id}{ext}"
 
-def get_download_url(job_id):
-    import os
-    job = get_job(job_id)
-    
+    # Chunked upload: memory stays bounded for any output size.
+    # The caller sets output_path (with its lease-checked "done" write)
+    upload_path("mahaconvert-output", filename, filepath)
+    return filename
+
+def copy_output(src, dst):
+    """
+    Server-side copy inside the output bucket (nothing goes through here)
+    """
+    if STORAGE_BACKEND == "local":
+        copy_local("mahaconvert-output", src, dst)
+    else:
+        supabase.storage.from_("mahaconvert-output").copy(src, dst)
+    return dst
+
+def read_output_head(path, size):
+    return read_head("mahaconvert-output", path, size)
+
+def upload_dict(dict_id, filepath):
+    """
+    zstd dictionaries live next to the outputs that need them
+    (dicts/<id>.dict), so their .zst results can still be decoded
+    (by whoever has bucket access; downloads don't include them)
+    """
+    name = f"dicts/{dict_id}.dict"
+    upload_path("mahaconvert-output", name, filepath)
+    return name
+
+def _download_name(job):
     # Construct proper filename: original_name (without ext) + new_ext
+    import os
     original_name = os.path.splitext(job["filename"])[0]
     new_ext = os.path.splitext(job["output_path"])[1]
-    final_name = f"{original_name}{new_ext}"
+    return f"{original_name}{new_ext}"
+
+def attachment_url(signed_url, filename):
+    """
+    download=<name> on a signed URL makes storage answer with
+    Content-Disposition: attachment; filename=<name>. storage3 only sends
+    its `download` option in the sign request, not in the URL it returns.
+    """
+    sep = "&" if "?" in signed_url else "?"
+    return f"{signed_url}{sep}download={quote(filename)}"
+
+def get_download_url(job_id):
+    cache = get_download_cache()
+    cached = cache.get(job_id)
+    if cached:
+        job, url = cached
+        return url, _download_name(job)
+
+    job = get_job(job_id)
+    final_name = _download_name(job)
 
     url = supabase.storage.from_("mahaconvert-output").create_signed_url(
         job["output_path"], 
-        3600,
-        options={'download': final_name}
+        SIGNED_URL_SECONDS
     )
+    url["signedURL"] = attachment_url(url["signedURL"], final_name)
+    cache.put(job_id, job, url)
     return url, final_name
 
-def upload_file(file_obj, filename):
+def get_download_file(job_id):
     """
-    Upload input file to 'mahaconvert-uploads' bucket
+    Local storage: (path on disk, download name) of a job's output
     """
-    file_obj.seek(0)
-    file_content = file_obj.read()
-    res = supabase.storage.from_("mahaconvert-upload").upload(
-        path=filename,
-        file=file_content,
-        file_options={"content-type": "application/octet-stream", "x-upsert": "true"}
-    )
-    return res
+    cache = get_download_cache()
+    cached = cache.get(job_id, need_url=False)
+    if cached:
+        job = cached[0]
+    else:
+        job = get_job(job_id)
+        cache.put(job_id, job)
+    return object_file("mahaconvert-output", job["output_path"]), _download_name(job)
+
+def upload_file(source, filename):
+    """
+    Upload input file to 'mahaconvert-uploads' bucket.
+    `source` is a local path (spooled upload) or a seekable file object;
+    either way it is sent in chunks, never read whole into memory.
+    """
+    if isinstance(source, str):
+        return upload_path("mahaconvert-upload", filename, source)
 
-def download_file(bucket, path, local_path):
+    source.seek(0)
+    return upload_stream("mahaconvert-upload", filename, source)
+
+def download_file(bucket, path, local_path, parallel=None):
     """
-    Download file from Supabase to local path
+    Download file from Supabase to local path.
+    Streams to disk in chunks (retried ranges, parallel for big files).
     """
-    with open(local_path, 'wb+') as f:
-        res = supabase.storage.from_(bucket).download(path)
-        f.write(res)
+    return download_stream(bucket, path, local_path, parallel=parallel)
+
+
 
+def remove_outputs(paths):
+    """
+    Delete objects from the output bucket
+    """
+    if not paths:
+        return
+    get_download_cache().invalidate_paths(paths)
+    if STORAGE_BACKEND == "local":
+        remove_local("mahaconvert-output", paths)
+    else:
+        supabase.storage.from_("mahaconvert-output").remove(list(paths))
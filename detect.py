@@ -0,0 +1,273 @@
+import os
+import time
+import mimetypes
+
+# How much of the file we ever look at
+HEAD_SIZE = 4096
+
+# ==================================================
+# EXTENSION TABLE (fallback + tie-breaker)
+# ==================================================
+EXT_KINDS = {}
+for _kind, _exts in (
+    ("image", ("jpg", "jpeg", "png", "webp", "avif", "bmp", "heic", "heif", "tiff", "tif", "ico", "jxl", "svg", "gif")),
+    ("audio", ("mp3", "wav", "opus", "aac", "ogg", "flac", "m4a", "aiff", "aif", "wma", "mid", "midi", "weba")),
+    ("video", ("mp4", "webm", "mkv", "avi", "mov", "flv", "3gp", "3g2", "mpeg", "mpg", "ogv", "wmv")),
+    ("pdf", ("pdf",)),
+    ("archive", ("zip", "7z", "rar", "gz", "tar", "bz2", "xz")),
+    ("document", ("docx", "doc", "pptx", "ppt", "xlsx", "xls", "epub", "rtf")),
+    ("text", ("txt", "md", "markdown", "json", "xml", "csv", "html", "htm", "yaml", "yml", "log")),
+):
+    for _ext in _exts:
+        EXT_KINDS[_ext] = _kind
+
+# ==================================================
+# SIGNATURES AT OFFSET 0
+# ==================================================
+# (magic, kind, ext). Containers that need a second look (RIFF, ftyp,
+# zip, Ogg, EBML, OLE) are handled by the _sniff_* helpers below.
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image", "png"),
+    (b"\xff\xd8\xff", "image", "jpg"),
+    (b"GIF87a", "image", "gif"),
+    (b"GIF89a", "image", "gif"),
+    (b"II*\x00", "image", "tiff"),
+    (b"MM\x00*", "image", "tiff"),
+    (b"\x00\x00\x01\x00", "image", "ico"),
+    (b"\xff\x0a", "image", "jxl"),
+    (b"\x00\x00\x00\x0cJXL \r\n\x87\n", "image", "jxl"),
+    (b"%PDF-", "pdf", "pdf"),
+    (b"ID3", "audio", "mp3"),
+    (b"fLaC", "audio", "flac"),
+    (b"MThd", "audio", "mid"),
+    (b"#!AMR", "audio", "amr"),
+    (b"FLV\x01", "video", "flv"),
+    (b"\x00\x00\x01\xba", "video", "mpg"),
+    (b"\x00\x00\x01\xb3", "video", "mpg"),
+    (b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", "video", "wmv"),
+    (b"7z\xbc\xaf\x27\x1c", "archive", "7z"),
+    (b"Rar!\x1a\x07", "archive", "rar"),
+    (b"\x1f\x8b", "archive", "gz"),
+    (b"BZh", "archive", "bz2"),
+    (b"\xfd7zXZ\x00", "archive", "xz"),
+    (b"{\\rtf", "document", "rtf"),
+)
+
+# Precomputed: first byte -> candidates, longest magic first
+_TABLE = {}
+for _magic, _kind, _ext in sorted(SIGNATURES, key=lambda s: -len(s[0])):
+    _TABLE.setdefault(_magic[0], []).append((_magic, _kind, _ext))
+
+_FTYP_BRANDS = {
+    b"heic": ("image", "heic"), b"heix": ("image", "heic"), b"hevc": ("image", "heic"),
+    b"heim": ("image", "heic"), b"heis": ("image", "heic"), b"mif1": ("image", "heif"),
+    b"msf1": ("image", "heif"), b"avif": ("image", "avif"), b"avis": ("image", "avif"),
+    b"M4A ": ("audio", "m4a"), b"M4B ": ("audio", "m4a"), b"qt  ": ("video", "mov"),
+}
+
+_RIFF_TYPES = {
+    b"WAVE": ("audio", "wav"),
+    b"AVI ": ("video", "avi"),
+    b"WEBP": ("image", "webp"),
+}
+
+# Names for the same format; the file's own spelling is kept
+_ALIASES = {}
+for _group in (("jpg", "jpeg"), ("tif", "tiff"), ("heic", "heif"), ("aif", "aiff"),
+               ("mid", "midi"), ("mpg", "mpeg"), ("ogg", "opus"), ("mp4", "m4v", "mov")):
+    for _ext in _group:
+        _ALIASES[_ext] = _group
+
+# UTF-8 / UTF-16 byte order marks (FF FE also looks like an MPEG frame sync)
+_TEXT_BOMS = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")
+
+# Bytes that never show up in plain text
+_BINARY_BYTES = bytes(set(range(32)) - {7, 8, 9, 10, 12, 13, 27})
+
+
+# ==================================================
+# CONTAINERS
+# ==================================================
+def _sniff_ftyp(head, hint):
+    brand = head[8:12]
+    if brand in _FTYP_BRANDS:
+        return _FTYP_BRANDS[brand]
+    if brand.startswith(b"3g2"):
+        return "video", "3g2"
+    if brand.startswith(b"3gp"):
+        return "video", "3gp"
+    # Generic isom/mp42: audio-only if that's what the name says
+    if hint in ("m4a", "aac"):
+        return "audio", "m4a"
+    return "video", "mp4"
+
+
+def _sniff_zip(head, hint):
+    if head[30:58] == b"mimetypeapplication/epub+zip":
+        return "document", "epub"
+    for marker, ext in ((b"word/", "docx"), (b"xl/", "xlsx"), (b"ppt/", "pptx")):
+        if marker in head:
+            return "document", ext
+    # Office parts can sit past the first few KB
+    if hint in ("docx", "xlsx", "pptx", "epub"):
+        return "document", hint
+    return "archive", "zip"
+
+
+def _sniff_ogg(head):
+    if b"OpusHead" in head:
+        return "audio", "opus"
+    if b"\x80theora" in head:
+        return "video", "ogv"
+    return "audio", "ogg"
+
+
+def _sniff_ebml(head):
+    if b"webm" in head[:64]:
+        return "video", "webm"
+    return "video", "mkv"
+
+
+def _sniff_mpeg_audio(head):
+    # Frame sync alone (11 set bits) also matches the UTF-16LE BOM and
+    # other binary: the header's reserved values must be unused too
+    if len(head) < 4 or head[0] != 0xFF or head[1] & 0xE0 != 0xE0:
+        return None
+
+    if head[1] & 0x06 == 0:
+        # ADTS (AAC): 12-bit sync, sampling index 0-12
+        if head[1] & 0xF0 != 0xF0 or (head[2] >> 2) & 0x0F > 12:
+            return None
+        return "audio", "aac"
+
+    # MP3: version 01, bitrate index 1111 and sample rate 11 are reserved
+    if (head[1] >> 3) & 0x03 == 1 or head[2] >> 4 == 0x0F or (head[2] >> 2) & 0x03 == 3:
+        return None
+    return "audio", "mp3"
+
+
+def _sniff_text(head, hint):
+    if head.startswith(_TEXT_BOMS):
+        return "text", hint if EXT_KINDS.get(hint) == "text" else "txt"
+    if head.translate(None, _BINARY_BYTES) != head:
+        return None
+
+    start = head.lstrip()[:256].lower()
+    if start.startswith((b"<svg", b"<?xml")) and b"<svg" in head.lower():
+        return "image", "svg"
+    return "text", hint if EXT_KINDS.get(hint) == "text" else "txt"
+
+
+def sniff_bytes(head, hint=""):
+    """
+    (kind, ext) from the first bytes of a file, or None if nothing matched.
+    hint: the file's own extension, only used to break ties.
+    """
+    if not head:
+        return None
+
+    for magic, kind, ext in _TABLE.get(head[0], ()):
+        if head.startswith(magic):
+            return kind, ext
+
+    if head[4:8] == b"ftyp":
+        return _sniff_ftyp(head, hint)
+
+    prefix = head[:4]
+    if prefix == b"RIFF":
+        return _RIFF_TYPES.get(head[8:12])
+    if prefix == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "audio", "aiff"
+    if prefix == b"PK\x03\x04":
+        return _sniff_zip(head, hint)
+    if prefix == b"OggS":
+        return _sniff_ogg(head)
+    if prefix == b"\x1aE\xdf\xa3":
+        return _sniff_ebml(head)
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        # Legacy Office: which app needs the OLE directory, trust the name
+        return "document", hint if hint in ("doc", "xls", "ppt") else "doc"
+    if head.startswith(b"BM") and head[14:15] in (b"\x0c", b"(", b"8", b"l", b"|"):
+        return "image", "bmp"
+    if head[257:262] == b"ustar":
+        return "archive", "tar"
+    if b"%PDF-" in head[:1024]:
+        # Junk before the header is allowed by readers
+        return "pdf", "pdf"
+
+    if head.startswith(_TEXT_BOMS):
+        return _sniff_text(head, hint)
+    return _sniff_mpeg_audio(head) or _sniff_text(head, hint)
+
+
+# ==================================================
+# PUBLIC
+# ==================================================
+def name_ext(path):
+    return os.path.splitext(path)[1].lower().replace(".", "")
+
+
+def sniff(path, hint=None):
+    """
+    (kind, ext) for a file, from its content first and its name second.
+    kind: image / audio / video / pdf / archive / document / text / binary
+    hint: the original extension, for files saved under another name (spools)
+    """
+    hint = name_ext(path) if hint is None else hint.lower()
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEAD_SIZE)
+    except OSError:
+        head = b""
+
+    found = sniff_bytes(head, hint)
+    if found:
+        kind, ext = found
+        # Same format under another name (jpeg/jpg, tif/tiff, ...): keep the name
+        if hint in _ALIASES.get(ext, ()):
+            return kind, hint
+        return kind, ext
+
+    return by_name(path, hint)
+
+
+def by_name(path, hint=None):
+    """
+    (kind, ext) from the file name alone (nothing to read)
+    """
+    hint = name_ext(path) if hint is None else hint
+    if hint in EXT_KINDS:
+        return EXT_KINDS[hint], hint
+
+    mime, _ = mimetypes.guess_type(path)
+    if mime:
+        main = mime.split("/")[0]
+        if main in ("image", "audio", "video", "text"):
+            return main, hint
+        if mime == "application/pdf":
+            return "pdf", hint
+
+    return "binary", hint
+
+
+def detect_type(path):
+    return sniff(path)[0]
+
+
+if __name__ == "__main__":
+    # Per-file detection cost: python detect.py FILE [FILE ...]
+    import sys
+
+    paths = sys.argv[1:]
+    if not paths:
+        print("usage: python detect.py FILE [FILE ...]")
+        sys.exit(1)
+
+    rounds = 200
+    for path in paths:
+        sniff(path)  # warm the page cache
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = sniff(path)
+        micros = (time.perf_counter() - start) / rounds * 1e6
+        print(f"{micros:8.1f} us  {result[0]:<8} {result[1]:<5} {path}")
@@ -0,0 +1,127 @@
+import json
+import time
+import threading
+from config import REDIS_URL
+
+CHANNEL = "mahaconvert:jobs"
+
+# Listener reconnect backoff after a Redis error
+RECONNECT_MIN_SECONDS = 1
+RECONNECT_MAX_SECONDS = 30
+
+
+class LocalDispatcher:
+    """
+    In-process signal from app.upload to the worker thread.
+    notify(job) hands the new job row straight to the worker,
+    notify() with no job just wakes it (e.g. a slot freed up).
+    cancel(job_id) is passed to the on_cancel handlers (running jobs).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jobs = []
+        self._woken = False
+        self._cancel_handlers = []
+
+    def on_cancel(self, handler):
+        self._cancel_handlers.append(handler)
+
+    def cancel(self, job_id):
+        for handler in list(self._cancel_handlers):
+            try:
+                handler(job_id)
+            except Exception as e:
+                print(f"[ERROR] Cancel handler for {job_id}: {e}")
+
+    def notify(self, job=None):
+        with self._cond:
+            if job is not None:
+                self._jobs.append(job)
+            self._woken = True
+            self._cond.notify_all()
+
+    def wait(self, timeout):
+        """
+        Block until notified or timeout.
+        Returns the jobs pushed since the last call (may be empty).
+        """
+        with self._cond:
+            if not self._woken:
+                self._cond.wait(timeout)
+            jobs, self._jobs = self._jobs, []
+            self._woken = False
+            return jobs
+
+
+class RedisDispatcher(LocalDispatcher):
+    """
+    Same as LocalDispatcher, but notify() also publishes to Redis so
+    workers running in other processes / hosts are woken too.
+    """
+
+    def __init__(self, url):
+        super().__init__()
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def notify(self, job=None):
+        if job is None:
+            # Local wakeup only (slot freed in this process)
+            return super().notify()
+        self._redis.publish(CHANNEL, json.dumps(job, default=str))
+
+    def cancel(self, job_id):
+        # Every worker process hears it; only the one running the job acts
+        self._redis.publish(CHANNEL, json.dumps({"cancel": job_id}))
+
+    def wait(self, timeout):
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, daemon=True)
+            self._listener.start()
+        return super().wait(timeout)
+
+    def _listen(self):
+        # Connection errors resubscribe with backoff; meanwhile (and for
+        # anything published while disconnected) the fallback poll runs
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(CHANNEL)
+                delay = RECONNECT_MIN_SECONDS
+                for msg in pubsub.listen():
+                    self._handle(msg)
+            except Exception as e:
+                print(f"[ERROR] Dispatch listener: {e}, reconnecting in {delay}s")
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+            finally:
+                pubsub.close()
+
+    def _handle(self, msg):
+        try:
+            data = json.loads(msg["data"])
+            if "cancel" in data:
+                super().cancel(data["cancel"])
+            else:
+                super().notify(data)
+        except Exception as e:
+            print(f"[ERROR] Dispatch message: {e}")
+
+
+_dispatcher = None
+_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """
+    Shared dispatcher for this process:
+    Redis when REDIS_URL is set (remote workers), local otherwise.
+    """
+    global _dispatcher
+    with _lock:
+        if _dispatcher is None:
+            _dispatcher = RedisDispatcher(REDIS_URL) if REDIS_URL else LocalDispatcher()
+        return _dispatcher
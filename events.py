@@ -0,0 +1,116 @@
+import time
+import threading
+from config import STATUS_CACHE_TTL, STATUS_CACHE_KEEP_SECONDS
+
+# Job fields clients watch; everything else update_job writes is ignored
+WATCHED = ("status", "progress")
+
+
+class JobEvents:
+    """
+    In-process pub/sub of job status/progress, doubling as a short-TTL
+    status cache for /job/<id> and /job/<id>/events.
+
+    - the worker publishes every status/progress write (database.update_job),
+      and each one refreshes the entry; the database is only read when an
+      entry is older than `ttl` (a job in another process, or a long step
+      with no progress updates)
+    - so a job is read at most once per `ttl`, however many clients are
+      polling / subscribed
+    """
+
+    def __init__(self, ttl=STATUS_CACHE_TTL, keep_seconds=STATUS_CACHE_KEEP_SECONDS):
+        self.ttl = ttl
+        self.keep_seconds = keep_seconds
+        self._cond = threading.Condition()
+        # job_id -> [version, state, fresh_at]
+        self._jobs = {}
+        self._pruned_at = time.monotonic()
+
+    def publish(self, job_id, fields):
+        changes = {k: fields[k] for k in WATCHED if k in fields}
+        if not changes:
+            return
+        with self._cond:
+            # A partial update (e.g. progress only) never starts an entry:
+            # readers would get a state without a status. The next
+            # snapshot reads the whole row instead.
+            if job_id not in self._jobs and len(changes) < len(WATCHED):
+                return
+            self._set(job_id, changes)
+            self._prune()
+
+    def snapshot(self, job_id, load):
+        """
+        (version, state) for a job. `load(job_id)` (a DB read) only runs
+        when the cached state is older than ttl; state is None if the
+        job doesn't exist.
+        """
+        with self._cond:
+            entry = self._jobs.get(job_id)
+            if entry and time.monotonic() - entry[2] < self.ttl:
+                return entry[0], dict(entry[1])
+
+        row = load(job_id)
+        if not row:
+            return (entry[0] if entry else 0), None
+
+        with self._cond:
+            entry = self._set(job_id, {k: row.get(k) for k in WATCHED}, replace=True)
+            self._prune()
+            return entry[0], dict(entry[1])
+
+    def wait(self, job_id, version, timeout):
+        """
+        Block until the job's state moves past `version`, or timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                entry = self._jobs.get(job_id)
+                if entry and entry[0] != version:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+    def _set(self, job_id, changes, replace=False):
+        # Caller holds the lock. Only a real change bumps the version
+        # (and wakes subscribers); a re-read just refreshes the TTL.
+        now = time.monotonic()
+        entry = self._jobs.get(job_id)
+        if entry is None:
+            entry = self._jobs[job_id] = [1, dict(changes), now]
+            self._cond.notify_all()
+            return entry
+
+        state = dict(changes) if replace else {**entry[1], **changes}
+        entry[2] = now
+        if state != entry[1]:
+            entry[0] += 1
+            entry[1] = state
+            self._cond.notify_all()
+        return entry
+
+    def _prune(self):
+        # Caller holds the lock
+        now = time.monotonic()
+        if now - self._pruned_at < self.keep_seconds:
+            return
+        self._pruned_at = now
+        stale = [j for j, e in self._jobs.items() if now - e[2] > self.keep_seconds]
+        for job_id in stale:
+            del self._jobs[job_id]
+
+
+_events = None
+_lock = threading.Lock()
+
+
+def get_events():
+    global _events
+    with _lock:
+        if _events is None:
+            _events = JobEvents()
+        return _events
@@ -0,0 +1,145 @@
+import os
+import shutil
+import threading
+import cancel
+import progress
+from pypdf import PdfReader
+from procs import run_command, CommandTimeout
+from config import (
+    GS_MAX_PROCS,
+    GS_TIMEOUT,
+    GS_MIN_IMAGE_PIXELS
+)
+
+# At most GS_MAX_PROCS gs processes at once (per worker process)
+_slots = threading.BoundedSemaphore(GS_MAX_PROCS)
+
+_stats_lock = threading.Lock()
+_stats = {"jobs": 0, "skipped": 0, "bytes_saved": 0, "cpu_seconds": 0.0}
+
+
+# ==================================================
+# QUICK SCAN
+# ==================================================
+def _xobjects(resources):
+    if not resources:
+        return []
+    xobjs = resources.get_object().get("/XObject")
+    if not xobjs:
+        return []
+    return [ref.get_object() for ref in xobjs.get_object().values()]
+
+
+def has_large_images(path, min_pixels=GS_MIN_IMAGE_PIXELS, max_pages=300):
+    """
+    True if any page holds an image of at least min_pixels.
+    Reads only object dictionaries (no stream decoding), so it is cheap.
+    Unreadable / huge files answer True and go to gs as before.
+    """
+    try:
+        reader = PdfReader(path)
+        for i, page in enumerate(reader.pages):
+            if i >= max_pages:
+                return True
+            pending = _xobjects(page.get("/Resources"))
+            while pending:
+                x = pending.pop()
+                subtype = x.get("/Subtype")
+                if subtype == "/Image":
+                    if int(x.get("/Width", 0)) * int(x.get("/Height", 0)) >= min_pixels:
+                        return True
+                elif subtype == "/Form":
+                    pending.extend(_xobjects(x.get("/Resources")))
+        return False
+    except Exception:
+        return True
+
+
+# ==================================================
+# COMPRESS
+# ==================================================
+def compress_pdf(input_path, output, dpi, skip_check=True):
+    """
+    Ghostscript pdfwrite with image downsampling to `dpi`.
+    - skips gs when the PDF has no large images (copies the original)
+    - keeps the original when gs output isn't smaller
+    - bounded concurrency (GS_MAX_PROCS) and a per-job timeout; pdfwrite
+      is single-threaded, parallelism comes from running several gs at once
+    """
+    in_size = os.path.getsize(input_path)
+
+    if skip_check and not has_large_images(input_path):
+        shutil.copyfile(input_path, output)
+        _record(0, 0.0, skipped=True)
+        return output
+
+    cmd = [
+        "gs",
+        "-sDEVICE=pdfwrite",
+        "-dCompatibilityLevel=1.4",
+        "-dPDFSETTINGS=/screen",
+        f"-dColorImageResolution={dpi}",
+        f"-dGrayImageResolution={dpi}",
+        f"-dMonoImageResolution={dpi}",
+        "-dNOPAUSE",
+        "-dBATCH",
+        f"-sOutputFile={output}",
+        input_path
+    ]
+
+    # Without -dQUIET gs prints "Processing pages 1 through N." then
+    # "Page i" as it goes: that's the job's progress
+    pages = {"total": 0}
+
+    def on_line(line):
+        if line.startswith(b"Processing pages ") and b" through " in line:
+            pages["total"] = int(line.rsplit(b" ", 1)[1].rstrip(b".\r\n"))
+        elif line.startswith(b"Page ") and pages["total"]:
+            progress.report(int(line[5:].strip()) / pages["total"])
+
+    _take_slot()
+    try:
+        cpu = run_command(cmd, timeout=GS_TIMEOUT, on_line=on_line)
+    except CommandTimeout:
+        raise ValueError("PDF compression timed out")
+    finally:
+        _slots.release()
+
+    out_size = os.path.getsize(output)
+    if out_size >= in_size:
+        # Recompression made it bigger: hand back the original
+        shutil.copyfile(input_path, output)
+        out_size = in_size
+
+    _record(in_size - out_size, cpu)
+    print(f"[PDF] {os.path.basename(input_path)}: saved {in_size - out_size} bytes "
+          f"in {cpu:.2f} cpu-s")
+    return output
+
+
+def _take_slot():
+    # A cancelled / timed-out job stops waiting instead of running gs late
+    while True:
+        cancel.check()
+        if _slots.acquire(timeout=cancel.POLL_SECONDS):
+            return
+
+
+def _record(saved, cpu, skipped=False):
+    with _stats_lock:
+        _stats["jobs"] += 1
+        _stats["skipped"] += int(skipped)
+        _stats["bytes_saved"] += saved
+        _stats["cpu_seconds"] += cpu
+
+
+def stats():
+    """
+    Totals for this process, incl. bytes saved per gs CPU-second
+    """
+    with _stats_lock:
+        out = dict(_stats)
+    out["bytes_saved_per_cpu_second"] = (
+        int(out["bytes_saved"] / out["cpu_seconds"]) if out["cpu_seconds"] else 0
+    )
+    return out
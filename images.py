@@ -0,0 +1,88 @@
+import math
+from PIL import Image
+from config import IMAGE_MEMORY_BUDGET_MB
+
+# Decoded bytes per pixel, by Pillow mode
+_MODE_BYTES = {
+    "1": 1, "L": 1, "P": 1,
+    "LA": 2, "PA": 2, "I;16": 2,
+    "RGB": 3, "YCbCr": 3, "LAB": 3, "HSV": 3,
+    "RGBA": 4, "RGBX": 4, "CMYK": 4, "I": 4, "F": 4,
+}
+
+MB = 1024 * 1024
+
+
+def decoded_bytes(img, mode=None):
+    w, h = img.size
+    return w * h * _MODE_BYTES.get(mode or img.mode, 4)
+
+
+def open_header(path):
+    """
+    Image.open, except that a decompression bomb is read as a plain
+    header: the per-job memory budget is the check here. Pillow's
+    MAX_IMAGE_PIXELS is left alone for every other Image.open.
+    """
+    try:
+        return Image.open(path)
+    except Image.DecompressionBombError:
+        pass
+
+    # Same plugin lookup as Image.open, minus the pixel-count check
+    with open(path, "rb") as f:
+        prefix = f.read(16)
+    for fmt in Image.ID:
+        factory, accept = Image.OPEN[fmt]
+        result = accept(prefix) if accept else True
+        if result and not isinstance(result, str):
+            return factory(path)
+    raise Image.UnidentifiedImageError(f"cannot identify image file {path!r}")
+
+
+def estimate_mb(path):
+    """
+    Peak memory (MB) re-encoding this image will take: the decoded image
+    plus one converted copy, capped at the per-job budget.
+    Reads the header only. 0 if it isn't an image.
+    """
+    try:
+        with open_header(path) as img:
+            need = decoded_bytes(img) + decoded_bytes(img, "RGB")
+    except Exception:
+        return 0
+    return min(IMAGE_MEMORY_BUDGET_MB, math.ceil(need / MB))
+
+
+def open_image(path, modes=None, budget_mb=IMAGE_MEMORY_BUDGET_MB):
+    """
+    Open an image for re-encoding, in one of `modes` (None = any).
+
+    - anything over budget is refused up front instead of taking
+      the worker down
+    - the mode conversion (one extra copy) only happens when needed;
+      a JPEG decoder produces L / RGB itself
+    """
+    img = open_header(path)
+    mode = img.mode if not modes or img.mode in modes else ("RGB" if "RGB" in modes else modes[0])
+
+    if img.format == "JPEG" and mode in ("RGB", "L"):
+        # Full size, only the decoder's output mode changes
+        img.draft(mode, img.size)
+
+    need = decoded_bytes(img) + (decoded_bytes(img, mode) if mode != img.mode else 0)
+    budget = budget_mb * MB
+    if need > budget:
+        img.close()
+        raise ValueError(
+            f"Image too large: {img.size[0]}x{img.size[1]} needs ~{need // MB} MB, "
+            f"budget is {budget_mb} MB"
+        )
+
+    if img.mode != mode:
+        try:
+            img = img.convert(mode)
+        except ValueError:
+            # Float / 32-bit int images: go through 8-bit grayscale
+            img = img.convert("L").convert(mode)
+    return img
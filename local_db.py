@@ -0,0 +1,236 @@
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+
+# Statuses no worker holds a lease for (waiting or finished);
+# reclaim_expired skips jobs in these
+UNLEASED_STATUSES = ("queued", "done", "error", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id               TEXT PRIMARY KEY,
+    filename         TEXT,
+    action           TEXT,
+    target           INTEGER,
+    status           TEXT,
+    progress         INTEGER DEFAULT 0,
+    input_path       TEXT,
+    output_path      TEXT,
+    to_format        TEXT,
+    worker_id        TEXT,
+    lease_expires_at TEXT,
+    input_hash       TEXT,
+    input_kind       TEXT,
+    input_ext        TEXT,
+    mode             TEXT DEFAULT 'quality',
+    zstd_dict_id     INTEGER,
+    media_info       TEXT,
+    memory_mb        INTEGER,
+    inputs           TEXT,
+    batch_id         TEXT,
+    created_at       TEXT
+);
+
+CREATE INDEX IF NOT EXISTS jobs_batch_id ON jobs (batch_id);
+
+CREATE TABLE IF NOT EXISTS result_cache (
+    key              TEXT PRIMARY KEY,
+    output_path      TEXT,
+    size             INTEGER,
+    hits             INTEGER DEFAULT 0,
+    last_used_at     TEXT
+);
+"""
+
+
+def utc_iso(dt=None):
+    """
+    Fixed-width UTC timestamp, so string comparison == time comparison
+    """
+    dt = dt or datetime.now(timezone.utc)
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+class SQLiteJobs:
+    """
+    Local stand-in for the Supabase `jobs` table.
+    Same method surface as database.SupabaseJobs, so workers and
+    claim/lease logic can run without Supabase (":memory:" or a file).
+    """
+
+    def __init__(self, path=":memory:"):
+        self._conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def _one(self, sql, params):
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return dict(row) if row else None
+
+    def _all(self, sql, params):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(r) for r in rows]
+
+    # ==================================================
+    # CRUD
+    # ==================================================
+    @staticmethod
+    def _new_row(row):
+        row = dict(row)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", utc_iso())
+        return row
+
+    def insert(self, row):
+        row = self._new_row(row)
+        cols = ", ".join(row)
+        marks = ", ".join("?" for _ in row)
+        return self._one(
+            f"INSERT INTO jobs ({cols}) VALUES ({marks}) RETURNING *",
+            list(row.values())
+        )
+
+    def insert_many(self, rows):
+        """
+        All rows in one transaction (rows share the same columns)
+        """
+        rows = [self._new_row(r) for r in rows]
+        if not rows:
+            return []
+        cols = list(rows[0])
+        sql = (
+            f"INSERT INTO jobs ({', '.join(cols)}) "
+            f"VALUES ({', '.join('?' for _ in cols)}) RETURNING *"
+        )
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                out = [dict(self._conn.execute(sql, [r[c] for c in cols]).fetchone()) for r in rows]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return out
+
+    def update(self, job_id, fields, unless_status=None, worker_id=None):
+        """
+        Returns False if no row was written (with unless_status:
+        the job is in that status, e.g. cancelled meanwhile; with
+        worker_id: the job is no longer leased to that worker)
+        """
+        if not fields:
+            return True
+        sets = ", ".join(f"{k} = ?" for k in fields)
+        sql = f"UPDATE jobs SET {sets} WHERE id = ?"
+        params = [*fields.values(), job_id]
+        if unless_status:
+            sql += " AND status != ?"
+            params.append(unless_status)
+        if worker_id:
+            sql += " AND worker_id = ?"
+            params.append(worker_id)
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount > 0
+
+    def get(self, job_id, columns="*"):
+        return self._one(f"SELECT {columns} FROM jobs WHERE id = ?", [job_id])
+
+    def list_by_status(self, status, limit=None, columns="*"):
+        sql = f"SELECT {columns} FROM jobs WHERE status = ? ORDER BY created_at"
+        params = [status]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._all(sql, params)
+
+    def list_by_ids(self, job_ids, columns="*"):
+        if not job_ids:
+            return []
+        marks = ", ".join("?" for _ in job_ids)
+        return self._all(f"SELECT {columns} FROM jobs WHERE id IN ({marks})", list(job_ids))
+
+    def list_by_batch(self, batch_id, columns="*"):
+        return self._all(
+            f"SELECT {columns} FROM jobs WHERE batch_id = ? ORDER BY created_at",
+            [batch_id]
+        )
+
+    # ==================================================
+    # CLAIM / LEASE
+    # ==================================================
+    def claim(self, job_id, worker_id, lease_expires_at, fields):
+        """
+        Compare-and-set queued -> claimed. Returns the row, or None
+        if another worker got there first.
+        """
+        fields = {**fields, "worker_id": worker_id, "lease_expires_at": lease_expires_at}
+        sets = ", ".join(f"{k} = ?" for k in fields)
+        return self._one(
+            f"UPDATE jobs SET {sets} WHERE id = ? AND status = 'queued' RETURNING *",
+            [*fields.values(), job_id]
+        )
+
+    def renew(self, job_id, worker_id, lease_expires_at):
+        return self._one(
+            "UPDATE jobs SET lease_expires_at = ? "
+            "WHERE id = ? AND worker_id = ? RETURNING id, status",
+            [lease_expires_at, job_id, worker_id]
+        )
+
+    def reclaim_expired(self, now):
+        marks = ", ".join("?" for _ in UNLEASED_STATUSES)
+        rows = self._all(
+            "UPDATE jobs SET status = 'queued', progress = 0, "
+            "worker_id = NULL, lease_expires_at = NULL "
+            f"WHERE lease_expires_at < ? AND status NOT IN ({marks}) "
+            "RETURNING id",
+            [now, *UNLEASED_STATUSES]
+        )
+        return [r["id"] for r in rows]
+
+    # ==================================================
+    # RESULT CACHE INDEX
+    # ==================================================
+    def cache_get(self, key):
+        return self._one("SELECT * FROM result_cache WHERE key = ?", [key])
+
+    def cache_put(self, key, output_path, size, now):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache "
+                "(key, output_path, size, hits, last_used_at) VALUES (?, ?, ?, 0, ?)",
+                [key, output_path, size, now]
+            )
+
+    def cache_touch(self, key, hits, now):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE result_cache SET hits = ?, last_used_at = ? WHERE key = ?",
+                [hits, now, key]
+            )
+
+    def cache_entries(self, limit):
+        """
+        Up to `limit` entries, least recently used first
+        """
+        return self._all(
+            "SELECT key, output_path, size FROM result_cache ORDER BY last_used_at LIMIT ?",
+            [limit]
+        )
+
+    def cache_size(self):
+        return self._one("SELECT COALESCE(SUM(size), 0) AS total FROM result_cache", [])["total"]
+
+    def cache_delete(self, keys):
+        marks = ", ".join("?" for _ in keys)
+        with self._lock:
+            self._conn.execute(f"DELETE FROM result_cache WHERE key IN ({marks})", list(keys))
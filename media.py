@@ -0,0 +1,445 @@
+import os
+import glob
+import shutil
+import tempfile
+import threading
+import subprocess
+import ffmpeg
+import progress
+import cancel
+from procs import run_command
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    CPU_COUNT,
+    WORKER_TYPE_LIMITS,
+    VIDEO_SEGMENTED,
+    VIDEO_SEGMENT_SECONDS,
+    VIDEO_SEGMENT_MIN_SECONDS
+)
+
+# x264 presets, fastest first
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow"]
+
+# Codecs each container takes as-is (None = anything goes)
+CONTAINER_CODECS = {
+    "mp4": ({"h264", "hevc", "av1", "mpeg4"}, {"aac", "mp3", "alac", "opus"}),
+    "mov": ({"h264", "hevc", "mpeg4", "prores", "mjpeg"}, {"aac", "mp3", "alac", "pcm_s16le"}),
+    "mkv": (None, None),
+    "webm": ({"vp8", "vp9", "av1"}, {"opus", "vorbis"}),
+    "avi": ({"mpeg4", "h264", "mjpeg"}, {"mp3", "pcm_s16le", "ac3"}),
+}
+
+# Audio output extension -> (ffmpeg encoder, ffprobe codec name)
+AUDIO_CODECS = {
+    "mp3": ("libmp3lame", "mp3"),
+    "aac": ("aac", "aac"),
+    "m4a": ("aac", "aac"),
+    "opus": ("libopus", "opus"),
+    "weba": ("libopus", "opus"),
+    "ogg": ("libvorbis", "vorbis"),
+    "flac": ("flac", "flac"),
+    "wav": ("pcm_s16le", "pcm_s16le"),
+    "aiff": ("pcm_s16be", "pcm_s16be"),
+    "aif": ("pcm_s16be", "pcm_s16be"),
+    "wma": ("wmav2", "wmav2"),
+}
+
+# Encoders where a bitrate means nothing
+LOSSLESS_AUDIO = {"flac", "pcm_s16le", "pcm_s16be"}
+
+# Probe results by (path, size, mtime), so routing + encoding share one ffprobe
+_probe_cache = OrderedDict()
+_probe_lock = threading.Lock()
+PROBE_CACHE_SIZE = 256
+
+
+# ==================================================
+# PROBE
+# ==================================================
+def _probe_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def remember(path, info):
+    """
+    Seed the probe cache (e.g. with media_info saved on the job row)
+    """
+    with _probe_lock:
+        _probe_cache[_probe_key(path)] = info
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+
+
+def probe(path):
+    """
+    One ffprobe call per file, reduced to the fields routing / encoding needs.
+    Returns None if the file can't be probed.
+    """
+    try:
+        key = _probe_key(path)
+    except OSError:
+        return None
+
+    with _probe_lock:
+        if key in _probe_cache:
+            _probe_cache.move_to_end(key)
+            return _probe_cache[key]
+
+    info = _ffprobe(path)
+    if info is not None:
+        remember(path, info)
+    return info
+
+
+def _ffprobe(path):
+    try:
+        raw = ffmpeg.probe(path)
+    except (ffmpeg.Error, OSError):
+        return None
+
+    fmt = raw.get("format", {})
+    streams = raw.get("streams", [])
+    # Cover art shows up as a video stream; it isn't one for routing
+    video = next((s for s in streams if s.get("codec_type") == "video"
+                  and not s.get("disposition", {}).get("attached_pic")), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    def num(value, cast=float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "format": fmt.get("format_name"),
+        "duration": num(fmt.get("duration")),
+        "bitrate": num(fmt.get("bit_rate"), int),
+        "vcodec": video.get("codec_name") if video else None,
+        "width": num(video.get("width"), int) if video else None,
+        "height": num(video.get("height"), int) if video else None,
+        "acodec": audio.get("codec_name") if audio else None,
+        "audio_bitrate": num(audio.get("bit_rate"), int) if audio else None,
+        "pix_fmt": video.get("pix_fmt") if video else None,
+        "streams": [s.get("codec_type") for s in streams],
+    }
+
+
+# ==================================================
+# RUN
+# ==================================================
+def run_ffmpeg(stream, duration=None):
+    """
+    Run an ffmpeg-python graph (like .run(quiet=True)).
+    With a job progress reporter active, ffmpeg's -progress output is
+    turned into progress over the input's duration.
+    Raises ffmpeg.Error on failure.
+    """
+    cmd = stream.compile()
+    on_line = None
+
+    if progress.current() is not None:
+        if duration is None and "-i" in cmd:
+            # Probe is cached: no extra ffprobe for the job's own input
+            info = probe(cmd[cmd.index("-i") + 1])
+            duration = info.get("duration") if info else None
+        if duration:
+            cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+
+            def on_line(line):
+                if line.startswith(b"out_time_us="):
+                    value = line[12:].strip()
+                    if value.isdigit():
+                        progress.report(int(value) / 1e6 / duration)
+
+    try:
+        run_command(cmd, on_line=on_line)
+    except subprocess.CalledProcessError as e:
+        raise ffmpeg.Error(cmd[0], None, e.stderr)
+
+
+# ==================================================
+# ROUTING
+# ==================================================
+def can_remux(info, container):
+    """
+    True if the first video + audio streams fit `container` without re-encoding
+    """
+    if not info or not info.get("vcodec") or container not in CONTAINER_CODECS:
+        return False
+
+    vcodecs, acodecs = CONTAINER_CODECS[container]
+    if vcodecs is not None and info["vcodec"] not in vcodecs:
+        return False
+    if info.get("acodec") and acodecs is not None and info["acodec"] not in acodecs:
+        return False
+    # Players choke on 10-bit / 4:4:4 H.264 in mp4
+    if container == "mp4" and info["vcodec"] == "h264" and info.get("pix_fmt") not in ("yuv420p", "yuvj420p"):
+        return False
+    return True
+
+
+def remux(input_path, output, info):
+    """
+    Change container only: first video + audio stream, stream copy
+    """
+    inp = ffmpeg.input(input_path)
+    streams = [inp["v:0"]]
+    if info.get("acodec"):
+        streams.append(inp["a:0"])
+
+    extra = {}
+    if output.endswith((".mp4", ".mov")):
+        extra["movflags"] = "+faststart"
+
+    run_ffmpeg(
+        ffmpeg
+        .output(*streams, output, c="copy", **extra)
+        .overwrite_output()
+    )
+    return output
+
+
+def bitrate_to_int(bitrate):
+    """
+    "128k" -> 128000
+    """
+    bitrate = str(bitrate).lower()
+    if bitrate.endswith("k"):
+        return int(float(bitrate[:-1]) * 1000)
+    if bitrate.endswith("m"):
+        return int(float(bitrate[:-1]) * 1000000)
+    return int(bitrate)
+
+
+def already_below(info, codec, bitrate):
+    """
+    Source audio already uses `codec` at or under `bitrate`: re-encoding
+    can't make it better, only lossier
+    """
+    if not info or info.get("vcodec") or info.get("acodec") != codec:
+        return False
+    source = info.get("audio_bitrate") or info.get("bitrate")
+    return bool(source) and source <= bitrate_to_int(bitrate)
+
+
+# ==================================================
+# VIDEO ENCODE POLICY
+# ==================================================
+def video_policy(info, crf, queue_depth=0):
+    """
+    Pick x264 preset / CRF / threads for one encode.
+
+    - preset: slower (smaller files) for short inputs on an idle queue,
+      faster as the input gets longer or the queue gets deeper
+    - crf: base CRF nudged by resolution (small frames show artifacts
+      sooner, 4K hides them)
+    - threads: whole machine when idle, a share of it when several
+      video jobs run side by side
+    """
+    if not info or not info.get("height"):
+        return {"preset": "veryfast", "crf": crf, "threads": 0}
+
+    height = info["height"]
+    width = info.get("width") or height * 16 // 9
+    duration = info.get("duration") or 60
+
+    # Cost in "seconds of 1080p"
+    work = duration * (width * height) / (1920 * 1080)
+
+    if work <= 60:
+        idx = PRESETS.index("medium")
+    elif work <= 600:
+        idx = PRESETS.index("fast")
+    elif work <= 1800:
+        idx = PRESETS.index("faster")
+    else:
+        idx = PRESETS.index("veryfast")
+
+    # Each queued job waiting pushes us one step faster
+    idx = max(0, idx - queue_depth)
+
+    if height <= 480:
+        crf -= 2
+    elif height >= 2160:
+        crf += 2
+    crf = min(51, max(0, crf))
+
+    video_slots = WORKER_TYPE_LIMITS.get("video", 1)
+    threads = CPU_COUNT if queue_depth == 0 else max(1, CPU_COUNT // video_slots)
+    # x264 gains little from more threads than ~1 per 64 rows
+    threads = max(1, min(threads, height // 64))
+
+    return {"preset": PRESETS[idx], "crf": crf, "threads": threads}
+
+
+# ==================================================
+# H.264 ENCODE (SINGLE OR SEGMENT-PARALLEL)
+# ==================================================
+def encode_h264(input_path, output, policy, audio_bitrate="128k", info=None):
+    """
+    libx264 + AAC encode with the given policy.
+    Long videos go through encode_segmented, short ones through one ffmpeg.
+    """
+    if info is None:
+        info = probe(input_path)
+
+    duration = (info or {}).get("duration") or 0
+    if VIDEO_SEGMENTED and info and info.get("vcodec") and duration >= VIDEO_SEGMENT_MIN_SECONDS:
+        try:
+            return encode_segmented(input_path, output, policy, audio_bitrate, info)
+        except ffmpeg.Error as e:
+            # Odd inputs (broken keyframes, weird containers): one-shot encode
+            print(f"[WARN] Segmented encode failed, falling back: {e}")
+
+    run_ffmpeg(
+        ffmpeg
+        .input(input_path)
+        .output(
+            output,
+            vcodec="libx264",
+            crf=policy["crf"],
+            preset=policy["preset"],
+            threads=policy["threads"],
+            acodec="aac",
+            audio_bitrate=audio_bitrate
+        )
+        .overwrite_output()
+    )
+    return output
+
+
+def encode_segmented(input_path, output, policy, audio_bitrate, info):
+    """
+    1. split the video stream at keyframes (stream copy, no decode)
+    2. encode segments in parallel ffmpeg processes, audio in one more
+    3. concat segments + audio losslessly (stream copy)
+    """
+    workdir = tempfile.mkdtemp(prefix="seg-", dir=os.path.dirname(output) or ".")
+    try:
+        with progress.span(0, 0.05):
+            run_ffmpeg(
+                ffmpeg
+                .input(input_path)
+                .output(
+                    os.path.join(workdir, "src_%04d.mkv"),
+                    map="0:v:0",
+                    c="copy",
+                    f="segment",
+                    segment_time=VIDEO_SEGMENT_SECONDS,
+                    reset_timestamps=1
+                )
+                .overwrite_output()
+            )
+        sources = sorted(glob.glob(os.path.join(workdir, "src_*.mkv")))
+
+        total_threads = policy["threads"] or CPU_COUNT
+        parallel = max(1, min(len(sources), total_threads // 2 or 1))
+        seg_threads = max(1, total_threads // parallel)
+
+        # Pool threads don't inherit context: pass the job's cancel token on
+        token = cancel.current()
+
+        def encode_segment(src):
+            dst = os.path.join(workdir, os.path.basename(src).replace("src_", "enc_"))
+            with cancel.scope(token):
+                run_ffmpeg(
+                    ffmpeg
+                    .input(src)
+                    .output(
+                        dst,
+                        vcodec="libx264",
+                        crf=policy["crf"],
+                        preset=policy["preset"],
+                        threads=seg_threads
+                    )
+                    .overwrite_output()
+                )
+            return dst
+
+        def encode_audio():
+            dst = os.path.join(workdir, "audio.m4a")
+            with cancel.scope(token):
+                run_ffmpeg(
+                    ffmpeg
+                    .input(input_path)
+                    .output(dst, vn=None, acodec="aac", audio_bitrate=audio_bitrate)
+                    .overwrite_output()
+                )
+            return dst
+
+        with ThreadPoolExecutor(max_workers=parallel + 1) as pool:
+            audio_future = pool.submit(encode_audio) if info.get("acodec") else None
+            # Segments run in pool threads; progress = segments finished
+            encoded = []
+            with progress.span(0.05, 0.95):
+                for dst in pool.map(encode_segment, sources):
+                    encoded.append(dst)
+                    progress.report(len(encoded) / len(sources))
+            audio = audio_future.result() if audio_future else None
+
+        listing = os.path.join(workdir, "list.txt")
+        with open(listing, "w") as f:
+            for seg in encoded:
+                f.write(f"file '{os.path.abspath(seg)}'\n")
+
+        video = ffmpeg.input(listing, f="concat", safe=0)
+        streams = [video["v"]]
+        if audio:
+            streams.append(ffmpeg.input(audio)["a"])
+
+        with progress.span(0.95, 1):
+            run_ffmpeg(
+                ffmpeg
+                .output(*streams, output, c="copy")
+                .overwrite_output(),
+                duration=info.get("duration")
+            )
+        return output
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ==================================================
+# AUDIO (ONE STREAMING FFMPEG)
+# ==================================================
+def encode_audio(input_path, output, to_format, bitrate="128k", info=None):
+    """
+    First audio stream -> `to_format`, in one ffmpeg process (samples never
+    pass through Python). Stream copy when the source already has the
+    target codec.
+    """
+    if to_format not in AUDIO_CODECS:
+        raise ValueError("Unsupported audio format")
+    encoder, codec = AUDIO_CODECS[to_format]
+
+    if info is None:
+        info = probe(input_path)
+    if info and not info.get("acodec"):
+        raise ValueError("No audio stream found")
+
+    if info and info.get("acodec") == codec:
+        try:
+            run_ffmpeg(
+                ffmpeg
+                .input(input_path)
+                .output(output, map="0:a:0", vn=None, acodec="copy")
+                .overwrite_output()
+            )
+            return output
+        except ffmpeg.Error as e:
+            # Some containers won't take the copied stream as-is
+            print(f"[WARN] Audio stream copy failed, re-encoding: {e}")
+
+    extra = {}
+    if encoder not in LOSSLESS_AUDIO:
+        extra["audio_bitrate"] = bitrate
+
+    run_ffmpeg(
+        ffmpeg
+        .input(input_path)
+        .output(output, map="0:a:0", vn=None, acodec=encoder, **extra)
+        .overwrite_output()
+    )
+    return output
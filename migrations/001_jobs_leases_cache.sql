@@ -0,0 +1,46 @@
+-- Columns and tables the worker expects on top of the original `jobs`
+-- table (id, filename, action, target, status, progress, input_path,
+-- output_path, to_format, created_at). Mirrors local_db.SCHEMA.
+-- Safe to run more than once.
+
+-- Worker leases: claim / renew / reclaim_expired
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS worker_id        text;
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS lease_expires_at timestamptz;
+
+-- Result cache: key of the input and its conversion options
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS input_hash       text;
+
+CREATE TABLE IF NOT EXISTS result_cache (
+    key              text PRIMARY KEY,
+    output_path      text,
+    size             bigint,
+    hits             integer DEFAULT 0,
+    last_used_at     timestamptz
+);
+
+-- Eviction reads the index oldest first
+CREATE INDEX IF NOT EXISTS result_cache_last_used_at ON result_cache (last_used_at);
+
+-- Compression mode ('quality' or 'size')
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS mode             text DEFAULT 'quality';
+
+-- zstd dictionary a compressed output was made with
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS zstd_dict_id     integer;
+
+-- ffprobe result (JSON text), so retries don't probe again
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS media_info       text;
+
+-- detect.sniff of the upload: the worker schedules by it
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS input_kind       text;
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS input_ext        text;
+
+-- Memory the scheduler reserves for the job (large images)
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS memory_mb        integer;
+
+-- Batch image jobs: every input's storage key (JSON text)
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS inputs           text;
+
+-- Multi-file uploads: jobs of one /upload/batch request
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS batch_id         text;
+
+CREATE INDEX IF NOT EXISTS jobs_batch_id ON jobs (batch_id);
@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import signal
+import queue
+import select
+import shutil
+import atexit
+import tempfile
+import threading
+import subprocess
+import cancel
+from procs import run_command, CommandTimeout
+from config import (
+    OFFICE_POOL_SIZE,
+    OFFICE_MAX_CONVERSIONS,
+    OFFICE_TIMEOUT,
+    OFFICE_PYTHON
+)
+
+# UNO bridge in this Python (python3-uno on the app's interpreter);
+# otherwise the pool talks to soffice through an office_uno.py helper
+try:
+    import office_uno
+    UNO_IN_PROCESS = True
+except ImportError:
+    UNO_IN_PROCESS = False
+
+SOFFICE_BIN = shutil.which("soffice") or shutil.which("libreoffice") or "soffice"
+
+HELPER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "office_uno.py")
+
+
+# ==================================================
+# UNO HELPER (APP PYTHON WITHOUT UNO)
+# ==================================================
+_helper = None
+_helper_checked = False
+
+
+def uno_helper():
+    """
+    (python, env) that can run office_uno.py, or None.
+    Tries OFFICE_PYTHON, LibreOffice's bundled python, then python3, with
+    LibreOffice's program dir and the python3-uno dist-packages next to
+    it (/usr or an Aptfile's ~/.apt/usr) on PYTHONPATH.
+    """
+    global _helper, _helper_checked
+    if _helper_checked:
+        return _helper
+    _helper_checked = True
+
+    soffice = shutil.which(SOFFICE_BIN)
+    if not soffice:
+        return None
+    program_dir = os.path.dirname(os.path.realpath(soffice))
+    paths = [
+        program_dir,
+        os.path.normpath(os.path.join(program_dir, "..", "..", "python3", "dist-packages"))
+    ]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        paths + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+
+    candidates = [OFFICE_PYTHON] if OFFICE_PYTHON else [
+        os.path.join(program_dir, "python"),
+        shutil.which("python3")
+    ]
+    for python in candidates:
+        if not python or not os.path.exists(python):
+            continue
+        try:
+            ok = subprocess.run(
+                [python, "-c", "import uno"],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=30
+            ).returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            ok = False
+        if ok:
+            _helper = (python, env)
+            return _helper
+
+    print("[WARN] No Python with the UNO bridge: office documents use one-off soffice runs")
+    return None
+
+
+# ==================================================
+# ONE SOFFICE PROCESS
+# ==================================================
+class SofficeInstance:
+    """
+    Long-lived headless soffice with its own user profile,
+    listening on a named pipe private to this process.
+    Driven over UNO from this process, or through an office_uno.py
+    helper process when this Python has no UNO bridge.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.pipe = None
+        self.profile = None
+        self.process = None
+        self.desktop = None
+        self.helper = None
+        self.conversions = 0
+
+    def start(self, timeout=30):
+        self.profile = tempfile.mkdtemp(prefix=f"lo-profile-{self.index}-")
+        # Per process + instance: other workers / replicas on the host
+        # never attach to this soffice
+        self.pipe = f"mahaconvert_{os.getpid()}_{self.index}"
+        self.process = subprocess.Popen(
+            [
+                SOFFICE_BIN,
+                "--headless",
+                "--invisible",
+                "--nologo",
+                "--norestore",
+                "--nodefault",
+                "--nolockcheck",
+                f"--accept=pipe,name={self.pipe};urp;StarOffice.ComponentContext",
+                f"-env:UserInstallation=file://{self.profile}"
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True  # own process group: stop() takes soffice.bin too
+        )
+        self.conversions = 0
+
+        deadline = time.monotonic() + timeout
+        if UNO_IN_PROCESS:
+            self._connect(deadline)
+        else:
+            self._start_helper(deadline)
+
+    def _connect(self, deadline):
+        # Wait until the pipe accepts UNO connections
+        while True:
+            try:
+                self.desktop = office_uno.connect(self.pipe)
+                return
+            except Exception:
+                self._check_started(deadline)
+                time.sleep(0.25)
+
+    def _start_helper(self, deadline):
+        python, env = uno_helper()
+        self.helper = subprocess.Popen(
+            [python, HELPER_SCRIPT, self.pipe],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            text=True
+        )
+        # The helper says {"ok": true} once it is connected
+        while True:
+            ready, _, _ = select.select([self.helper.stdout], [], [], 0.25)
+            if ready:
+                if json.loads(self.helper.stdout.readline() or "{}").get("ok"):
+                    return
+                self.stop()
+                raise ValueError("LibreOffice failed to start")
+            self._check_started(deadline)
+
+    def _check_started(self, deadline):
+        helper_died = self.helper is not None and self.helper.poll() is not None
+        if self.process.poll() is not None or helper_died or time.monotonic() > deadline:
+            self.stop()
+            raise ValueError("LibreOffice failed to start")
+
+    def healthy(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        if self.helper is not None:
+            return self.helper.poll() is None
+        return office_uno.alive(self.desktop)
+
+    def convert(self, input_path, output_path):
+        if self.helper is None:
+            office_uno.convert(self.desktop, input_path, output_path)
+        else:
+            self.helper.stdin.write(json.dumps({"input": input_path, "output": output_path}) + "\n")
+            self.helper.stdin.flush()
+            # Killed by stop() on cancel / timeout: EOF, reported as an error
+            reply = json.loads(self.helper.stdout.readline() or '{"error": "helper exited"}')
+            if "error" in reply:
+                raise ValueError(reply["error"])
+        self.conversions += 1
+
+    def stop(self):
+        if self.helper is not None:
+            self.helper.kill()
+            self.helper.wait()
+            self.helper = None
+        if self.process is not None:
+            # The launcher execs / forks soffice.bin: signal the whole group
+            self._signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+            self._signal(signal.SIGKILL)
+            self.process.wait()
+        self.process = None
+        self.desktop = None
+        if self.profile:
+            shutil.rmtree(self.profile, ignore_errors=True)
+            self.profile = None
+
+    def _signal(self, sig):
+        try:
+            os.killpg(self.process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+
+# ==================================================
+# POOL
+# ==================================================
+class OfficePool:
+    """
+    Hands out idle soffice instances, one document at a time each.
+    - health check before each use (dead instances are restarted)
+    - per-document timeout (a stuck instance is killed and restarted)
+    - recycled after max_conversions to cap memory growth
+    """
+
+    def __init__(self, size, max_conversions, timeout):
+        self.max_conversions = max_conversions
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        for i in range(size):
+            # Started lazily on first use
+            self._idle.put(SofficeInstance(i))
+
+    def _take(self):
+        # A cancelled / timed-out job stops waiting for a free instance
+        while True:
+            cancel.check()
+            try:
+                return self._idle.get(timeout=cancel.POLL_SECONDS)
+            except queue.Empty:
+                pass
+
+    def convert(self, input_path, output_path):
+        inst = self._take()
+        try:
+            if not inst.healthy():
+                inst.restart()
+
+            error = []
+            t = threading.Thread(
+                target=self._run,
+                args=(inst, input_path, output_path, error),
+                daemon=True
+            )
+            t.start()
+
+            # Join in short steps so a cancelled job kills soffice right away
+            token = cancel.current()
+            deadline = time.monotonic() + self.timeout
+            while t.is_alive() and time.monotonic() < deadline:
+                t.join(cancel.POLL_SECONDS)
+                if token is not None and t.is_alive():
+                    try:
+                        token.check()
+                    except (cancel.JobCancelled, cancel.JobTimeout):
+                        inst.stop()
+                        raise
+
+            if t.is_alive():
+                inst.stop()
+                raise ValueError("Conversion timed out")
+            if error:
+                inst.stop()
+                raise ValueError(f"Office to PDF conversion failed: {error[0]}")
+
+            if inst.conversions >= self.max_conversions:
+                inst.stop()
+        finally:
+            self._idle.put(inst)
+
+        return output_path
+
+    @staticmethod
+    def _run(inst, input_path, output_path, error):
+        try:
+            inst.convert(input_path, output_path)
+        except Exception as e:
+            error.append(e)
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_office_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OfficePool(
+                OFFICE_POOL_SIZE,
+                OFFICE_MAX_CONVERSIONS,
+                OFFICE_TIMEOUT
+            )
+            atexit.register(_pool.close)
+        return _pool
+
+
+def pool_supported():
+    with _pool_lock:
+        return UNO_IN_PROCESS or uno_helper() is not None
+
+
+# ==================================================
+# ONE-OFF SOFFICE (NO UNO ANYWHERE)
+# ==================================================
+# One profile per slot, kept between documents: a fresh profile costs
+# LibreOffice its first-start setup on every run
+_profiles = None
+
+
+def _profile_slots():
+    global _profiles
+    with _pool_lock:
+        if _profiles is None:
+            _profiles = queue.Queue()
+            base = tempfile.mkdtemp(prefix="lo-profiles-")
+            atexit.register(shutil.rmtree, base, True)
+            for i in range(max(1, OFFICE_POOL_SIZE)):
+                _profiles.put(os.path.join(base, str(i)))
+        return _profiles
+
+
+def _take_profile():
+    slots = _profile_slots()
+    while True:
+        cancel.check()
+        try:
+            return slots.get(timeout=cancel.POLL_SECONDS)
+        except queue.Empty:
+            pass
+
+
+def convert_to_pdf(input_path, output_path):
+    """
+    Office document -> PDF.
+    Uses the soffice pool when a UNO bridge is available (in this Python
+    or through the helper), otherwise a one-off soffice on one of the
+    per-slot profiles (so parallel runs don't collide).
+    """
+    if pool_supported():
+        return get_office_pool().convert(input_path, output_path)
+
+    profile = _take_profile()
+    outdir = tempfile.mkdtemp(prefix="lo-out-")
+    cmd = [
+        SOFFICE_BIN,
+        "--headless",
+        "--norestore",
+        "--nolockcheck",
+        f"-env:UserInstallation=file://{profile}",
+        "--convert-to", "pdf",
+        "--outdir", outdir,
+        input_path
+    ]
+    finished = False
+    try:
+        try:
+            # run_command also stops soffice when the job is cancelled
+            run_command(cmd, timeout=OFFICE_TIMEOUT)
+        except FileNotFoundError:
+            raise ValueError("LibreOffice not installed. Required for Office to PDF conversion.")
+        except CommandTimeout:
+            raise ValueError("Conversion timed out")
+        finished = True
+
+        name = os.path.splitext(os.path.basename(input_path))[0]
+        shutil.move(os.path.join(outdir, f"{name}.pdf"), output_path)
+    finally:
+        if not finished:
+            # A killed soffice can leave the profile half-written
+            shutil.rmtree(profile, ignore_errors=True)
+        _profile_slots().put(profile)
+        shutil.rmtree(outdir, ignore_errors=True)
+    return output_path
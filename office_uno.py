@@ -0,0 +1,108 @@
+"""
+UNO side of the office pool: attach to a headless soffice and convert.
+
+Imported by office_pool when the app's Python has the UNO bridge.
+Otherwise office_pool runs it as a helper under a Python that has it
+(LibreOffice's own, or the system python3 with python3-uno):
+
+    python3 office_uno.py <pipe name>
+
+prints {"ok": true} once connected, then reads one JSON request per
+line ({"input": path, "output": path}) and answers {"ok": true} or
+{"error": "..."}. Only needs the standard library and uno.
+"""
+import os
+import sys
+import json
+import time
+
+import uno
+from com.sun.star.beans import PropertyValue
+
+
+def _props(**kwargs):
+    out = []
+    for key, value in kwargs.items():
+        p = PropertyValue()
+        p.Name = key
+        p.Value = value
+        out.append(p)
+    return tuple(out)
+
+
+def _pdf_filter(doc):
+    if doc.supportsService("com.sun.star.sheet.SpreadsheetDocument"):
+        return "calc_pdf_Export"
+    if doc.supportsService("com.sun.star.presentation.PresentationDocument"):
+        return "impress_pdf_Export"
+    if doc.supportsService("com.sun.star.drawing.DrawingDocument"):
+        return "draw_pdf_Export"
+    return "writer_pdf_Export"
+
+
+def connect(pipe):
+    """
+    Desktop of the soffice listening on `pipe` (raises if it isn't up yet)
+    """
+    local = uno.getComponentContext()
+    resolver = local.ServiceManager.createInstanceWithContext(
+        "com.sun.star.bridge.UnoUrlResolver", local
+    )
+    ctx = resolver.resolve(
+        f"uno:pipe,name={pipe};urp;StarOffice.ComponentContext"
+    )
+    return ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+
+def alive(desktop):
+    try:
+        desktop.getComponents()
+        return True
+    except Exception:
+        return False
+
+
+def convert(desktop, input_path, output_path):
+    doc = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(os.path.abspath(input_path)),
+        "_blank",
+        0,
+        _props(Hidden=True, ReadOnly=True)
+    )
+    if doc is None:
+        raise ValueError("LibreOffice could not open the document")
+    try:
+        doc.storeToURL(
+            uno.systemPathToFileUrl(os.path.abspath(output_path)),
+            _props(FilterName=_pdf_filter(doc))
+        )
+    finally:
+        doc.close(True)
+
+
+def _reply(**fields):
+    sys.stdout.write(json.dumps(fields) + "\n")
+    sys.stdout.flush()
+
+
+def main(pipe):
+    # office_pool kills this helper if soffice dies or the start times out
+    while True:
+        try:
+            desktop = connect(pipe)
+            break
+        except Exception:
+            time.sleep(0.25)
+    _reply(ok=True)
+
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+            convert(desktop, request["input"], request["output"])
+            _reply(ok=True)
+        except Exception as e:
+            _reply(error=str(e))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,100 @@
+import shutil
+
+# JPEG components -> PDF color space
+_COLOR_SPACES = {1: "/DeviceGray", 3: "/DeviceRGB"}
+
+
+class JpegPdfWriter:
+    """
+    Writes a PDF one JPEG page at a time, straight to disk.
+    JPEG data is embedded as-is (DCTDecode): no decode, no re-encode,
+    and only the current page is ever in memory.
+
+        with JpegPdfWriter(path) as pdf:
+            pdf.add_jpeg(jpeg_path, width, height, components)
+    """
+
+    def __init__(self, path, dpi=100.0):
+        self.dpi = dpi
+        self._f = open(path, "wb")
+        self._offsets = {}
+        self._pages = []
+        self._next_id = 3  # 1 = catalog, 2 = page tree (written last)
+        self._f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _begin(self, obj_id):
+        self._offsets[obj_id] = self._f.tell()
+        self._f.write(f"{obj_id} 0 obj\n".encode())
+
+    def _object(self, body):
+        obj_id = self._next_id
+        self._next_id += 1
+        self._begin(obj_id)
+        self._f.write(body.encode() + b"\nendobj\n")
+        return obj_id
+
+    def add_jpeg(self, jpeg_path, width, height, components=3):
+        if components not in _COLOR_SPACES:
+            raise ValueError("Only grayscale / RGB JPEGs can be embedded")
+
+        # Image XObject, streamed from the file
+        image_id = self._next_id
+        self._next_id += 1
+        with open(jpeg_path, "rb") as src:
+            src.seek(0, 2)
+            length = src.tell()
+            src.seek(0)
+            self._begin(image_id)
+            self._f.write(
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace {_COLOR_SPACES[components]} /BitsPerComponent 8 "
+                f"/Filter /DCTDecode /Length {length} >>\nstream\n".encode()
+            )
+            shutil.copyfileobj(src, self._f, 1024 * 1024)
+            self._f.write(b"\nendstream\nendobj\n")
+
+        # Page size from pixels at `dpi`
+        w = width * 72.0 / self.dpi
+        h = height * 72.0 / self.dpi
+        content = f"q {w:.2f} 0 0 {h:.2f} 0 0 cm /Im0 Do Q"
+        content_id = self._object(
+            f"<< /Length {len(content)} >>\nstream\n{content}\nendstream"
+        )
+        page_id = self._object(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w:.2f} {h:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        )
+        self._pages.append(page_id)
+
+    def close(self):
+        if self._f.closed:
+            return
+        if not self._pages:
+            self._f.close()
+            raise ValueError("No pages written")
+
+        kids = " ".join(f"{p} 0 R" for p in self._pages)
+        self._begin(2)
+        self._f.write(f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>\nendobj\n".encode())
+        self._begin(1)
+        self._f.write(b"<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+
+        xref = self._f.tell()
+        size = self._next_id
+        self._f.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, size):
+            self._f.write(f"{self._offsets[obj_id]:010d} 00000 n \n".encode())
+        self._f.write(
+            f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+        )
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
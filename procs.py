@@ -0,0 +1,203 @@
+import os
+import time
+import queue
+import signal
+import tempfile
+import threading
+import contextvars
+import subprocess
+from concurrent.futures import Future
+import cancel
+
+
+class CommandTimeout(Exception):
+    pass
+
+
+def run_command(cmd, timeout=None, poll_interval=0.1, on_line=None):
+    """
+    Run an external tool to completion.
+    on_line: called with each stdout line (bytes), from a reader thread
+    that runs in a copy of the caller's context (so progress.report() and
+    cancel.current() see the job's reporter / token).
+    Returns the child's CPU seconds (user + sys, from wait4).
+    Raises CommandTimeout (process killed) or CalledProcessError.
+    The job's cancel token (if any) is polled too: cancel / job deadline
+    kills the process and raises JobCancelled / JobTimeout.
+    """
+    token = cancel.current()
+    if token is not None:
+        token.check()
+
+    # stderr to a file, not a pipe: a chatty tool can't block on a full pipe
+    with tempfile.TemporaryFile() as errfile:
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE if on_line else subprocess.DEVNULL,
+            stderr=errfile,
+            start_new_session=True  # own process group, so kill takes helpers too
+        )
+        reader = None
+        if on_line:
+            # Threads don't inherit ContextVars: hand the caller's over
+            reader = threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(_read_lines, proc.stdout, on_line),
+                daemon=True
+            )
+            reader.start()
+        deadline = time.monotonic() + timeout if timeout else None
+
+        while True:
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            if deadline and time.monotonic() > deadline:
+                _kill(proc)
+                raise CommandTimeout(f"{os.path.basename(cmd[0])} timed out after {timeout}s")
+            if token is not None:
+                try:
+                    token.check()
+                except (cancel.JobCancelled, cancel.JobTimeout):
+                    _kill(proc)
+                    raise
+            time.sleep(poll_interval)
+
+        # wait4 reaped the child, tell Popen so it doesn't try again
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if reader:
+            reader.join(5)
+            proc.stdout.close()
+        errfile.seek(0)
+        stderr = errfile.read()
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+
+    return usage.ru_utime + usage.ru_stime
+
+
+def _read_lines(stream, on_line):
+    for line in stream:
+        try:
+            on_line(line)
+        except Exception:
+            pass
+
+
+def _kill(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+# ==================================================
+# KILLABLE PROCESS POOL
+# ==================================================
+class TaskKilled(Exception):
+    pass
+
+
+class _TaskFuture(Future):
+    """
+    Future whose cancel() also stops a task that is already running
+    (its process is killed)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._kill_lock = threading.Lock()
+        self._process = None
+        self._kill = False
+
+    def cancel(self):
+        if super().cancel():
+            return True
+        with self._kill_lock:
+            if self.done():
+                return False
+            self._kill = True
+            process = self._process
+        if process is not None:
+            process.kill()
+        return True
+
+    def _attach(self, process):
+        # False if cancel() came in before the task was handed over
+        with self._kill_lock:
+            self._process = process
+            return not self._kill
+
+
+class ProcessPool:
+    """
+    submit() -> Future, like ProcessPoolExecutor, but a running task can
+    be stopped: each of the max_workers processes runs one task at a
+    time, and cancelling a running task's future kills its process
+    (a fresh one is started for the next task). A hung or cancelled
+    decode never keeps holding a process.
+    """
+
+    def __init__(self, max_workers, mp_context):
+        self._ctx = mp_context
+        self._tasks = queue.Queue()
+        for i in range(max(1, max_workers)):
+            threading.Thread(target=self._slot, name=f"cpu-pool-{i}", daemon=True).start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = _TaskFuture()
+        self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def _slot(self):
+        # One process per slot, started on first use / after a kill
+        process = conn = None
+        while True:
+            future, fn, args, kwargs = self._tasks.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if process is None:
+                conn, child = self._ctx.Pipe()
+                process = self._ctx.Process(target=_serve, args=(child,), daemon=True)
+                process.start()
+                child.close()
+
+            try:
+                if not future._attach(process):
+                    raise TaskKilled("Task cancelled")
+                conn.send((fn, args, kwargs))
+                ok, value = conn.recv()
+            except Exception as e:
+                # Killed (cancel) or crashed: this process is done for
+                process.kill()
+                process.join()
+                conn.close()
+                process = conn = None
+                future.set_exception(e if isinstance(e, TaskKilled) else TaskKilled(f"Task process died: {e!r}"))
+                continue
+
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+def _serve(conn):
+    # Pool process: run tasks until the pipe closes
+    while True:
+        try:
+            fn, args, kwargs = conn.recv()
+        except EOFError:
+            return
+        try:
+            reply = (True, fn(*args, **kwargs))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Unpicklable result / exception
+            conn.send((False, RuntimeError(repr(e))))
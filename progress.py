@@ -0,0 +1,106 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from config import PROGRESS_FLUSH_SECONDS, PROGRESS_MIN_STEP
+
+# Reporter of the job running in this thread (set by the worker)
+_current = contextvars.ContextVar("progress", default=None)
+
+
+class Progress:
+    """
+    Coalesces fine-grained progress (0.0 - 1.0 of the current step) into
+    job progress between `start` and `end`, and writes it out at most every
+    flush_seconds, or sooner on a jump of min_step points.
+    """
+
+    def __init__(self, write, start=20, end=85,
+                 flush_seconds=PROGRESS_FLUSH_SECONDS, min_step=PROGRESS_MIN_STEP):
+        self.write = write
+        self.start = start
+        self.end = end
+        self.flush_seconds = flush_seconds
+        self.min_step = min_step
+        self.lo, self.hi = 0.0, 1.0   # sub-range the current step maps into
+        self._lock = threading.Lock()
+        self._value = start
+        self._written = start
+        self._flushed_at = time.monotonic()
+
+    def report(self, fraction):
+        fraction = self.lo + (self.hi - self.lo) * min(1.0, max(0.0, fraction))
+        value = int(self.start + (self.end - self.start) * fraction)
+
+        with self._lock:
+            # Never backwards (e.g. a retry after a failed fast path)
+            if value <= self._value:
+                return
+            self._value = value
+            now = time.monotonic()
+            if (now - self._flushed_at < self.flush_seconds
+                    and value - self._written < self.min_step):
+                return
+            self._written = value
+            self._flushed_at = now
+
+        self._write(value)
+
+    def flush(self):
+        with self._lock:
+            if self._value == self._written:
+                return
+            value = self._written = self._value
+            self._flushed_at = time.monotonic()
+        self._write(value)
+
+    def _write(self, value):
+        try:
+            self.write(value)
+        except Exception as e:
+            # Progress is cosmetic, never fail the job over it
+            print(f"[WARN] Progress update failed: {e}")
+
+
+@contextmanager
+def track(write, start=20, end=85):
+    """
+    Route report() calls made in this thread to `write(progress)`
+    """
+    reporter = Progress(write, start, end)
+    token = _current.set(reporter)
+    try:
+        yield reporter
+    finally:
+        reporter.flush()
+        _current.reset(token)
+
+
+@contextmanager
+def span(lo, hi):
+    """
+    Map report(0..1) inside the block onto [lo, hi] of the current step
+    (e.g. pass 1 of 2 = span(0, 0.5))
+    """
+    reporter = _current.get()
+    if reporter is None:
+        yield
+        return
+
+    saved = (reporter.lo, reporter.hi)
+    width = reporter.hi - reporter.lo
+    reporter.lo, reporter.hi = saved[0] + width * lo, saved[0] + width * hi
+    try:
+        yield
+    finally:
+        reporter.lo, reporter.hi = saved
+
+
+def current():
+    return _current.get()
+
+
+def report(fraction):
+    reporter = _current.get()
+    if reporter is not None:
+        reporter.report(fraction)
@@ -0,0 +1,129 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import detect
+
+
+# Job kinds run in the CPU process pool (pure Python / Pillow / pandas)
+CPU_KINDS = {"image", "data"}
+
+
+def job_kind(job):
+    """
+    Classify a job into the slot type it consumes:
+    video / audio / pdf / office run external tools (ffmpeg, gs, libreoffice),
+    image / data run Python code and go to the process pool.
+    Uses the type sniffed from the content at upload (input_kind /
+    input_ext), so a mislabeled file runs where its converter does.
+    """
+    if job["action"] == "batch":
+        # Downloads + assembly in the job thread, encodes fan out to the pool
+        return "batch"
+
+    if job.get("input_kind"):
+        kind, ext = job["input_kind"], job.get("input_ext") or ""
+    else:
+        # Jobs created before upload-time sniffing: the name is all we have
+        kind, ext = detect.by_name(job["input_path"])
+
+    convert = job["action"] == "convert"
+    to_format = (job.get("to_format") or "").lower()
+
+    if kind == "document":
+        # Converted by libreoffice; compress is plain byte compression
+        return "office" if convert else "data"
+    if ext == "csv" and convert and to_format == "pdf":
+        return "office"
+    if ext == "gif":
+        # Compressed as a video (ffmpeg), converted with Pillow
+        return "image" if convert else "video"
+    if ext == "svg":
+        return "image" if convert else "data"
+    if kind in ("video", "audio", "pdf", "image"):
+        return kind
+    return "data"
+
+
+class JobScheduler:
+    """
+    Runs up to `concurrency` jobs at once, with an optional
+    per-kind limit (e.g. {"video": 2}) and an optional memory limit
+    shared by jobs that declare memory_mb.
+    """
+
+    def __init__(self, run_job, concurrency, type_limits=None, on_finish=None,
+                 memory_limit_mb=None):
+        self.run_job = run_job
+        self.on_finish = on_finish
+        self.concurrency = max(1, concurrency)
+        self.type_limits = dict(type_limits or {})
+        self.memory_limit_mb = memory_limit_mb
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.concurrency,
+            thread_name_prefix="job"
+        )
+        self._lock = threading.Lock()
+        self._active = {}          # job_id -> kind
+        self._per_kind = {}        # kind -> running count
+        self._memory = {}          # job_id -> reserved MB
+
+    # ==================================================
+    # STATE
+    # ==================================================
+    def active_ids(self):
+        with self._lock:
+            return list(self._active)
+
+    def free_slots(self):
+        with self._lock:
+            return self.concurrency - len(self._active)
+
+    def has_capacity(self, kind, memory_mb=0):
+        with self._lock:
+            return self._has_capacity(kind, memory_mb)
+
+    def _has_capacity(self, kind, memory_mb=0):
+        if len(self._active) >= self.concurrency:
+            return False
+        limit = self.type_limits.get(kind)
+        if limit is not None and self._per_kind.get(kind, 0) >= limit:
+            return False
+        # A job bigger than the whole limit still runs, alone
+        if (self.memory_limit_mb and memory_mb and self._memory
+                and sum(self._memory.values()) + memory_mb > self.memory_limit_mb):
+            return False
+        return True
+
+    # ==================================================
+    # SUBMIT
+    # ==================================================
+    def try_submit(self, job, kind):
+        """
+        Start job if a slot for its kind is free.
+        Returns False (job stays queued) when at capacity.
+        """
+        job_id = job["id"]
+        memory_mb = job.get("memory_mb") or 0
+        with self._lock:
+            if job_id in self._active or not self._has_capacity(kind, memory_mb):
+                return False
+            self._active[job_id] = kind
+            self._per_kind[kind] = self._per_kind.get(kind, 0) + 1
+            if memory_mb:
+                self._memory[job_id] = memory_mb
+
+        self._pool.submit(self._run, job, kind)
+        return True
+
+    def _run(self, job, kind):
+        try:
+            self.run_job(job, kind)
+        except Exception as e:
+            print(f"[ERROR] Job {job['id']}: {e}")
+        finally:
+            with self._lock:
+                self._active.pop(job["id"], None)
+                self._memory.pop(job["id"], None)
+                self._per_kind[kind] -= 1
+            if self.on_finish:
+                self.on_finish()
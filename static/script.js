@@ -222,7 +222,7 @@ if (form) {
 }
 
 // ===============================
-// JOB POLLING (REAL PROGRESS + SIMULATION)
+// JOB UPDATES (SERVER-SENT EVENTS, POLLING FALLBACK)
 // ===============================
 let progressInterval = null;
 let currentProgress = 0;
@@ -232,79 +232,113 @@ function pollJob(jobId) {
   currentProgress = 0;
   if (progressInterval) clearInterval(progressInterval);
 
-  const interval = setInterval(async () => {
+  if (!window.EventSource) {
+    startPolling(jobId);
+    return;
+  }
+
+  // Server pushes {status, progress} on every change
+  const source = new EventSource(`/job/${jobId}/events`);
+
+  source.onmessage = (e) => {
+    if (showJob(jobId, JSON.parse(e.data))) source.close();
+  };
+
+  source.onerror = () => {
+    // Window ended: the browser reconnects by itself. Refused (404, or 503
+    // when the server has too many streams open): poll instead
+    if (source.readyState === EventSource.CLOSED) startPolling(jobId);
+  };
+}
+
+function startPolling(jobId) {
+  if (progressInterval) clearInterval(progressInterval);
+
+  progressInterval = setInterval(async () => {
     try {
       const res = await fetch(`/job/${jobId}`);
+      if (res.status === 404) {
+        clearInterval(progressInterval);
+        showJob(jobId, { status: "error" });
+        return;
+      }
       const job = await res.json();
+      if (showJob(jobId, job)) clearInterval(progressInterval);
+    } catch (err) {
+      console.error("Polling error:", err);
+    }
+  }, 1000);
+}
 
-      // --- SIMULATED PROGRESS LOGIC ---
-      let displayProgress = job.progress || 0;
+// Update the overlay; returns true once the job is finished
+function showJob(jobId, job) {
+  if (!job) return false;
 
-      // Make sure we don't go backward
-      if (displayProgress < currentProgress) {
-        displayProgress = currentProgress;
-      }
+  // --- SIMULATED PROGRESS LOGIC ---
+  let displayProgress = job.progress || 0;
 
-      // If backend says "Compressing" or "Converting" (usually stuck at 20%)
-      // We simulate progress up to 90%
-      if (
-        job.status &&
-        (job.status.toLowerCase().includes("compressing") ||
-          job.status.toLowerCase().includes("converting") ||
-          job.status.toLowerCase().includes("starting"))
-        && displayProgress < 90
-      ) {
-        // Auto increment slowly if backend is static
-        // Random increment between 0.2 and 0.8
-        const inc = Math.random() * 0.6 + 0.2;
-        displayProgress += inc;
-        if (displayProgress > 90) displayProgress = 90;
-      }
+  // Make sure we don't go backward
+  if (displayProgress < currentProgress) {
+    displayProgress = currentProgress;
+  }
 
-      // Sync local state
-      currentProgress = displayProgress;
+  // If backend says "Compressing" or "Converting" (usually stuck at 20%)
+  // We simulate progress up to 90%
+  if (
+    job.status &&
+    (job.status.toLowerCase().includes("compressing") ||
+      job.status.toLowerCase().includes("converting") ||
+      job.status.toLowerCase().includes("starting"))
+    && displayProgress < 90
+  ) {
+    // Auto increment slowly if backend is static
+    // Random increment between 0.2 and 0.8
+    const inc = Math.random() * 0.6 + 0.2;
+    displayProgress += inc;
+    if (displayProgress > 90) displayProgress = 90;
+  }
 
-      // Update UI
-      if (statusText) statusText.innerText = job.status || "Processing...";
-      const pct = Math.min(100, Math.max(0, currentProgress.toFixed(1)));
+  // Sync local state
+  currentProgress = displayProgress;
 
-      if (progressBar) progressBar.style.width = pct + "%";
-      if (progressText) progressText.innerText = Math.floor(pct) + "%";
+  // Update UI
+  if (statusText) statusText.innerText = job.status || "Processing...";
+  const pct = Math.min(100, Math.max(0, currentProgress.toFixed(1)));
 
-      // DONE
-      if (job.status === "done" || job.progress === 100) {
-        clearInterval(interval);
-        if (statusText) statusText.innerText = "Complete";
-        if (progressBar) progressBar.style.width = "100%";
-        if (progressText) progressText.innerText = "100%";
+  if (progressBar) progressBar.style.width = pct + "%";
+  if (progressText) progressText.innerText = Math.floor(pct) + "%";
 
-        setTimeout(() => {
-          // HIDE OVERLAY
-          if (overlay) overlay.classList.add("d-none");
+  // DONE
+  if (job.status === "done" || job.progress === 100) {
+    if (statusText) statusText.innerText = "Complete";
+    if (progressBar) progressBar.style.width = "100%";
+    if (progressText) progressText.innerText = "100%";
 
-          // Reset form
-          if (submitBtn) submitBtn.disabled = false;
-          if (statusText) statusText.innerText = "Initializing...";
-          if (progressBar) progressBar.style.width = "0%";
-          if (progressText) progressText.innerText = "0%";
+    setTimeout(() => {
+      // HIDE OVERLAY
+      if (overlay) overlay.classList.add("d-none");
 
-          // Trigger download
-          window.location.href = `/download/${jobId}`;
-        }, 800);
-      }
+      // Reset form
+      if (submitBtn) submitBtn.disabled = false;
+      if (statusText) statusText.innerText = "Initializing...";
+      if (progressBar) progressBar.style.width = "0%";
+      if (progressText) progressText.innerText = "0%";
+
+      // Trigger download
+      window.location.href = `/download/${jobId}`;
+    }, 800);
+    return true;
+  }
 
-      // ERROR / CANCEL
-      if (job.status === "error" || job.status === "cancelled") {
-        clearInterval(interval);
-        if (statusText) statusText.innerText = job.status;
-        if (submitBtn) submitBtn.disabled = false;
-        if (overlay) overlay.classList.add("d-none");
-      }
+  // ERROR / CANCEL
+  if (job.status === "error" || job.status === "cancelled") {
+    if (statusText) statusText.innerText = job.status;
+    if (submitBtn) submitBtn.disabled = false;
+    if (overlay) overlay.classList.add("d-none");
+    return true;
+  }
 
-    } catch (err) {
-      console.error("Polling error:", err);
-    }
-  }, 1000);
+  return false;
 }
 
 // ===============================
@@ -0,0 +1,297 @@
+import os
+import time
+import base64
+import shutil
+import tempfile
+import requests
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    STORAGE_BACKEND,
+    STORAGE_DIR,
+    DOWNLOAD_PARALLEL_MIN_MB,
+    DOWNLOAD_PARALLEL_PARTS
+)
+
+# Supabase resumable (TUS) uploads require exactly 6 MB chunks
+TUS_CHUNK_SIZE = 6 * 1024 * 1024
+UPLOAD_RETRIES = 5
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 5
+
+
+def _auth_headers():
+    return {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}"
+    }
+
+
+def _b64(value):
+    return base64.b64encode(value.encode()).decode()
+
+
+def _file_size(fileobj):
+    pos = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(pos)
+    return size
+
+
+# ==================================================
+# LOCAL BACKEND (STORAGE_BACKEND=local)
+# ==================================================
+def object_file(bucket, path):
+    """
+    Where an object lives on disk. Keys can't escape the bucket dir.
+    """
+    root = os.path.abspath(os.path.join(STORAGE_DIR, bucket))
+    full = os.path.abspath(os.path.join(root, path))
+    if not full.startswith(root + os.sep):
+        raise ValueError(f"Invalid object path: {path}")
+    return full
+
+
+def _local_put(bucket, path, fileobj):
+    # Temp file + rename: readers never see a half-written object
+    target = object_file(bucket, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(fileobj, out, DOWNLOAD_CHUNK_SIZE)
+        os.replace(tmp, target)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return path
+
+
+def copy_local(bucket, src, dst):
+    with open(object_file(bucket, src), "rb") as f:
+        return _local_put(bucket, dst, f)
+
+
+def remove_local(bucket, paths):
+    for path in paths:
+        try:
+            os.remove(object_file(bucket, path))
+        except FileNotFoundError:
+            pass
+
+
+# ==================================================
+# UPLOAD (TUS, CHUNKED + RESUMABLE)
+# ==================================================
+def _tus_create(session, bucket, path, size, content_type, upsert):
+    res = session.post(
+        f"{SUPABASE_URL}/storage/v1/upload/resumable",
+        headers={
+            **_auth_headers(),
+            "Tus-Resumable": "1.0.0",
+            "Upload-Length": str(size),
+            "Upload-Metadata": ",".join([
+                f"bucketName {_b64(bucket)}",
+                f"objectName {_b64(path)}",
+                f"contentType {_b64(content_type)}"
+            ]),
+            "x-upsert": "true" if upsert else "false"
+        },
+        timeout=30
+    )
+    res.raise_for_status()
+    return res.headers["Location"]
+
+
+def _tus_offset(session, location):
+    """
+    Ask the server how many bytes it already has (resume point)
+    """
+    res = session.head(
+        location,
+        headers={**_auth_headers(), "Tus-Resumable": "1.0.0"},
+        timeout=30
+    )
+    res.raise_for_status()
+    return int(res.headers["Upload-Offset"])
+
+
+def upload_stream(bucket, path, fileobj, content_type="application/octet-stream", upsert=True):
+    """
+    Upload a file object in TUS_CHUNK_SIZE pieces.
+    Memory stays at one chunk regardless of file size; a failed chunk
+    resumes from the server's offset instead of starting over.
+    """
+    if STORAGE_BACKEND == "local":
+        fileobj.seek(0)
+        return _local_put(bucket, path, fileobj)
+
+    size = _file_size(fileobj)
+    session = requests.Session()
+    location = _tus_create(session, bucket, path, size, content_type, upsert)
+
+    offset = 0
+    failures = 0
+    while offset < size:
+        fileobj.seek(offset)
+        chunk = fileobj.read(TUS_CHUNK_SIZE)
+        try:
+            res = session.patch(
+                location,
+                data=chunk,
+                headers={
+                    **_auth_headers(),
+                    "Tus-Resumable": "1.0.0",
+                    "Upload-Offset": str(offset),
+                    "Content-Type": "application/offset+octet-stream"
+                },
+                timeout=120
+            )
+            res.raise_for_status()
+            offset = int(res.headers["Upload-Offset"])
+            failures = 0
+        except requests.RequestException:
+            failures += 1
+            if failures > UPLOAD_RETRIES:
+                raise
+            time.sleep(min(2 ** failures, 30))
+            offset = _tus_offset(session, location)
+
+    return path
+
+
+def upload_path(bucket, path, local_path, content_type="application/octet-stream", upsert=True):
+    with open(local_path, "rb") as f:
+        return upload_stream(bucket, path, f, content_type, upsert)
+
+
+# ==================================================
+# DOWNLOAD (STREAMING, RANGED + RETRIED)
+# ==================================================
+def _object_url(bucket, path):
+    return f"{SUPABASE_URL}/storage/v1/object/{bucket}/{quote(path)}"
+
+
+def _object_info(session, url):
+    """
+    (size, supports_range) from a HEAD request; size None if unknown
+    """
+    try:
+        res = session.head(url, headers=_auth_headers(), timeout=30)
+        res.raise_for_status()
+    except requests.RequestException:
+        return None, False
+    size = res.headers.get("Content-Length")
+    ranged = res.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return (int(size) if size else None), ranged
+
+
+def _fetch_range(session, url, fd, start, end):
+    """
+    Write bytes [start, end] of the object at the same offsets in fd.
+    Retries resume from the last byte written. Returns next offset.
+    """
+    pos = start
+    failures = 0
+    while pos <= end:
+        try:
+            with session.get(
+                url,
+                headers={**_auth_headers(), "Range": f"bytes={pos}-{end}"},
+                stream=True,
+                timeout=60
+            ) as res:
+                if res.status_code != 206:
+                    raise requests.HTTPError(f"Range request returned {res.status_code}")
+                for chunk in res.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    os.pwrite(fd, chunk, pos)
+                    pos += len(chunk)
+            failures = 0
+        except requests.RequestException:
+            failures += 1
+            if failures > DOWNLOAD_RETRIES:
+                raise
+            time.sleep(min(2 ** failures, 30))
+    return pos
+
+
+def _download_plain(session, url, part_path):
+    """
+    Server without range support: one streamed GET, no resume
+    """
+    with session.get(url, headers=_auth_headers(), stream=True, timeout=60) as res:
+        res.raise_for_status()
+        with open(part_path, "wb") as f:
+            for chunk in res.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+
+def _download_ranges(session, url, part_path, size, parts):
+    """
+    Split [0, size) into `parts` ranges fetched concurrently; each range
+    retries from its last written byte (_fetch_range).
+    """
+    step = -(-size // parts)
+    ranges = [(i, min(i + step, size) - 1) for i in range(0, size, step)]
+
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT)
+    try:
+        os.ftruncate(fd, size)
+        with ThreadPoolExecutor(max_workers=parts) as pool:
+            list(pool.map(lambda rng: _fetch_range(session, url, fd, *rng), ranges))
+    finally:
+        os.close(fd)
+
+
+def read_head(bucket, path, size):
+    """
+    First `size` bytes of an object (one ranged GET)
+    """
+    if STORAGE_BACKEND == "local":
+        with open(object_file(bucket, path), "rb") as f:
+            return f.read(size)
+
+    res = requests.get(
+        _object_url(bucket, path),
+        headers={**_auth_headers(), "Range": f"bytes=0-{size - 1}"},
+        timeout=30
+    )
+    res.raise_for_status()
+    return res.content[:size]
+
+
+def download_stream(bucket, path, local_path, parallel=None):
+    """
+    Stream an object to disk in DOWNLOAD_CHUNK_SIZE pieces.
+    Data lands in <local_path>.part and is renamed when complete, so
+    local_path only ever holds a whole object. Dropped connections are
+    retried from the last byte received. Big objects use parallel range
+    requests unless parallel=False.
+    """
+    if STORAGE_BACKEND == "local":
+        shutil.copyfile(object_file(bucket, path), local_path + ".part")
+        os.replace(local_path + ".part", local_path)
+        return local_path
+
+    url = _object_url(bucket, path)
+    part_path = local_path + ".part"
+    session = requests.Session()
+
+    size, ranged = _object_info(session, url)
+
+    if size is None or not ranged:
+        _download_plain(session, url, part_path)
+    elif size == 0:
+        open(part_path, "wb").close()
+    else:
+        if parallel is None:
+            parallel = size >= DOWNLOAD_PARALLEL_MIN_MB * 1024 * 1024
+        parts = max(1, DOWNLOAD_PARALLEL_PARTS) if parallel else 1
+        _download_ranges(session, url, part_path, size, parts)
+
+    os.replace(part_path, local_path)
+    return local_path
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Modules live at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests never talk to Supabase: jobs in SQLite, objects on local disk
+os.environ.setdefault("JOBS_BACKEND", "sqlite")
+os.environ.setdefault("STORAGE_BACKEND", "local")
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp(prefix="mahaconvert-test-"))
@@ -0,0 +1,21 @@
+import io
+
+import pytest
+
+pytest.importorskip("flask")
+from app import app  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_upload_images_rejects_svg(client):
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>'
+    res = client.post("/upload/images", data={
+        "files": [(io.BytesIO(svg), "logo.svg")],
+        "to_format": "pdf"
+    })
+    assert res.status_code == 400
+    assert "logo.svg" in res.get_json()["error"]
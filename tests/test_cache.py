@@ -0,0 +1,41 @@
+from cache import ResultCache
+from local_db import SQLiteJobs
+
+
+class CountingStore(SQLiteJobs):
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+
+    def cache_entries(self, limit):
+        self.reads.append(limit)
+        return super().cache_entries(limit)
+
+
+def test_evicts_oldest_entries_page_by_page():
+    store = CountingStore()
+    removed = []
+    cache = ResultCache(store, max_bytes=50, remove_objects=removed.extend, page_size=3)
+
+    for i in range(10):
+        cache.add(f"k{i}", f"cache/k{i}.png", 10)
+
+    # Only the 5 newest fit; the index is never read whole
+    assert store.cache_size() == 50
+    assert removed == [f"cache/k{i}.png" for i in range(5)]
+    assert all(limit == 3 for limit in store.reads)
+    assert cache.lookup("k9") == "cache/k9.png"
+    assert cache.lookup("k0") is None
+
+
+def test_resyncs_with_adds_from_other_workers():
+    store = CountingStore()
+    cache = ResultCache(store, max_bytes=50, remove_objects=lambda paths: None, sync_seconds=0)
+    other = ResultCache(store, max_bytes=1000, remove_objects=lambda paths: None)
+
+    for i in range(5):
+        other.add(f"o{i}", f"cache/o{i}.png", 10)
+    cache.add("mine", "cache/mine.png", 10)
+
+    assert store.cache_size() == 50
+    assert store.cache_get("o0") is None
@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+from database import SupabaseJobs
+from local_db import SQLiteJobs
+
+
+class FakeQuery:
+    """
+    Just enough of a postgrest query builder: every filter chains,
+    execute() returns the rows given up front
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return SimpleNamespace(data=self.rows)
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        return FakeQuery(self.rows)
+
+
+def test_get_unknown_job_is_none():
+    assert SupabaseJobs(FakeClient([])).get("missing") is None
+    assert SQLiteJobs().get("missing") is None
+
+
+def test_get_returns_the_row():
+    row = {"id": "a", "status": "queued"}
+    assert SupabaseJobs(FakeClient([row])).get("a") == row
@@ -0,0 +1,19 @@
+from detect import sniff_bytes
+
+
+def test_utf16_text_is_not_mpeg_audio():
+    # The UTF-16LE BOM (FF FE) passes the 11-bit MPEG frame sync
+    head = "name,value\r\n".encode("utf-16")
+    assert sniff_bytes(head, "csv") == ("text", "csv")
+    assert sniff_bytes("\ufeffhello".encode("utf-16-be"), "txt") == ("text", "txt")
+
+
+def test_reserved_mpeg_headers_are_rejected():
+    # Bitrate index 1111 / sample rate 11 are reserved: not a frame
+    assert sniff_bytes(b"\xff\xfb\xf0\x00" + b"\x00" * 60) is None
+    assert sniff_bytes(b"\xff\xfb\x9c\x00" + b"\x00" * 60) is None
+
+
+def test_mpeg_audio_frames():
+    assert sniff_bytes(b"\xff\xfb\x90\x64" + b"\x00" * 60) == ("audio", "mp3")
+    assert sniff_bytes(b"\xff\xf1\x50\x80" + b"\x00" * 60) == ("audio", "aac")
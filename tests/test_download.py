@@ -0,0 +1,13 @@
+from urllib.parse import parse_qs, urlsplit
+
+from database import attachment_url
+
+
+def test_signed_url_asks_for_attachment():
+    url = attachment_url(
+        "https://x.supabase.co/storage/v1/object/sign/mahaconvert-output/ab12.pdf?token=t",
+        "my report (1).pdf"
+    )
+    query = parse_qs(urlsplit(url).query)
+    assert query["token"] == ["t"]
+    assert query["download"] == ["my report (1).pdf"]
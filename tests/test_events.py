@@ -0,0 +1,25 @@
+from events import JobEvents
+
+
+def test_progress_only_update_does_not_start_an_entry():
+    events = JobEvents(ttl=60)
+    events.publish("a", {"progress": 40})
+
+    reads = []
+
+    def load(job_id):
+        reads.append(job_id)
+        return {"status": "Converting file", "progress": 40}
+
+    _, state = events.snapshot("a", load)
+    assert state == {"status": "Converting file", "progress": 40}
+    assert reads == ["a"]
+
+
+def test_progress_update_merges_into_known_job():
+    events = JobEvents(ttl=60)
+    events.publish("a", {"status": "queued", "progress": 0})
+    events.publish("a", {"progress": 30})
+
+    _, state = events.snapshot("a", lambda job_id: None)
+    assert state == {"status": "queued", "progress": 30}
@@ -0,0 +1,20 @@
+import threading
+
+import pytest
+
+import cancel
+
+pytest.importorskip("pypdf")
+import gs_pool  # noqa: E402
+
+
+def test_cancelled_job_stops_waiting_for_a_gs_slot(monkeypatch):
+    # Every slot busy
+    busy = threading.BoundedSemaphore(1)
+    busy.acquire()
+    monkeypatch.setattr(gs_pool, "_slots", busy)
+
+    token = cancel.CancelToken()
+    token.cancel()
+    with cancel.scope(token), pytest.raises(cancel.JobCancelled):
+        gs_pool._take_slot()
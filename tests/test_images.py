@@ -0,0 +1,62 @@
+import io
+import struct
+
+import pytest
+from PIL import Image
+
+from images import open_image, estimate_mb
+
+
+@pytest.fixture
+def big_jpeg(tmp_path):
+    # 2000x2000 RGB: ~11 MB decoded
+    path = tmp_path / "big.jpg"
+    Image.new("RGB", (2000, 2000), (10, 120, 200)).save(path, quality=80)
+    return str(path)
+
+
+@pytest.fixture
+def huge_jpeg(tmp_path):
+    # Small JPEG whose SOF0 header claims 20000x20000 (~1.1 GB decoded RGB)
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16)).save(buf, "JPEG")
+    data = bytearray(buf.getvalue())
+    sof = data.index(b"\xff\xc0")
+    data[sof + 5:sof + 9] = struct.pack(">HH", 20000, 20000)
+    path = tmp_path / "huge.jpg"
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_over_budget_is_refused_not_downscaled(big_jpeg):
+    with pytest.raises(ValueError, match="Image too large"):
+        open_image(big_jpeg, ("RGB",), budget_mb=4)
+
+
+def test_jpeg_decoded_at_full_size_in_requested_mode(big_jpeg):
+    img = open_image(big_jpeg, ("L",))
+    assert img.size == (2000, 2000)
+    assert img.mode == "L"
+
+
+def test_decompression_bomb_guard_stays_on(big_jpeg, monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    assert estimate_mb(big_jpeg) > 0
+    assert open_image(big_jpeg, ("RGB",)).size == (2000, 2000)
+    assert Image.MAX_IMAGE_PIXELS == 1000
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(big_jpeg)
+
+
+def test_huge_jpeg_fits_default_budget(huge_jpeg):
+    limit = Image.MAX_IMAGE_PIXELS
+    img = open_image(huge_jpeg, ("RGB",))
+    assert img.size == (20000, 20000)
+    assert img.mode == "RGB"
+    assert estimate_mb(huge_jpeg) > 1024
+    # Pillow's own guard is untouched for everyone else
+    assert Image.MAX_IMAGE_PIXELS == limit
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(huge_jpeg)
+    with pytest.raises(ValueError, match="Image too large"):
+        open_image(huge_jpeg, ("RGB",), budget_mb=1024)
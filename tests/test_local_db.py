@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+
+from local_db import SQLiteJobs, utc_iso
+
+
+def lease(seconds):
+    return utc_iso(datetime.now(timezone.utc) + timedelta(seconds=seconds))
+
+
+def new_job(store):
+    return store.insert({"filename": "a.jpg", "action": "compress", "status": "queued"})["id"]
+
+
+def test_claim_is_exclusive():
+    store = SQLiteJobs()
+    job_id = new_job(store)
+
+    claimed = store.claim(job_id, "w1", lease(60), {"status": "Starting"})
+    assert claimed["worker_id"] == "w1"
+    assert claimed["status"] == "Starting"
+    assert store.claim(job_id, "w2", lease(60), {"status": "Starting"}) is None
+
+
+def test_renew_only_by_owner():
+    store = SQLiteJobs()
+    job_id = new_job(store)
+    store.claim(job_id, "w1", lease(60), {"status": "Starting"})
+
+    assert store.renew(job_id, "w1", lease(120)) == {"id": job_id, "status": "Starting"}
+    assert store.renew(job_id, "w2", lease(120)) is None
+
+
+def test_reclaim_requeues_expired_leases_only():
+    store = SQLiteJobs()
+    expired, live, done = new_job(store), new_job(store), new_job(store)
+    store.claim(expired, "w1", lease(-1), {"status": "Converting file"})
+    store.claim(live, "w1", lease(60), {"status": "Converting file"})
+    store.claim(done, "w1", lease(-1), {"status": "Starting"})
+    store.update(done, {"status": "done"})
+
+    assert store.reclaim_expired(utc_iso()) == [expired]
+    row = store.get(expired)
+    assert (row["status"], row["worker_id"], row["lease_expires_at"]) == ("queued", None, None)
+    assert store.renew(expired, "w1", lease(60)) is None
+
+
+def test_stale_worker_cannot_write_after_reclaim():
+    store = SQLiteJobs()
+    job_id = new_job(store)
+    store.claim(job_id, "w1", lease(-1), {"status": "Starting"})
+    store.reclaim_expired(utc_iso())
+
+    # Requeued: the old owner's writes don't move it out of "queued"
+    assert not store.update(job_id, {"status": "Uploading result"}, "cancelled", "w1")
+    assert store.get(job_id)["status"] == "queued"
+
+    # Claimed by another worker: the old owner can't finish or fail its run
+    store.claim(job_id, "w2", lease(60), {"status": "Starting"})
+    assert not store.update(job_id, {"status": "error"}, "cancelled", "w1")
+    assert store.update(job_id, {"progress": 50}, "cancelled", "w2")
+    assert store.get(job_id)["status"] == "Starting"
+
+
+def test_running_write_never_overwrites_cancelled():
+    store = SQLiteJobs()
+    job_id = new_job(store)
+    store.claim(job_id, "w1", lease(60), {"status": "Starting"})
+    store.update(job_id, {"status": "cancelled"})
+
+    assert not store.update(job_id, {"status": "done"}, "cancelled", "w1")
+    assert store.get(job_id)["status"] == "cancelled"
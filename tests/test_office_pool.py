@@ -0,0 +1,19 @@
+import pytest
+
+import cancel
+from office_pool import OfficePool
+
+
+def test_cancelled_job_stops_waiting_for_an_instance():
+    # No instances: nothing ever frees up
+    pool = OfficePool(0, max_conversions=1, timeout=30)
+    token = cancel.CancelToken()
+    token.cancel()
+    with cancel.scope(token), pytest.raises(cancel.JobCancelled):
+        pool.convert("in.docx", "out.pdf")
+
+
+def test_timed_out_job_stops_waiting_for_an_instance():
+    pool = OfficePool(0, max_conversions=1, timeout=30)
+    with cancel.scope(cancel.CancelToken(timeout=0.3)), pytest.raises(cancel.JobTimeout):
+        pool.convert("in.docx", "out.pdf")
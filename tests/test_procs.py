@@ -0,0 +1,40 @@
+import os
+import time
+import multiprocessing
+
+import pytest
+
+from procs import ProcessPool, TaskKilled
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # Killed but not reaped yet counts as gone
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().split(")")[1].split()[0] != "Z"
+
+
+def test_cancel_kills_running_task():
+    pool = ProcessPool(1, multiprocessing.get_context("spawn"))
+    first = pool.submit(os.getpid).result(timeout=60)
+
+    hung = pool.submit(time.sleep, 600)
+    while not hung.running():
+        time.sleep(0.05)
+    assert hung.cancel()
+    with pytest.raises(TaskKilled):
+        hung.result(timeout=10)
+    assert not alive(first)
+
+    # The slot gets a fresh process
+    assert pool.submit(os.getpid).result(timeout=60) != first
+
+
+def test_task_errors_come_back():
+    pool = ProcessPool(1, multiprocessing.get_context("spawn"))
+    with pytest.raises(ZeroDivisionError):
+        pool.submit(divmod, 1, 0).result(timeout=60)
+    assert pool.submit(divmod, 7, 2).result(timeout=60) == (3, 1)
@@ -0,0 +1,66 @@
+import shutil
+import sys
+
+import pytest
+
+import progress
+from procs import run_command
+
+
+def track_writes():
+    writes = []
+    return writes, progress.track(writes.append, start=0, end=100)
+
+
+def test_run_command_reader_reports_progress():
+    # on_line runs in the reader thread: progress must still reach the job
+    script = "for i in range(1, 5): print(f'step={i}', flush=True)"
+
+    def on_line(line):
+        if line.startswith(b"step="):
+            progress.report(int(line[5:]) / 4)
+
+    writes, tracker = track_writes()
+    with tracker:
+        run_command([sys.executable, "-c", script], on_line=on_line)
+
+    assert writes
+    assert writes[-1] == 100
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+def test_ffmpeg_run_writes_progress(tmp_path):
+    import ffmpeg
+    from media import run_ffmpeg
+
+    out = tmp_path / "out.mp4"
+    stream = (
+        ffmpeg
+        .input("testsrc=duration=3:size=160x120:rate=10", f="lavfi")
+        .output(str(out), vcodec="mpeg4")
+        .overwrite_output()
+    )
+
+    writes, tracker = track_writes()
+    with tracker:
+        run_ffmpeg(stream, duration=3)
+
+    assert writes
+    assert writes[-1] > 0
+
+
+@pytest.mark.skipif(not shutil.which("gs"), reason="ghostscript not installed")
+def test_ghostscript_run_writes_progress(tmp_path):
+    from PIL import Image
+    from gs_pool import compress_pdf
+
+    pdf = tmp_path / "in.pdf"
+    pages = [Image.new("RGB", (1200, 1200), (i * 60, 0, 0)) for i in range(3)]
+    pages[0].save(pdf, "PDF", save_all=True, append_images=pages[1:])
+
+    writes, tracker = track_writes()
+    with tracker:
+        compress_pdf(str(pdf), str(tmp_path / "out.pdf"), 72, skip_check=False)
+
+    assert writes
+    assert writes[-1] > 0
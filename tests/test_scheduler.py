@@ -0,0 +1,19 @@
+from scheduler import job_kind
+
+
+def job(input_path, action="convert", **fields):
+    return {"id": "1", "action": action, "input_path": input_path, **fields}
+
+
+def test_job_kind_uses_sniffed_type():
+    # An MP4 named .jpg runs as a video job, not in the CPU pool
+    assert job_kind(job("a.jpg", input_kind="video", input_ext="mp4")) == "video"
+    assert job_kind(job("a.bin", input_kind="document", input_ext="docx")) == "office"
+    assert job_kind(job("a.docx", "compress", input_kind="document", input_ext="docx")) == "data"
+
+
+def test_job_kind_falls_back_to_name():
+    assert job_kind(job("a.jpg")) == "image"
+    assert job_kind(job("a.gif", "compress")) == "video"
+    assert job_kind(job("a.csv", to_format="pdf")) == "office"
+    assert job_kind(job("a.xyz")) == "data"
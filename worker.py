@@ -1,104 +1,477 @@
 import time
 import os
-from database import supabase, update_job, upload_output, download_file
+import json
+import socket
+import threading
+import uuid
+import shutil
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from database import (
+    update_job,
+    update_running_job,
+    upload_output,
+    copy_output,
+    upload_dict,
+    read_output_head,
+    download_file,
+    list_queued_jobs,
+    claim_job,
+    renew_lease,
+    reclaim_expired_leases,
+    job_statuses
+)
 from compressor import MahaCompressor
+from converter import MahaConvert
+import zstd_dicts
+import media
+import progress
+import cancel
+from cancel import CancelToken, JobCancelled
+from procs import ProcessPool
+from dispatch import get_dispatcher
+from cache import get_result_cache, cache_key, hash_file
+from scheduler import JobScheduler, job_kind, CPU_KINDS
+from config import (
+    WORKER_CONCURRENCY,
+    WORKER_CPU_PROCESSES,
+    WORKER_TYPE_LIMITS,
+    JOB_LEASE_SECONDS,
+    DISPATCH_POLL_SECONDS,
+    WORKER_MEMORY_MB,
+    JOB_TIMEOUTS,
+    CANCEL_POLL_SECONDS,
+    ZSTD_DICT_ENABLED
+)
 
-compressor = MahaCompressor("output")
+# Unique per process, so replicas on the same host don't share leases
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
 
+# Fields needed to route / claim a job; the claim returns the full row
+QUEUE_COLUMNS = "id, action, input_path, input_kind, input_ext, to_format, memory_mb"
 
-def run_worker():
-    print("Worker started…")
+_cpu_pool = None
 
-    while True:
-        # ambil job queued
-        jobs = (
-            supabase.table("jobs")
-            .select("*")
-            .eq("status", "queued")
-            .order("created_at")
-            .execute()
+# Jobs whose lease was taken over by another worker; their result is dropped
+_lost_leases = set()
+
+# Cancel tokens of the jobs running in this process
+_tokens = {}
+
+# zstd dictionaries already copied to storage
+_uploaded_dicts = set()
+
+# Queued jobs this worker knows about but hasn't started (encode policy input)
+_queue_depth = 0
+
+
+def get_cpu_pool():
+    """
+    Process pool for CPU-bound Python work (Pillow / pandas).
+    Uses spawn so children don't inherit the worker threads' locks.
+    Cancel / timeout kills the task's process (cancel.wait cancels its future).
+    """
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = ProcessPool(
+            max_workers=WORKER_CPU_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn")
         )
+    return _cpu_pool
 
-        for job in jobs.data:
-            job_id = job["id"]
-            action = job["action"]
-            input_path = job["input_path"]
-            target = job.get("target", 70)
-            to_format = job.get("to_format")
 
-            try:
-                # =========================
-                # START JOB
-                # =========================
-                update_job(job_id, status="Starting", progress=5)
-
-                # cek cancel awal
-                cur = supabase.table("jobs").select("status").eq("id", job_id).single().execute()
-                if cur.data["status"] == "cancelled":
-                    update_job(job_id, status="cancelled")
-                    continue
-                
-                # DOWNLOAD FROM SUPABASE IF NEEDED
-                # Assume input_path is now the filename in Supabase
-                local_input = os.path.join("uploads", input_path)
-                if not os.path.exists(local_input):
-                    update_job(job_id, status="Downloading file...", progress=10)
-                    download_file("mahaconvert-upload", input_path, local_input)
-
-                # =========================
-                # COMPRESS
-                # =========================
-                if action == "compress":
-                    update_job(job_id, status="Compressing file", progress=20)
-
-                    output = compressor.compress(
-                        local_input,
-                        target_percent=target
-                    )
-
-                # =========================
-                # CONVERT
-                # =========================
-                elif action == "convert":
-                    update_job(job_id, status="Converting file", progress=20)
-
-                    # auto-detect convert with optional target format
-                    output = compressor.mc.detect_and_convert(local_input, request_format=to_format)
-
-                else:
-                    update_job(job_id, status="error")
-                    continue
-                    
-                # CLEANUP INPUT
-                if os.path.exists(local_input):
-                    os.remove(local_input)
-
-                # =========================
-                # UPLOAD OUTPUT
-                # =========================
-                update_job(job_id, status="Uploading result", progress=85)
-                upload_output(job_id, output)
-                
-                # CLEANUP OUTPUT
-                if os.path.exists(output):
-                    os.remove(output)
-
-                update_job(job_id, status="done", progress=100)
+def job_dirs(job_id):
+    """
+    (input dir, output dir) of one job: nothing on disk is shared
+    between jobs, so cleanup can't pull files from under another one
+    """
+    return os.path.join("uploads", job_id), os.path.join("output", job_id)
 
-            except Exception as e:
-                update_job(
-                    job_id,
-                    status="error",
-                    progress=0
-                )
-                print(f"[ERROR] Job {job_id}: {e}")
 
-        # If no jobs found, wait longer to reduce DB load
-        if not jobs.data:
-            time.sleep(3)
+def convert(action, local_input, target, to_format, queue_depth=0, target_size=False,
+            output_dir="output"):
+    """
+    Run the actual compress / convert step, returns output path.
+    Module-level so it can run inside the process pool.
+    """
+    compressor = MahaCompressor(output_dir)
+    if action == "compress":
+        return compressor.compress(
+            local_input,
+            target_percent=target,
+            queue_depth=queue_depth,
+            target_size=target_size
+        )
+
+    # auto-detect convert with optional target format
+    return compressor.mc.detect_and_convert(
+        local_input,
+        request_format=to_format,
+        queue_depth=queue_depth
+    )
+
+
+def process_job(job, kind):
+    """
+    Run one claimed job under its cancel token: /cancel or the per-kind
+    hard timeout kills its subprocesses / pool task within
+    about a second, frees the slot and skips the upload.
+    """
+    job_id = job["id"]
+    token = CancelToken(JOB_TIMEOUTS.get(kind))
+    _tokens[job_id] = token
+
+    try:
+        with cancel.scope(token):
+            if job["action"] == "batch":
+                run_batch(job)
+            else:
+                run_job(job, kind)
+
+    except JobCancelled:
+        # Status is already "cancelled", or the job is someone else's now
+        print(f"Job {job_id} cancelled")
+
+    except Exception as e:
+        # A cancel that got in first stays "cancelled", a new owner's run is left alone
+        update_running_job(
+            job_id,
+            WORKER_ID,
+            status="error",
+            progress=0
+        )
+        print(f"[ERROR] Job {job_id}: {e}")
+
+    finally:
+        _tokens.pop(job_id, None)
+        _lost_leases.discard(job_id)
+
+
+def run_job(job, kind):
+    job_id = job["id"]
+    action = job["action"]
+    input_path = job["input_path"]
+    target = job.get("target", 70)
+    to_format = job.get("to_format")
+    # "size": output should really be target% smaller (bounded search)
+    target_size = job.get("mode") == "size"
+
+    result_cache = get_result_cache()
+    key = None
+    output = None
+    input_dir, output_dir = job_dirs(job_id)
+
+    try:
+        # Job was already moved to "Starting" by claim_job
+        if action not in ("compress", "convert"):
+            update_running_job(job_id, WORKER_ID, status="error")
+            return
+
+        # =========================
+        # RESULT CACHE (before download)
+        # =========================
+        input_hash = job.get("input_hash")
+        if result_cache.enabled and input_hash:
+            key = cache_key(input_hash, action, target, to_format, target_size)
+            if finish_from_cache(job_id, result_cache, key):
+                return
+
+        # DOWNLOAD FROM SUPABASE IF NEEDED
+        # Assume input_path is now the filename in Supabase
+        os.makedirs(input_dir, exist_ok=True)
+        local_input = os.path.join(input_dir, os.path.basename(input_path))
+        if not os.path.exists(local_input):
+            set_status(job_id, status="Downloading file...", progress=10)
+            download_file("mahaconvert-upload", input_path, local_input)
+
+        # Older jobs have no upload-time hash: hash the downloaded file
+        if result_cache.enabled and key is None:
+            key = cache_key(hash_file(local_input), action, target, to_format, target_size)
+            if finish_from_cache(job_id, result_cache, key):
+                return
+
+        if kind in ("video", "audio"):
+            load_media_info(job, local_input)
+
+        # =========================
+        # COMPRESS / CONVERT
+        # =========================
+        cancel.check()
+        if action == "compress":
+            set_status(job_id, status="Compressing file", progress=20)
         else:
-            # If jobs found, process them and then check again quickly
-            time.sleep(0.1)
+            set_status(job_id, status="Converting file", progress=20)
+
+        # ffmpeg / gs / page renders report progress (20 -> 85), throttled.
+        # Image / data jobs run in a pool process the tracker can't see:
+        # they only report the stage steps (20, then 85), no in-between.
+        with progress.track(progress_writer(job_id)):
+            if kind in CPU_KINDS:
+                # Cancel / timeout kills the pool process running it
+                output = cancel.wait(get_cpu_pool().submit(
+                    convert, action, local_input, target, to_format, 0, target_size, output_dir
+                ))
+            else:
+                # ffmpeg / gs / libreoffice: the subprocess does the work,
+                # this thread just waits on it (and kills it on cancel)
+                output = convert(
+                    action, local_input, target, to_format, _queue_depth, target_size, output_dir
+                )
+
+        # CLEANUP INPUT
+        shutil.rmtree(input_dir, ignore_errors=True)
+
+        # Another worker reclaimed this job while we were converting
+        if job_id in _lost_leases:
+            print(f"[WARN] Job {job_id}: lease lost, dropping result")
+            return
+
+        # =========================
+        # UPLOAD OUTPUT
+        # =========================
+        cancel.check()
+        set_status(job_id, status="Uploading result", progress=85)
+        if output.endswith(".zst"):
+            record_zstd_dict(job_id, zstd_dicts.frame_dict_id(output))
+
+        # The job keeps its own object: cache eviction never breaks its download
+        object_name = upload_output(job_id, output)
+        if key:
+            cached = copy_output(object_name, result_cache.object_name(key, output))
+            result_cache.add(key, cached, os.path.getsize(output))
+
+        set_status(job_id, output_path=object_name, status="done", progress=100)
+
+    finally:
+        # CLEANUP (also after errors / cancel)
+        for path in (input_dir, output_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def run_batch(job):
+    """
+    Many images -> one combined PDF / zip.
+    This thread downloads and assembles, the encodes fan out over the CPU pool.
+    """
+    job_id = job["id"]
+    keys = json.loads(job["inputs"])
+    input_dir, output_dir = job_dirs(job_id)
+    local_inputs = [os.path.join(input_dir, os.path.basename(key)) for key in keys]
+
+    try:
+        os.makedirs(input_dir, exist_ok=True)
+        set_status(job_id, status="Downloading file...", progress=10)
+
+        def fetch(key, local_input):
+            if not os.path.exists(local_input):
+                download_file("mahaconvert-upload", key, local_input)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(fetch, keys, local_inputs))
+
+        cancel.check()
+        set_status(job_id, status="Converting file", progress=20)
+        with progress.track(progress_writer(job_id)):
+            output = MahaConvert(output_dir).images_batch(
+                local_inputs,
+                to_format=job.get("to_format") or "pdf",
+                executor=get_cpu_pool()
+            )
+
+        if job_id in _lost_leases:
+            print(f"[WARN] Job {job_id}: lease lost, dropping result")
+            return
+
+        cancel.check()
+        set_status(job_id, status="Uploading result", progress=85)
+        object_name = upload_output(job_id, output)
+
+        set_status(job_id, output_path=object_name, status="done", progress=100)
+
+    finally:
+        for path in (input_dir, output_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def set_status(job_id, **fields):
+    """
+    Status / progress write for a running job. A cancel already in the
+    database (from any host) wins, and so does a lost lease (the job was
+    requeued / claimed by another worker): nothing is written, the job's
+    token is tripped and JobCancelled raised.
+    """
+    if not update_running_job(job_id, WORKER_ID, **fields):
+        cancel_running(job_id)
+        raise JobCancelled("Job cancelled or lease lost")
+
+
+def progress_writer(job_id):
+    def write(value):
+        # Throttled progress writes double as a cancel / lease check
+        if not update_running_job(job_id, WORKER_ID, progress=value):
+            cancel_running(job_id)
+    return write
+
+
+def watch_cancellations():
+    """
+    Fallback for cancels the dispatcher didn't deliver (no Redis, other
+    host): one status query for all running jobs every CANCEL_POLL_SECONDS
+    """
+    while True:
+        time.sleep(CANCEL_POLL_SECONDS)
+        job_ids = list(_tokens)
+        if not job_ids:
+            continue
+        try:
+            for job_id, status in job_statuses(job_ids).items():
+                if status == "cancelled":
+                    cancel_running(job_id)
+        except Exception as e:
+            print(f"[ERROR] Cancel check: {e}")
+
+
+def cancel_running(job_id):
+    token = _tokens.get(job_id)
+    if token is not None and not token.cancelled:
+        token.cancel()
+
+
+def load_media_info(job, local_input):
+    """
+    One ffprobe per input: saved on the job as media_info, and put in the
+    probe cache so routing and encoding below don't run ffprobe again
+    """
+    if job.get("media_info"):
+        media.remember(local_input, json.loads(job["media_info"]))
+        return
+
+    info = media.probe(local_input)
+    if info:
+        update_job(job["id"], media_info=json.dumps(info))
+
+
+def record_zstd_dict(job_id, dict_id):
+    """
+    Store the dictionary a .zst output was made with and note its id on the job
+    """
+    if not dict_id:
+        return
+    # Cache hits made elsewhere: the worker that trained it uploaded it
+    if dict_id not in _uploaded_dicts and os.path.exists(zstd_dicts.dict_path(dict_id)):
+        upload_dict(dict_id, zstd_dicts.dict_path(dict_id))
+        _uploaded_dicts.add(dict_id)
+    update_job(job_id, zstd_dict_id=dict_id)
+
+
+def finish_from_cache(job_id, result_cache, key):
+    """
+    Copy an already-stored output to the job's own object. True on cache hit.
+    """
+    object_name = result_cache.lookup(key)
+    if object_name is None:
+        return False
+
+    ext = os.path.splitext(object_name)[1]
+    try:
+        output_path = copy_output(object_name, f"{job_id}{ext}")
+    except Exception as e:
+        # Evicted between lookup and copy: convert as usual
+        print(f"[WARN] Job {job_id}: cached output unavailable: {e}")
+        return False
+
+    # A cached .zst may need a dictionary: the header says which
+    if ZSTD_DICT_ENABLED and ext == ".zst":
+        try:
+            header = read_output_head(output_path, zstd_dicts.FRAME_HEADER_SIZE)
+            record_zstd_dict(job_id, zstd_dicts.header_dict_id(header))
+        except Exception as e:
+            print(f"[WARN] Job {job_id}: zstd dictionary id unknown: {e}")
+
+    set_status(job_id, output_path=output_path, status="done", progress=100)
+    return True
+
+
+def keep_leases(scheduler):
+    """
+    Renew leases of running jobs, and requeue jobs of dead workers
+    """
+    interval = max(1, JOB_LEASE_SECONDS // 3)
+    while True:
+        time.sleep(interval)
+        for job_id in scheduler.active_ids():
+            try:
+                lease = renew_lease(job_id, WORKER_ID, JOB_LEASE_SECONDS)
+                if lease is None:
+                    # Requeued / taken over: stop working on it
+                    _lost_leases.add(job_id)
+                    cancel_running(job_id)
+                elif lease["status"] == "cancelled":
+                    cancel_running(job_id)
+            except Exception as e:
+                print(f"[ERROR] Lease renew {job_id}: {e}")
+
+        try:
+            reclaimed = reclaim_expired_leases()
+            if reclaimed:
+                print(f"Requeued {len(reclaimed)} expired job(s)")
+        except Exception as e:
+            print(f"[ERROR] Lease reclaim: {e}")
+
+
+def run_worker():
+    global _queue_depth
+    print(f"Worker {WORKER_ID} started…")
+
+    dispatcher = get_dispatcher()
+    scheduler = JobScheduler(
+        process_job,
+        concurrency=WORKER_CONCURRENCY,
+        type_limits=WORKER_TYPE_LIMITS,
+        memory_limit_mb=WORKER_MEMORY_MB,
+        on_finish=dispatcher.notify  # freed slot -> look at backlog again
+    )
+
+    threading.Thread(target=keep_leases, args=(scheduler,), daemon=True).start()
+
+    # /cancel pushes through the dispatcher; the status poll catches the rest
+    dispatcher.on_cancel(cancel_running)
+    threading.Thread(target=watch_cancellations, daemon=True).start()
+
+    # Known queued jobs that couldn't start yet (all slots / type limit busy)
+    backlog = {}
+    next_poll = 0
+
+    while True:
+        # Fallback poll: catches missed pushes and requeued jobs
+        if time.monotonic() >= next_poll:
+            for job in list_queued_jobs(columns=QUEUE_COLUMNS):
+                backlog.setdefault(job["id"], job)
+            next_poll = time.monotonic() + DISPATCH_POLL_SECONDS
+
+        for job_id, job in list(backlog.items()):
+            if scheduler.free_slots() == 0:
+                break
+
+            # Jobs blocked by their type / memory limit stay in the backlog,
+            # later jobs can still start
+            kind = job_kind(job)
+            if not scheduler.has_capacity(kind, job.get("memory_mb") or 0):
+                continue
+
+            # Compare-and-set: only one worker replica wins the job,
+            # losers (or cancelled jobs) just drop it
+            del backlog[job_id]
+            claimed = claim_job(job_id, WORKER_ID, JOB_LEASE_SECONDS)
+            if claimed:
+                scheduler.try_submit(claimed, kind)
+
+        _queue_depth = len(backlog)
+
+        # Sleep until app.upload pushes a job or a running job finishes
+        pushed = dispatcher.wait(timeout=max(0, next_poll - time.monotonic()))
+        for job in pushed:
+            backlog.setdefault(job["id"], job)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+import os
+import hashlib
+import threading
+import zstandard as zstd
+from config import (
+    ZSTD_DICT_DIR,
+    ZSTD_DICT_SIZE,
+    ZSTD_DICT_MIN_SAMPLES,
+    ZSTD_DICT_MAX_SAMPLES,
+    ZSTD_DICT_RETRAIN_EVERY
+)
+
+# Layout under ZSTD_DICT_DIR:
+#   samples/<ext>/<sha1>.bin   training inputs (capped per type)
+#   dicts/<dict_id>.dict       every dictionary ever trained (kept for decoding)
+#   current/<ext>              dict_id in use for that file type
+#   current/<ext>.added        samples added since the last training
+
+_dicts = {}                 # dict_id -> ZstdCompressionDict
+_dicts_lock = threading.Lock()
+_local = threading.local()  # per-thread compressor contexts
+_training = set()
+_training_lock = threading.Lock()
+
+
+def _path(*parts):
+    return os.path.join(ZSTD_DICT_DIR, *parts)
+
+
+def _read(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def _write(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(value))
+    os.replace(tmp, path)
+
+
+# ==================================================
+# DICTIONARIES
+# ==================================================
+def dict_path(dict_id):
+    return _path("dicts", f"{dict_id}.dict")
+
+
+def current_dict_id(ext):
+    value = _read(_path("current", ext))
+    return int(value) if value else 0
+
+
+def load_dict(dict_id):
+    with _dicts_lock:
+        if dict_id not in _dicts:
+            with open(dict_path(dict_id), "rb") as f:
+                _dicts[dict_id] = zstd.ZstdCompressionDict(f.read())
+        return _dicts[dict_id]
+
+
+def compressor(ext, level):
+    """
+    Reused ZstdCompressor for (type, level, current dictionary).
+    Contexts aren't thread-safe, so each thread keeps its own.
+    """
+    dict_id = current_dict_id(ext)
+    key = (level, dict_id)
+    cache = getattr(_local, "ctx", None)
+    if cache is None:
+        cache = _local.ctx = {}
+
+    if key not in cache:
+        if dict_id:
+            cache[key] = zstd.ZstdCompressor(level=level, dict_data=load_dict(dict_id))
+        else:
+            cache[key] = zstd.ZstdCompressor(level=level)
+    return cache[key]
+
+
+# Longest possible zstd frame header
+FRAME_HEADER_SIZE = 18
+
+
+def header_dict_id(header):
+    """
+    Dictionary id stored in a .zst frame header (0 = no dictionary)
+    """
+    try:
+        return zstd.get_frame_parameters(header).dict_id
+    except zstd.ZstdError:
+        return 0
+
+
+def frame_dict_id(path):
+    with open(path, "rb") as f:
+        return header_dict_id(f.read(FRAME_HEADER_SIZE))
+
+
+# ==================================================
+# SAMPLES + TRAINING
+# ==================================================
+def add_sample(ext, data):
+    """
+    Keep `data` as a training sample for this file type, and retrain
+    in the background once enough new samples have arrived
+    """
+    sample_dir = _path("samples", ext)
+    os.makedirs(sample_dir, exist_ok=True)
+    name = hashlib.sha1(data).hexdigest() + ".bin"
+    sample = os.path.join(sample_dir, name)
+    if os.path.exists(sample):
+        return
+
+    with open(sample, "wb") as f:
+        f.write(data)
+
+    added_path = _path("current", f"{ext}.added")
+    added = int(_read(added_path, "0")) + 1
+    _write(added_path, added)
+
+    needs_first = not current_dict_id(ext) and added >= ZSTD_DICT_MIN_SAMPLES
+    if needs_first or added >= ZSTD_DICT_RETRAIN_EVERY:
+        with _training_lock:
+            if ext in _training:
+                return
+            _training.add(ext)
+        threading.Thread(target=_train_safe, args=(ext,), daemon=True).start()
+
+
+def _train_safe(ext):
+    try:
+        train(ext)
+    except Exception as e:
+        print(f"[WARN] zstd dictionary training for {ext} failed: {e}")
+    finally:
+        with _training_lock:
+            _training.discard(ext)
+
+
+def train(ext):
+    """
+    Train a new dictionary from the newest samples and make it current.
+    Old dictionaries stay on disk: outputs made with them must stay decodable.
+    """
+    sample_dir = _path("samples", ext)
+    files = sorted(
+        (os.path.join(sample_dir, f) for f in os.listdir(sample_dir)),
+        key=os.path.getmtime,
+        reverse=True
+    )
+
+    # Cap samples: drop the oldest
+    for old in files[ZSTD_DICT_MAX_SAMPLES:]:
+        os.remove(old)
+    files = files[:ZSTD_DICT_MAX_SAMPLES]
+
+    if len(files) < ZSTD_DICT_MIN_SAMPLES:
+        return None
+
+    samples = []
+    for path in files:
+        with open(path, "rb") as f:
+            samples.append(f.read())
+
+    trained = zstd.train_dictionary(ZSTD_DICT_SIZE, samples)
+    dict_id = trained.dict_id()
+
+    os.makedirs(_path("dicts"), exist_ok=True)
+    with open(dict_path(dict_id), "wb") as f:
+        f.write(trained.as_bytes())
+
+    _write(_path("current", ext), dict_id)
+    _write(_path("current", f"{ext}.added"), 0)
+    print(f"[INFO] zstd dictionary {dict_id} trained for .{ext} ({len(samples)} samples)")
+    return dict_id